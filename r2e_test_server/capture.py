@@ -0,0 +1,105 @@
+import sys
+from threading import Lock
+from contextvars import ContextVar
+from typing import List, Optional, TextIO
+
+
+_stdout_target: ContextVar[Optional[TextIO]] = ContextVar("stdout_target", default=None)
+_stderr_target: ContextVar[Optional[TextIO]] = ContextVar("stderr_target", default=None)
+# the buffers of the active captures, for the threads that have no target
+_stdout_active: List[TextIO] = []
+_stderr_active: List[TextIO] = []
+_install_lock = Lock()
+
+
+class RoutedStream:
+    """A stand-in for `sys.stdout`/`sys.stderr` that routes writes per context.
+
+    Writes go to the buffer captured by the calling thread (or context). New
+    threads do not inherit the context, their writes go to the latest active
+    capture (e.g., threads started by the tests of a session), and to the
+    original stream when nothing is captured.
+
+    Args:
+        target (ContextVar): context variable holding the capture buffer.
+        fallback (TextIO): the original stream.
+        active (List[TextIO]): the buffers of the active captures.
+    """
+
+    def __init__(self, target: ContextVar, fallback: TextIO, active: List[TextIO]):
+        self.target = target
+        self.fallback = fallback
+        self.active = active
+
+    def get_stream(self) -> TextIO:
+        stream = self.target.get()
+        if stream is None and self.active:
+            try:
+                stream = self.active[-1]
+            except IndexError:
+                # the capture just ended
+                pass
+        return self.fallback if stream is None else stream
+
+    def write(self, s: str) -> int:
+        return self.get_stream().write(s)
+
+    def writelines(self, lines):
+        self.get_stream().writelines(lines)
+
+    def flush(self):
+        self.get_stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.get_stream(), name)
+
+
+def install_routed_streams():
+    """Replace `sys.stdout` and `sys.stderr` by routed streams (idempotent)."""
+    with _install_lock:
+        if not isinstance(sys.stdout, RoutedStream):
+            sys.stdout = RoutedStream(_stdout_target, sys.stdout, _stdout_active)
+        if not isinstance(sys.stderr, RoutedStream):
+            sys.stderr = RoutedStream(_stderr_target, sys.stderr, _stderr_active)
+
+
+class CaptureOutput:
+    """Capture the stdout and stderr of the current thread (or context).
+
+    Unlike swapping `sys.stdout`, this is safe when several threads capture
+    their output at the same time. The output of threads that capture nothing
+    goes to the latest capture.
+    """
+
+    def __init__(self, stdout=None, stderr=None):
+        self._stdout = stdout
+        self._stderr = stderr
+
+    def __enter__(self):
+        install_routed_streams()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.stdout_token = _stdout_target.set(self._stdout or _stdout_target.get())
+        self.stderr_token = _stderr_target.set(self._stderr or _stderr_target.get())
+        with _install_lock:
+            if self._stdout is not None:
+                _stdout_active.append(self._stdout)
+            if self._stderr is not None:
+                _stderr_active.append(self._stderr)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _stdout_target.reset(self.stdout_token)
+        _stderr_target.reset(self.stderr_token)
+        with _install_lock:
+            # by identity, the captures of threads do not end in order
+            _remove(_stdout_active, self._stdout)
+            _remove(_stderr_active, self._stderr)
+
+
+def _remove(active: List[TextIO], stream: Optional[TextIO]):
+    for idx in range(len(active) - 1, -1, -1):
+        if active[idx] is stream:
+            del active[idx]
+            return
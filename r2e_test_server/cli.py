@@ -1,6 +1,7 @@
 import typer
 import rpyc
 import json
+from typing import List, Optional
 from r2e_test_server.server import R2EService
 from r2e_test_server.server import start_server
 
@@ -10,13 +11,43 @@ app = typer.Typer(name="r2e-test-server")
 
 @app.command()
 def start(
-    port: int = typer.Option(3006, help="Port number to start the R2E server on.")
+    port: int = typer.Option(3006, help="Port number to start the R2E server on."),
+    workers: int = typer.Option(
+        0, help="Number of worker processes to run sessions in (0: in-process)."
+    ),
+    preload: List[str] = typer.Option(
+        [], help="Module to import before forking the workers (repeatable)."
+    ),
+    module_cache_size: int = typer.Option(
+        0, help="Number of executed FUT modules to cache across sessions (0: off)."
+    ),
+    module_cache_mb: int = typer.Option(
+        512, help="Approximate memory cap (in MB) of the FUT module cache."
+    ),
+    result_cache_size: int = typer.Option(
+        0, help="Number of submit results to cache in memory (0: off)."
+    ),
+    result_cache_db: Optional[str] = typer.Option(
+        None, help="SQLite database to persist the submit results cache in."
+    ),
+    metrics_port: Optional[int] = typer.Option(
+        None, help="Local port to serve Prometheus metrics on (default: off)."
+    ),
 ):
     """
     Starts the R2E server on the specified port.
     """
     typer.echo(f"Starting R2E server on port {port}...")
-    start_server(port)
+    start_server(
+        port,
+        num_workers=workers,
+        preload=preload,
+        module_cache_size=module_cache_size,
+        module_cache_mb=module_cache_mb,
+        result_cache_size=result_cache_size,
+        result_cache_db=result_cache_db,
+        metrics_port=metrics_port,
+    )
 
 
 @app.command()
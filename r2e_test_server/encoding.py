@@ -0,0 +1,152 @@
+import json
+import zlib
+import lzma
+import uuid
+import textwrap
+from typing import Any, Dict, Iterable, Optional, Union
+
+
+RESULT_FORMATS = ("json", "compact", "msgpack")
+RESULT_COMPRESSIONS = (None, "zlib", "lzma", "zstd")
+
+
+class JSONLines:
+    """A list given as the JSON lines of its items (e.g., read from a file).
+
+    In the (top-level) values of a result, `R2EResultEncoder` encodes the
+    items one at a time, the list is never loaded as a whole.
+
+    Args:
+        lines (Iterable[str]): the JSON lines, iterated once.
+        length (int): the number of lines.
+    """
+
+    def __init__(self, lines: Iterable[str], length: int):
+        self.lines = lines
+        self.length = length
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        return (json.loads(line) for line in self.lines)
+
+
+class R2EResultEncoder:
+    """Encoding of the submit results sent to the client.
+
+    Args:
+        format (str): "json" (indented, the default), "compact" (json without
+            whitespace) or "msgpack" (requires the msgpack package).
+        compression (str): None, "zlib", "lzma" or "zstd" (python 3.14+).
+
+    Note: the results are strings for uncompressed json, bytes otherwise;
+    clients can use `decode` with the same encoding. `JSONLines` values are
+    encoded as lists.
+    """
+
+    def __init__(self, format: str = "json", compression: Optional[str] = None):
+        if format not in RESULT_FORMATS:
+            raise ValueError(f"Unknown result format: {format}")
+        if compression not in RESULT_COMPRESSIONS:
+            raise ValueError(f"Unknown result compression: {compression}")
+
+        # fail at setup, not at the first submit
+        if format == "msgpack":
+            _import_msgpack()
+        if compression == "zstd":
+            _import_zstd()
+
+        self.format = format
+        self.compression = compression
+
+    def encode(self, result: Any) -> Union[str, bytes]:
+        # the JSONLines are replaced by placeholders, then spliced in
+        streamed: Dict[str, JSONLines] = {}
+        if isinstance(result, dict):
+            result = dict(result)
+            for key, value in result.items():
+                if isinstance(value, JSONLines):
+                    placeholder = f"<r2e-json-lines:{uuid.uuid4().hex}>"
+                    streamed[placeholder] = value
+                    result[key] = placeholder
+
+        if self.format == "json":
+            data: Union[str, bytes] = json.dumps(result, indent=4)
+        elif self.format == "compact":
+            data = json.dumps(result, separators=(",", ":"))
+        else:
+            data = _import_msgpack().packb(result)
+
+        for placeholder, lines in streamed.items():
+            data = self.splice(data, placeholder, lines)
+
+        if self.compression is None:
+            return data
+
+        if isinstance(data, str):
+            data = data.encode()
+        if self.compression == "zlib":
+            return zlib.compress(data)
+        if self.compression == "lzma":
+            return lzma.compress(data)
+        return _import_zstd().compress(data)
+
+    def splice(
+        self, data: Union[str, bytes], placeholder: str, lines: JSONLines
+    ) -> Union[str, bytes]:
+        """Replace the placeholder of `lines` in `data` by the encoded list."""
+        if isinstance(data, bytes):
+            msgpack = _import_msgpack()
+            marker = msgpack.packb(placeholder)
+            packer = msgpack.Packer()
+            value = packer.pack_array_header(len(lines)) + b"".join(
+                packer.pack(item) for item in lines
+            )
+            start = data.index(marker)
+            return data[:start] + value + data[start + len(marker) :]
+
+        marker = json.dumps(placeholder)
+        start = data.index(marker)
+        if self.format == "compact":
+            items = [json.dumps(item, separators=(",", ":")) for item in lines]
+            value = "[" + ",".join(items) + "]"
+        else:
+            # indented as json.dumps would: one level deeper than the key's line
+            line_start = data.rfind("\n", 0, start) + 1
+            line = data[line_start:start]
+            indent = " " * (len(line) - len(line.lstrip(" ")))
+            items = [
+                textwrap.indent(json.dumps(item, indent=4), indent + " " * 4)
+                for item in lines
+            ]
+            value = "[\n" + ",\n".join(items) + f"\n{indent}]" if items else "[]"
+        return data[:start] + value + data[start + len(marker) :]
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if self.compression == "zlib":
+            data = zlib.decompress(data)  # type: ignore
+        elif self.compression == "lzma":
+            data = lzma.decompress(data)  # type: ignore
+        elif self.compression == "zstd":
+            data = _import_zstd().decompress(data)
+
+        if self.format == "msgpack":
+            return _import_msgpack().unpackb(data)
+        return json.loads(data)
+
+
+def _import_msgpack():
+    try:
+        import msgpack  # type: ignore
+    except ImportError:
+        raise ValueError("The msgpack result format requires the msgpack package")
+    return msgpack
+
+
+def _import_zstd():
+    try:
+        from compression import zstd  # type: ignore
+    except ImportError:
+        raise ValueError("The zstd result compression requires python 3.14+")
+    return zstd
@@ -1,65 +1,218 @@
+import sys
 import json
+import random
 import inspect
 import datetime
-from typing import Any
+import functools
+import itertools
+from typing import Any, Callable, Optional, Tuple
 from decimal import Decimal
 from collections.abc import Iterable
 from typing import List, Dict
 
+from r2e_test_server.encoding import JSONLines
 from r2e_test_server.instrument.base import Instrumenter
+from r2e_test_server.instrument.store import CaptureLogStore
+
+
+# off: no capture, first: the first `limit` calls of each function,
+# sample: a uniform sample of `limit` calls of each function, all: every call
+CAPTURE_MODES = ("off", "first", "sample", "all")
+
+# the modules defining the types handled by each serializer, the serializer
+# is only tried for (subclasses of) types from these modules, and only once
+# the first module is imported: we never import a framework to serialize
+SERIALIZER_MODULES = {
+    "serialize_datetime": ("datetime",),
+    "serialize_decimal": ("decimal",),
+    "serialize_function": ("builtins",),
+    "serialize_jax": ("jax", "jaxlib"),
+    "serialize_jaxlib": ("jaxlib",),
+    "serialize_networkx": ("networkx",),
+    "serialize_numpy": ("numpy",),
+    "serialize_pandas": ("pandas",),
+    "serialize_tensorflow": ("tensorflow",),
+    "serialize_torch": ("torch",),
+}
 
 
 class CaptureArgsInstrumenter(Instrumenter):
-    def __init__(self):
+    """Capture the arguments and outputs of the calls to the instrumented functions.
+
+    Whether a call is captured is decided before binding or serializing its
+    arguments, so the calls that are not captured cost (almost) nothing.
+    Captured calls are serialized right away, no references to the
+    arguments or outputs are kept (see CaptureLogStore).
+
+    Args:
+        mode (str): one of CAPTURE_MODES.
+        limit (int): number of captured calls per function, for "first" and "sample".
+        seed (int): seed of the (reservoir) sampling.
+        max_bytes (int): memory budget of the captured calls, beyond which
+            they are spilled to a temporary file.
+        max_entries (int): maximum number of captured calls, the others are dropped.
+
+    Note: in forked processes (see R2EParallelRunner) the limit applies to
+    the calls in each process.
+    """
+
+    def __init__(
+        self,
+        mode: str = "all",
+        limit: int = 10,
+        seed: Optional[int] = 0,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 100_000,
+    ):
         super().__init__()
-        self.args_with_names = {}
-        self.serialized_args_with_names = {}
-        self.captured_args_list = []
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode: {mode}")
+        self.mode = mode
+        self.limit = limit
+        self.random = random.Random(seed)
+
+        self.num_calls = 0
+        self.call_counts: Dict[Any, int] = {}
+        self.signatures: Dict[Any, inspect.Signature] = {}
+        # (slot, call number, captured args without the output, caller info)
+        # of the calls in progress, None for the calls not captured
+        self.call_stack: List[Optional[Tuple[int, int, Dict[str, Any], Any]]] = []
+
+        self.store = CaptureLogStore(
+            max_bytes, max_entries, default=Serializers.serialize_default
+        )
+        # sampled calls of each function, as (call number, captured args)
+        self.samples: Dict[Any, List[Tuple[int, Dict[str, Any]]]] = {}
 
     def before_call(self, func, *args, **kwargs):
-        bound_arguments = inspect.signature(func).bind(*args, **kwargs)
+        call_number = self.num_calls
+        self.num_calls += 1
+        count = self.call_counts.get(func, 0)
+        self.call_counts[func] = count + 1
+
+        slot = self.get_capture_slot(count)
+        if slot is None:
+            self.call_stack.append(None)
+            return
+
+        signature = self.signatures.get(func)
+        if signature is None:
+            signature = self.signatures[func] = inspect.signature(func)
+
+        bound_arguments = signature.bind(*args, **kwargs)
         bound_arguments.apply_defaults()
 
-        self.args_with_names = bound_arguments.arguments
-        self.serialized_args_with_names = {
-            k: self.serialize(v) for k, v in self.args_with_names.items()
+        args_with_names = bound_arguments.arguments
+        captured_args = {
+            "func_name": func.__name__,
+            "inputs": {
+                k: Serializers.serialize_default(v) for k, v in args_with_names.items()
+            },
+            "serialized_inputs": {
+                k: self.serialize(v) for k, v in args_with_names.items()
+            },
+            "input_types": {
+                k: f"{type(v).__module__}.{type(v).__qualname__}"
+                for k, v in args_with_names.items()
+            },
         }
+        self.call_stack.append((slot, call_number, captured_args, self.caller_info()))
 
     def after_call(self, func, *args, **kwargs):
+        call = self.call_stack.pop()
+        if call is None:
+            return
+        slot, call_number, captured_args, caller = call
+
         output = self.output
-        serialized_output = self.serialize(output)
-
-        self.captured_args_list.append(
-            {
-                "func_name": func.__name__,
-                "inputs": self.args_with_names,
-                "serialized_inputs": self.serialized_args_with_names,
-                "input_types": {
-                    k: f"{type(v).__module__}.{type(v).__qualname__}"
-                    for k, v in self.args_with_names.items()
-                },
-                "output": output,
-                "serialized_output": serialized_output,
-                "output_type": f"{type(output).__module__}.{type(output).__qualname__}",
-                "caller_info": self.caller_info(),
-            }
+        captured_args["output"] = Serializers.serialize_default(output)
+        captured_args["serialized_output"] = self.serialize(output)
+        captured_args["output_type"] = (
+            f"{type(output).__module__}.{type(output).__qualname__}"
         )
+        captured_args["caller_info"] = caller
+
+        if self.mode != "sample":
+            self.store.append(captured_args)
+            return
+
+        samples = self.samples.setdefault(func, [])
+        if slot < len(samples):
+            samples[slot] = (call_number, captured_args)
+        else:
+            samples.append((call_number, captured_args))
+
+    def abort_call(self, func, *args, **kwargs):
+        self.call_stack.pop()
+
+    def get_capture_slot(self, count: int) -> Optional[int]:
+        """Decide if the `count`-th call of a function is captured.
+
+        Returns:
+            Optional[int]: where to keep the call (its index among the captured
+                calls of the function), None if it is not captured.
+        """
+        if self.mode == "all":
+            return count
+        if self.mode == "off":
+            return None
+        if count < self.limit:
+            return count
+        if self.mode == "sample":
+            # reservoir sampling (algorithm R)
+            slot = self.random.randint(0, count)
+            return slot if slot < self.limit else None
+        return None
 
     def get_logs(self) -> List[Dict[str, Any]]:
-        logs = []
-        for captured_args in self.captured_args_list:
+        """The captured calls, all loaded in memory (up to `max_entries` calls).
 
-            # FIXME: isn't this the same as serialize_inputs and serialize_output?
-            captured_args["inputs"] = {
-                k: Serializers.serialize_default(v)
-                for k, v in captured_args["inputs"].items()
-            }
-            captured_args["output"] = Serializers.serialize_default(
-                captured_args["output"]
+        Use `get_log_lines` to encode them without loading them.
+        """
+        logs = self.get_sampled_logs()
+        logs.extend(self.store)
+        self.warn_dropped()
+        return logs
+
+    def get_log_lines(self) -> JSONLines:
+        """The captured calls as JSON lines, read from the store as they are encoded.
+
+        Only the encoded result is held in memory (up to `max_entries` calls),
+        the store must not be closed before it is encoded.
+        """
+        samples = [
+            json.dumps(captured_args, default=Serializers.serialize_default)
+            for captured_args in self.get_sampled_logs()
+        ]
+        self.warn_dropped()
+        return JSONLines(
+            itertools.chain(samples, self.store.iter_lines()),
+            len(samples) + len(self.store),
+        )
+
+    def get_sampled_logs(self) -> List[Dict[str, Any]]:
+        """The sampled calls, in the order of the calls."""
+        samples = [sample for samples in self.samples.values() for sample in samples]
+        samples.sort(key=lambda sample: sample[0])
+        return [captured_args for _, captured_args in samples]
+
+    def warn_dropped(self):
+        if self.store.num_dropped > 0:
+            print(
+                f"[WARNING] Captured {len(self.store)} calls, "
+                f"dropped {self.store.num_dropped} beyond the limit."
             )
 
-            logs.append(captured_args)
-        return logs
+    def add_logs(self, logs: List[Dict[str, Any]]):
+        """Add logs captured elsewhere (e.g., by a copy of this instrumenter in
+        a forked process), as returned by `get_logs`."""
+        for captured_args in logs:
+            self.store.append(captured_args)
+
+    def close(self):
+        """Release the captured calls (and their temporary file, if any)."""
+        self.store.close()
+        self.samples.clear()
 
     def dump_logs(self, file_path: str):
         logs = self.get_logs()
@@ -71,15 +224,7 @@ class CaptureArgsInstrumenter(Instrumenter):
 
     def serialize(self, obj: Any) -> Any:
 
-        # get all the handlers from the Serializer class
-        handlers = [
-            getattr(Serializers, method_name)
-            for method_name in dir(Serializers)
-            if method_name.startswith("serialize_")
-            and not method_name == "serialize_default"
-        ]
-
-        for handler in handlers:
+        for handler in Serializers.get_handlers(type(obj)):
             serialized_obj = handler(obj)
             if serialized_obj is not None:
                 return serialized_obj
@@ -94,6 +239,36 @@ class CaptureArgsInstrumenter(Instrumenter):
 
 class Serializers:
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def get_handlers(obj_type: type) -> Tuple[Callable[[Any], Any], ...]:
+        """Get the serializers (but the default one) that may handle a type.
+
+        Note: cached per type, a framework imported after a type was first
+        serialized is not probed for that type.
+        """
+        type_modules = {
+            cls.__module__.split(".")[0]
+            for cls in getattr(obj_type, "__mro__", ())
+            if cls is not object
+        }
+
+        handlers = []
+        for method_name in dir(Serializers):
+            if not method_name.startswith("serialize_"):
+                continue
+            if method_name == "serialize_default":
+                continue
+
+            modules = SERIALIZER_MODULES.get(method_name)
+            if modules is not None and (
+                modules[0] not in sys.modules or not type_modules.intersection(modules)
+            ):
+                continue
+            handlers.append(getattr(Serializers, method_name))
+
+        return tuple(handlers)
+
     @staticmethod
     def serialize_default(obj):
         if isinstance(obj, (datetime.datetime, datetime.date)):
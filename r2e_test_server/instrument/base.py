@@ -20,7 +20,11 @@ class Instrumenter:
                 self.previous_frame = self.current_frame.f_back
 
             self.before_call(func, *args, **kwargs)
-            self.output = func(*args, **kwargs)
+            try:
+                self.output = func(*args, **kwargs)
+            except BaseException:
+                self.abort_call(func, *args, **kwargs)
+                raise
             self.after_call(func, *args, **kwargs)
             return self.output
 
@@ -40,8 +44,11 @@ class Instrumenter:
         if self.previous_frame is None:
             return None
 
-        caller_info = inspect.getframeinfo(self.previous_frame)
-        caller_info = {"func_name": caller_info[2], "lineno": caller_info[1]}
+        # NOTE: not inspect.getframeinfo, which reads the source lines
+        caller_info = {
+            "func_name": self.previous_frame.f_code.co_name,
+            "lineno": self.previous_frame.f_lineno,
+        }
         return caller_info
 
     def before_call(self, func, *args, **kwargs):
@@ -52,6 +59,10 @@ class Instrumenter:
         """Hook method for doing something after the original function call."""
         pass
 
+    def abort_call(self, func, *args, **kwargs):
+        """Hook method for doing something when the original function call raises."""
+        pass
+
     def dump_logs(self, file_path: str):
         """Dump the collected information, if any, to a file."""
         pass
@@ -0,0 +1,87 @@
+import json
+import tempfile
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional
+
+
+class CaptureLogStore:
+    """Append-only store of captured calls, serialized as JSON lines.
+
+    Entries are serialized when added, so the store never holds references
+    to the captured objects. The lines are kept in memory up to `max_bytes`,
+    after which they (and any further lines) go to a temporary JSONL file.
+    Entries beyond `max_entries` are dropped (and counted).
+
+    Args:
+        max_bytes (int): memory budget for the serialized entries.
+        max_entries (int): maximum number of entries.
+        default (Callable): serializer for the objects json cannot serialize.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 100_000,
+        default: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.default = default
+
+        self.lines: List[str] = []
+        self.num_bytes = 0
+        self.num_entries = 0
+        self.num_dropped = 0
+        self.spill_file: Optional[IO[str]] = None
+
+    def __len__(self) -> int:
+        return self.num_entries
+
+    def append(self, entry: Dict[str, Any]) -> bool:
+        """Add an entry, returns False if it was dropped."""
+        if self.num_entries >= self.max_entries:
+            self.num_dropped += 1
+            return False
+
+        line = json.dumps(entry, default=self.default)
+        self.num_entries += 1
+
+        if self.spill_file is None and self.num_bytes + len(line) > self.max_bytes:
+            self.spill()
+
+        if self.spill_file is not None:
+            self.spill_file.write(line + "\n")
+        else:
+            self.lines.append(line)
+            self.num_bytes += len(line)
+        return True
+
+    def spill(self):
+        """Move the lines to a temporary file."""
+        self.spill_file = tempfile.TemporaryFile(
+            "w+", prefix="r2e_captured_args_", suffix=".jsonl"
+        )
+        for line in self.lines:
+            self.spill_file.write(line + "\n")
+        self.lines = []
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for line in self.iter_lines():
+            yield json.loads(line)
+
+    def iter_lines(self) -> Iterator[str]:
+        """The JSON lines of the entries, read one at a time from the file."""
+        if self.spill_file is None:
+            yield from self.lines
+            return
+
+        self.spill_file.flush()
+        self.spill_file.seek(0)
+        for line in self.spill_file:
+            yield line.rstrip("\n")
+        self.spill_file.seek(0, 2)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.lines = []
@@ -0,0 +1,142 @@
+import uuid
+import traceback
+from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, Optional
+
+import rpyc
+
+from r2e_test_server.metrics import metrics
+
+
+class R2EJobs:
+    """Calls of a session that run in the background, as jobs.
+
+    The jobs of a session run one at a time, in the order they were started,
+    in a thread of their own. The result of a job is kept until it is
+    handed out, by `poll`/`wait` once the job is done or by its callback.
+
+    Args:
+        lock (Lock): lock of the session, held while a job runs (and by the
+            synchronous calls of the session).
+    """
+
+    def __init__(self, lock: Lock):
+        self.lock = lock
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="r2e_job")
+        self.jobs: Dict[str, Future] = {}
+        self.jobs_lock = Lock()
+
+    def start(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        callback: Optional[Callable[[str, Any], None]] = None,
+    ) -> str:
+        """Start a job running `fn(*args)`.
+
+        Args:
+            callback (Callable): called with the job id and the result of
+                the job when it is done (asynchronously, for rpyc callbacks).
+
+        Returns:
+            str: the job id.
+        """
+        job_id = uuid.uuid4().hex
+        metrics.add("r2e_queue_depth")
+        future = self.executor.submit(self.run_job, fn, *args)
+        with self.jobs_lock:
+            self.jobs[job_id] = future
+
+        if callback is not None:
+            callback = async_callback(callback)
+            future.add_done_callback(
+                lambda future: self.notify(callback, job_id, future)  # type: ignore
+            )
+        return job_id
+
+    def poll(self, job_id: str) -> Dict[str, Any]:
+        """Status of a job ("pending", "running", "done" or "cancelled").
+
+        The result of a done job is included, and the job is forgotten.
+        """
+        with self.jobs_lock:
+            future = self.jobs.get(job_id)
+            if future is None:
+                return {
+                    "job_id": job_id,
+                    "status": "unknown",
+                    "error": f"Unknown job: {job_id}",
+                }
+            if future.done():
+                del self.jobs[job_id]
+
+        if future.cancelled():
+            return {"job_id": job_id, "status": "cancelled"}
+        if future.done():
+            return {"job_id": job_id, "status": "done", "result": future.result()}
+        if future.running():
+            return {"job_id": job_id, "status": "running"}
+        return {"job_id": job_id, "status": "pending"}
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Wait (up to `timeout` seconds) for a job to be done, then `poll` it."""
+        with self.jobs_lock:
+            future = self.jobs.get(job_id)
+
+        if future is not None:
+            try:
+                future.result(timeout=timeout)
+            except TimeoutError:
+                pass
+        return self.poll(job_id)
+
+    def close(self, finalizer: Optional[Callable[[], None]] = None):
+        """Cancel the pending jobs, and call `finalizer` after the running one.
+
+        Does not wait for the running job.
+        """
+        with self.jobs_lock:
+            for future in self.jobs.values():
+                if future.cancel():
+                    metrics.add("r2e_queue_depth", -1)
+            self.jobs.clear()
+
+        if finalizer is not None:
+            self.executor.submit(self.run, finalizer)
+        self.executor.shutdown(wait=False)
+
+    # helpers
+
+    def run(self, fn: Callable[..., Any], *args) -> Any:
+        with self.lock:
+            return fn(*args)
+
+    def run_job(self, fn: Callable[..., Any], *args) -> Any:
+        with self.lock:
+            metrics.add("r2e_queue_depth", -1)
+            with metrics.time("r2e_call_duration_seconds", method=f"{fn.__name__}_job"):
+                return fn(*args)
+
+    def notify(self, callback: Callable[[str, Any], None], job_id: str, future: Future):
+        if future.cancelled():
+            return
+        try:
+            callback(job_id, future.result())
+        except Exception:
+            # the client may be gone, the result can still be polled
+            traceback.print_exc()
+            return
+
+        with self.jobs_lock:
+            self.jobs.pop(job_id, None)
+
+
+def async_callback(callback: Callable) -> Callable:
+    """Make an rpyc callback asynchronous, not waiting for the client to handle it.
+
+    Local callbacks are returned as is.
+    """
+    if isinstance(callback, rpyc.BaseNetref):
+        return rpyc.async_(callback)
+    return callback
@@ -0,0 +1,183 @@
+import os
+import time
+from threading import Lock, Thread
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# upper bounds (in seconds) of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# the metrics of the server: their type and help text
+METRICS = {
+    "r2e_phase_duration_seconds": (
+        "histogram",
+        "Duration of the phases of the sessions' calls.",
+    ),
+    "r2e_call_duration_seconds": (
+        "histogram",
+        "Duration of the service calls, once they hold their session.",
+    ),
+    "r2e_failures_total": ("counter", "Calls that returned an error."),
+    "r2e_active_sessions": ("gauge", "Clients connected to the server."),
+    "r2e_queue_depth": ("gauge", "Calls and jobs waiting for their session."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class R2EMetrics:
+    """Counters, gauges and histograms of the server, in Prometheus text format.
+
+    Worker processes journal their observations, which are shipped back
+    with the replies and merged into the server's metrics (see `drain`/`merge`).
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        # counters and gauges
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        # histograms: the count of each bucket (and +Inf), then the sum
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self.journal: Optional[List[Tuple[str, str, Labels, float]]] = None
+
+    def add(self, name: str, value: float = 1, **labels: str):
+        """Add to a counter or gauge (gauges can go down)."""
+        self._apply("add", name, tuple(sorted(labels.items())), value)
+
+    def observe(self, name: str, value: float, **labels: str):
+        self._apply("observe", name, tuple(sorted(labels.items())), value)
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block in histogram `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def phase(self, phase: str):
+        return self.time("r2e_phase_duration_seconds", phase=phase)
+
+    # shipping the observations of workers
+
+    def start_journal(self):
+        with self.lock:
+            self.journal = []
+
+    def drain(self) -> List[Tuple[str, str, Labels, float]]:
+        """The observations journaled since the last drain."""
+        with self.lock:
+            journal, self.journal = self.journal or [], []
+        return journal
+
+    def merge(self, journal: List[Tuple[str, str, Labels, float]]):
+        for op, name, labels, value in journal:
+            self._apply(op, name, labels, value)
+
+    # exposition
+
+    def render(self) -> str:
+        with self.lock:
+            values = dict(self.values)
+            histograms = {key: list(data) for key, data in self.histograms.items()}
+
+        lines = []
+        for name, (kind, help) in METRICS.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+            for (metric, labels), data in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip(BUCKETS + ("+Inf",), data):
+                    cumulative += count
+                    bucket_labels = labels + (("le", str(bound)),)
+                    lines.append(
+                        f"{name}_bucket{_format_labels(bucket_labels)} {cumulative:g}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {data[-1]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative:g}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.histograms.clear()
+
+    def reinit_lock(self):
+        self.lock = Lock()
+
+    # helpers
+
+    def _apply(self, op: str, name: str, labels: Labels, value: float):
+        key = (name, labels)
+        with self.lock:
+            if op == "add":
+                self.values[key] = self.values.get(key, 0) + value
+            else:
+                data = self.histograms.get(key)
+                if data is None:
+                    data = self.histograms[key] = [0.0] * (len(BUCKETS) + 2)
+                bucket = next(
+                    (idx for idx, bound in enumerate(BUCKETS) if value <= bound),
+                    len(BUCKETS),
+                )
+                data[bucket] += 1
+                data[-1] += value
+
+            if self.journal is not None:
+                self.journal.append((op, name, labels, value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any):
+        # do not log every scrape
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the metrics on http://host:port/metrics, in a background thread.
+
+    Stop it with `shutdown()` (and `server_close()`).
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+metrics = R2EMetrics()
+
+# a fork from a thread (e.g., of a replacement worker) may copy the lock while
+# another thread holds it, the child starts with a new one
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=metrics.reinit_lock)
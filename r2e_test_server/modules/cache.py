@@ -0,0 +1,402 @@
+import os
+import abc
+import sys
+import copy
+import types
+import hashlib
+from threading import Lock
+from collections import OrderedDict
+from types import ModuleType, FunctionType
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# metaclasses whose classes can be re-created with `meta(name, bases, namespace)`
+CLONABLE_METACLASSES = (type, abc.ABCMeta)
+
+# module attributes shared as-is by all the clones
+MODULE_ATTRIBUTES = (
+    "__name__",
+    "__doc__",
+    "__package__",
+    "__loader__",
+    "__spec__",
+    "__file__",
+    "__cached__",
+    "__builtins__",
+)
+
+# class attributes set by the metaclass (or immutable), shared as-is by the clones
+CLASS_ATTRIBUTES = (
+    "__module__",
+    "__doc__",
+    "__qualname__",
+    "__abstractmethods__",
+    "_abc_impl",
+)
+
+
+class ModuleCloner:
+    """Clone an executed module without executing its source again.
+
+    The clone gets a new globals dict: functions defined in the module are
+    re-bound to it and classes defined in the module are re-created, so
+    that changes to one clone (e.g., `execute`, instrumentation) are never
+    seen by another. The other values of the module and the attributes of
+    its classes are deep copied (references to the module's functions and
+    classes pointing to their copies); imported modules are shared.
+
+    Modules whose state cannot be re-created safely (e.g., enums, classes with
+    __slots__, module-level instances of the module's classes, decorated or
+    cached functions, values that cannot be deep copied) are not clonable,
+    `clone` returns None for these. So are the modules with classes whose
+    creation has side effects (`__init_subclass__` of their bases, attributes
+    with `__set_name__`), e.g., registering the class in another module.
+
+    Args:
+        module (ModuleType): the module to clone.
+    """
+
+    def __init__(self, module: ModuleType):
+        self.module = module
+        self.old_globals = module.__dict__
+
+    def clone(self) -> Optional[ModuleType]:
+        try:
+            return self._clone()
+        except Exception:
+            # _NotClonable, or anything that went wrong re-creating the state
+            return None
+
+    def _clone(self) -> ModuleType:
+        clone = ModuleType(self.module.__name__)
+        new_globals = clone.__dict__
+        self.new_globals = new_globals
+
+        # maps the module's functions and classes to their copies, it is
+        # also the memo of the deep copies, which then refer to the copies
+        self.copies: Dict[int, Any] = {}
+        self.pending_cells: List[Tuple[Any, type]] = []
+        # the class attributes to deep copy, once all the functions are copied
+        self.pending_attributes: List[Tuple[type, str, Any]] = []
+
+        classes = [
+            value for value in self.old_globals.values() if self._is_own_class(value)
+        ]
+        for class_obj in self._sorted_by_bases(classes):
+            self._copy_class(class_obj)
+
+        for name, value in self.old_globals.items():
+            if self._is_own_function(value):
+                new_globals[name] = self._copy_function(value)
+
+        for name, value in self.old_globals.items():
+            if name in MODULE_ATTRIBUTES:
+                new_globals[name] = value
+            elif id(value) in self.copies:
+                new_globals[name] = self.copies[id(value)]
+            else:
+                new_globals[name] = self._copy_value(value)
+
+        for new_class, name, value in self.pending_attributes:
+            setattr(new_class, name, self._copy_value(value))
+
+        # fill the `__class__` cells (used by `super()`) with the copied classes
+        for cell, class_obj in self.pending_cells:
+            cell.cell_contents = self.copies[id(class_obj)]
+
+        return clone
+
+    # copies
+
+    def _copy_function(self, func: FunctionType) -> FunctionType:
+        if id(func) in self.copies:
+            return self.copies[id(func)]
+
+        if self._refers_to_module(func.__defaults__ or ()):
+            raise _NotClonable()
+
+        closure = None
+        if func.__closure__ is not None:
+            closure = tuple(self._copy_cell(cell) for cell in func.__closure__)
+
+        new_func = FunctionType(
+            func.__code__, self.new_globals, func.__name__, func.__defaults__, closure
+        )
+        new_func.__kwdefaults__ = (
+            None if func.__kwdefaults__ is None else dict(func.__kwdefaults__)
+        )
+        new_func.__qualname__ = func.__qualname__
+        new_func.__module__ = func.__module__
+        new_func.__doc__ = func.__doc__
+        new_func.__dict__.update(func.__dict__)
+        if hasattr(func, "__type_params__"):
+            setattr(new_func, "__type_params__", getattr(func, "__type_params__"))
+        try:
+            new_func.__annotations__ = dict(func.__annotations__)
+        except Exception:
+            pass
+
+        self.copies[id(func)] = new_func
+        return new_func
+
+    def _copy_cell(self, cell):
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            return cell
+
+        if self._is_own_class(contents):
+            # `__class__` cell of a method, filled once the class is copied
+            if not hasattr(types, "CellType"):
+                raise _NotClonable()
+            new_cell = types.CellType()
+            self.pending_cells.append((new_cell, contents))
+            return new_cell
+
+        if self._refers_to_module(contents):
+            raise _NotClonable()
+        return cell
+
+    def _copy_class(self, class_obj: type) -> type:
+        meta = type(class_obj)
+        if meta not in CLONABLE_METACLASSES or "__slots__" in vars(class_obj):
+            raise _NotClonable()
+
+        # re-creating the class would run these hooks again
+        bases = class_obj.__mro__[1:-1]  # not object
+        if any("__init_subclass__" in vars(base) for base in bases):
+            raise _NotClonable()
+        values = vars(class_obj).values()
+        if any(hasattr(type(value), "__set_name__") for value in values):
+            raise _NotClonable()
+
+        namespace = {}
+        pending = []
+        for name, value in vars(class_obj).items():
+            if name in ("__dict__", "__weakref__"):
+                continue
+            if self._is_copied_later(name, value):
+                pending.append((name, value))
+            namespace[name] = self._copy_class_attribute(value)
+
+        bases = tuple(self.copies.get(id(base), base) for base in class_obj.__bases__)
+        new_class = meta(class_obj.__name__, bases, namespace)
+        new_class.__qualname__ = class_obj.__qualname__
+        for name, value in pending:
+            self.pending_attributes.append((new_class, name, value))
+
+        self.copies[id(class_obj)] = new_class
+        return new_class
+
+    def _copy_class_attribute(self, value: Any) -> Any:
+        if self._is_own_function(value):
+            return self._copy_function(value)
+
+        if isinstance(value, (staticmethod, classmethod)):
+            if self._is_own_function(value.__func__):
+                return type(value)(self._copy_function(value.__func__))
+            return value
+
+        # nested classes
+        if isinstance(value, type) and value.__module__ == self.module.__name__:
+            raise _NotClonable()
+
+        if isinstance(value, property):
+            accessors: List[Any] = [value.fget, value.fset, value.fdel]
+            fget, fset, fdel = (
+                self._copy_function(func) if self._is_own_function(func) else func
+                for func in accessors
+            )
+            return property(fget, fset, fdel, value.__doc__)
+
+        if self._refers_to_module(value):
+            raise _NotClonable()
+        # deep copied once all the functions are copied
+        return value
+
+    def _copy_value(self, value: Any) -> Any:
+        if isinstance(value, ModuleType):
+            return value
+        if self._refers_to_module(value):
+            raise _NotClonable()
+
+        # functions of the module that are not globals have no copy to refer to
+        if type(value) in (list, dict, set):
+            items = value.values() if isinstance(value, dict) else value
+            if any(
+                self._is_own_function(item) and id(item) not in self.copies
+                for item in items
+            ):
+                raise _NotClonable()
+
+        # do not share any (possibly) mutable state of the module
+        try:
+            return copy.deepcopy(value, self.copies)
+        except Exception:
+            raise _NotClonable()
+
+    # checks
+
+    def _is_copied_later(self, name: str, value: Any) -> bool:
+        """Check if a class attribute is deep copied after the class is created."""
+        return not (
+            name in CLASS_ATTRIBUTES
+            or self._is_own_function(value)
+            or isinstance(value, (staticmethod, classmethod, property, type))
+            or self._refers_to_module(value)
+        )
+
+    def _is_own_function(self, value: Any) -> bool:
+        return isinstance(value, FunctionType) and value.__globals__ is self.old_globals
+
+    def _is_own_class(self, value: Any) -> bool:
+        return (
+            isinstance(value, type)
+            and value.__module__ == self.module.__name__
+            and "." not in value.__qualname__
+            and self.old_globals.get(value.__name__) is value
+        )
+
+    def _refers_to_module(self, value: Any) -> bool:
+        """Check if a value (that we cannot re-create) holds the module's state."""
+        if isinstance(value, tuple):
+            return any(self._refers_to_module(item) for item in value)
+
+        if self._is_own_function(value) or self._is_own_class(value):
+            return True
+
+        # instances of the module's classes
+        if self._is_own_class(type(value)):
+            return True
+
+        # wrapped or partial functions: functools.wraps, lru_cache, partial
+        try:
+            wrapped = getattr(value, "__wrapped__", None) or getattr(value, "func", None)
+        except Exception:
+            raise _NotClonable()
+        if isinstance(wrapped, FunctionType):
+            return wrapped.__globals__ is self.old_globals
+
+        return False
+
+    def _sorted_by_bases(self, classes: List[type]) -> List[type]:
+        """Order classes such that every class comes after its bases."""
+        ordered: List[type] = []
+
+        def visit(class_obj):
+            if class_obj in ordered:
+                return
+            for base in class_obj.__bases__:
+                if base in classes:
+                    visit(base)
+            ordered.append(class_obj)
+
+        for class_obj in classes:
+            visit(class_obj)
+        return ordered
+
+
+class _NotClonable(Exception):
+    pass
+
+
+class ModuleCache:
+    """LRU cache of executed FUT modules, shared by the sessions of a server.
+
+    Modules are keyed by their resolved path and the hash of their source.
+    The cache keeps a pristine clone of each module and hands a fresh clone
+    to every session, so the module's source is executed only once.
+
+    Args:
+        max_entries (int): maximum number of cached modules (0 disables the cache).
+        max_bytes (int): approximate memory cap for the cached modules.
+    """
+
+    def __init__(self, max_entries: int = 0, max_bytes: int = 512 * 1024 * 1024):
+        self.lock = Lock()
+        self.entries: "OrderedDict[Tuple[str, str], Optional[ModuleType]]"
+        self.entries = OrderedDict()
+        self.sizes: Dict[Tuple[str, str], int] = {}
+        self.configure(max_entries, max_bytes)
+
+    def configure(self, max_entries: int, max_bytes: int):
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def get_key(module_path: str, source: str) -> Tuple[str, str]:
+        source_hash = hashlib.sha256(source.encode()).hexdigest()
+        return os.path.realpath(module_path), source_hash
+
+    def get(self, module_path: str, source: str) -> Optional[ModuleType]:
+        """Get a fresh clone of the cached module, if any."""
+        if not self.enabled:
+            return None
+
+        key = self.get_key(module_path, source)
+        with self.lock:
+            template = self.entries.get(key)
+            if template is None:
+                return None
+            self.entries.move_to_end(key)
+
+        return ModuleCloner(template).clone()
+
+    def put(self, module_path: str, source: str, module: ModuleType):
+        """Cache a just executed module (before anything modifies it)."""
+        if not self.enabled:
+            return
+
+        key = self.get_key(module_path, source)
+        with self.lock:
+            if key in self.entries:
+                return
+
+        # NOTE: modules that cannot be cloned are cached as None,
+        # so that we do not try to clone them again on every init
+        template = ModuleCloner(module).clone()
+
+        with self.lock:
+            self.entries[key] = template
+            self.sizes[key] = 0 if template is None else self.estimate_size(template)
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+
+    # helpers
+
+    def _evict(self):
+        while self.entries and (
+            len(self.entries) > self.max_entries
+            or sum(self.sizes.values()) > self.max_bytes
+        ):
+            key, _ = self.entries.popitem(last=False)
+            self.sizes.pop(key, None)
+
+    @staticmethod
+    def estimate_size(module: ModuleType) -> int:
+        """Approximate size of the module's own state (imported modules excluded)."""
+        size = sys.getsizeof(module.__dict__)
+        for value in module.__dict__.values():
+            if isinstance(value, ModuleType):
+                continue
+            size += sys.getsizeof(value)
+            if isinstance(value, type):
+                size += sum(sys.getsizeof(attr) for attr in vars(value).values())
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                size += sum(sys.getsizeof(item) for item in value)
+            elif isinstance(value, dict):
+                size += sum(sys.getsizeof(item) for item in value.values())
+        return size
+
+
+fut_module_cache = ModuleCache()
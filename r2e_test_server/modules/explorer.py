@@ -1,6 +1,9 @@
 import os
+import sys
 import ast
-from typing import Dict, List
+from threading import Lock
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 
 class ModuleExplorer:
@@ -73,21 +76,28 @@ class ModuleExplorer:
         return current_dir
 
     @staticmethod
-    def get_dependencies(path_to_module: str) -> Dict[str, object]:
+    def get_dependencies(
+        path_to_module: str,
+        tree: Optional[ast.Module] = None,
+        paths: Optional[List[str]] = None,
+    ) -> "LazyDependencies":
         """Get the dependencies of a module.
 
         Args:
             path_to_module (str): The path to the module file.
+            tree (ast.Module): The already parsed module, if any.
+            paths (List[str]): Extra paths to add to sys.path when importing.
 
         Returns:
-            Dict[str, object]: A map `{name: imported_module}`
+            LazyDependencies: A map `{name: imported_module}`
                 where `name` is the name of an imported module
                 and `imported_module` is the module object.
+                A name is only imported when it is first accessed.
         """
-        with open(path_to_module, "r") as file:
-            module_code = file.read()
+        if tree is None:
+            with open(path_to_module, "r") as file:
+                tree = ast.parse(file.read())
 
-        tree = ast.parse(module_code)
         # find all import statements
         imports = [
             node
@@ -95,7 +105,8 @@ class ModuleExplorer:
             if isinstance(node, (ast.Import, ast.ImportFrom))
         ]
 
-        dependencies = {}
+        # {referred name: [(module name, attribute name or None)]}
+        dependencies: Dict[str, List[Tuple[str, Optional[str]]]] = {}
         package_name = ModuleExplorer.get_package_name(path_to_module)
 
         for imp in imports:
@@ -103,15 +114,9 @@ class ModuleExplorer:
                 for alias in imp.names:
                     module_name = alias.name
                     referred_name = alias.asname if alias.asname else alias.name
-
-                    # try to import the module and get the object
-                    try:
-                        imported_module = __import__(module_name)
-                        dependencies[referred_name] = imported_module
-                    except ModuleNotFoundError:
-                        pass
-                    except AttributeError:
-                        pass
+                    dependencies.setdefault(referred_name, []).append(
+                        (module_name, None)
+                    )
 
             elif isinstance(imp, ast.ImportFrom):
                 module_name = imp.module
@@ -131,21 +136,85 @@ class ModuleExplorer:
                     else:
                         raise ValueError("Invalid relative import")
 
-                # try to import the module and get the object
-                try:
-                    imported_module = __import__(
-                        module_name, fromlist=[alias.name for alias in imp.names]
+                for alias in imp.names:
+                    referred_name = alias.asname if alias.asname else alias.name
+                    dependencies.setdefault(referred_name, []).append(
+                        (module_name, alias.name)
                     )
 
-                    for alias in imp.names:
-                        referred_name = alias.asname if alias.asname else alias.name
-                        dependencies[referred_name] = getattr(
-                            imported_module, alias.name
-                        )
+        return LazyDependencies(dependencies, paths or [])
+
+
+class LazyDependencies(Mapping):
+    """Map of the names imported by a module to the imported objects.
+
+    Each name is imported on first access (and then cached), so that imports
+    that are never used (e.g., nested in functions) are never paid for.
+    Names that cannot be imported are missing from the map.
+
+    Args:
+        imports (Dict): `{referred name: [(module name, attribute name or None)]}`
+            where later imports of a name take precedence over earlier ones.
+        paths (List[str]): extra paths to add to sys.path when importing.
+    """
+
+    _import_lock = Lock()
+
+    def __init__(
+        self, imports: Dict[str, List[Tuple[str, Optional[str]]]], paths: List[str]
+    ):
+        self.imports = imports
+        self.paths = paths
+        self.resolved: Dict[str, object] = {}
+        self.missing: Set[str] = set()
+
+    def __getitem__(self, name: str) -> object:
+        if name in self.resolved:
+            return self.resolved[name]
+        if name in self.missing or name not in self.imports:
+            raise KeyError(name)
+
+        with LazyDependencies._import_lock:
+            added_paths = [path for path in self.paths if path not in sys.path]
+            sys.path[:0] = added_paths
+            try:
+                obj = self.resolve(self.imports[name])
+            finally:
+                for path in added_paths:
+                    sys.path.remove(path)
+
+        if obj is _MISSING:
+            self.missing.add(name)
+            raise KeyError(name)
+
+        self.resolved[name] = obj
+        return obj
+
+    def __iter__(self) -> Iterator[str]:
+        # NOTE: iterating (or len) imports all the names
+        return (name for name in self.imports if name in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @staticmethod
+    def resolve(candidates: List[Tuple[str, Optional[str]]]) -> object:
+        for module_name, attr_name in reversed(candidates):
+
+            # try to import the module and get the object
+            try:
+                if attr_name is None:
+                    return __import__(module_name)
+
+                imported_module = __import__(module_name, fromlist=[attr_name])
+                return getattr(imported_module, attr_name)
+
+            except ModuleNotFoundError:
+                pass
+            except AttributeError:
+                pass
+
+        return _MISSING
 
-                except ModuleNotFoundError:
-                    pass
-                except AttributeError:
-                    pass
 
-        return dependencies
+_MISSING = object()
@@ -0,0 +1,81 @@
+import ast
+import functools
+from typing import Dict, List, Optional, Tuple, Union
+
+
+FuncClassNode = Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
+
+
+class SourceIndex:
+    """Index of the functions, classes and methods defined in a source file.
+
+    The file is parsed once; the index maps the name of every top-level
+    function/class (and `Class.method` for methods) to its AST node and to
+    its line span (decorators included, 1-indexed and inclusive).
+
+    Note: the index (and its AST) may be shared, do not modify the nodes.
+
+    Args:
+        source (str): the source code of the file.
+        tree (ast.Module): the parsed source, if already available.
+    """
+
+    def __init__(self, source: str, tree: Optional[ast.Module] = None):
+        self.source = source
+        self.lines: List[str] = source.splitlines(keepends=True)
+        self.tree = ast.parse(source) if tree is None else tree
+
+        self.nodes: Dict[str, FuncClassNode] = {}
+        self.spans: Dict[str, Tuple[int, int]] = {}
+
+        for node in self.tree.body:
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            self.add_node(node.name, node)
+
+            if isinstance(node, ast.ClassDef):
+                for child in node.body:
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        self.add_node(f"{node.name}.{child.name}", child)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def get(file_path: str, source: str) -> "SourceIndex":
+        """Get the (cached) index of a file with the given source."""
+        return SourceIndex(source)
+
+    def add_node(self, name: str, node: FuncClassNode):
+        # NOTE: like a linear scan of the file, the first definition wins
+        if name in self.nodes:
+            return
+        self.nodes[name] = node
+        self.spans[name] = self.get_node_span(node)
+
+    def get_node(self, name: str) -> FuncClassNode:
+        """Get the function or class AST node by (qualified) name."""
+        if name not in self.nodes:
+            raise ValueError(f"Function or class {name} not found in the file.")
+        return self.nodes[name]
+
+    def get_span(self, name: str) -> Optional[Tuple[int, int]]:
+        """Get the first and last line of a function, class or method, if any."""
+        return self.spans.get(name)
+
+    def get_source(self, name: str) -> str:
+        """Get the source code of a function, class or method by (qualified) name."""
+        self.get_node(name)
+        first_line, last_line = self.spans[name]
+        return "".join(self.lines[first_line - 1 : last_line])
+
+    @staticmethod
+    def get_node_span(node: FuncClassNode) -> Tuple[int, int]:
+        first_line = min([node.lineno] + [d.lineno for d in node.decorator_list])
+
+        last_line = getattr(node, "end_lineno", None)
+        if last_line is None:
+            # python < 3.8
+            last_line = max(
+                getattr(child, "lineno", node.lineno) for child in ast.walk(node)
+            )
+
+        return first_line, last_line
@@ -0,0 +1,152 @@
+import os
+import json
+import sqlite3
+import hashlib
+from threading import Lock
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResultCache:
+    """Content-addressed cache of submit results, shared by the sessions of a server.
+
+    Results are keyed by the hash of everything they depend on (see `get_key`),
+    so byte-identical submits are answered without running the tests. The
+    cache has an in-memory LRU tier and, optionally, an on-disk SQLite tier
+    that survives restarts (and is shared by the workers of a server).
+
+    Args:
+        max_entries (int): maximum number of results kept in memory.
+        db_path (str): path of the SQLite database, None for no disk tier.
+
+    Note: the disk tier is not bounded, remove the database to clear it.
+    """
+
+    def __init__(self, max_entries: int = 0, db_path: Optional[str] = None):
+        self.lock = Lock()
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.db: Optional[sqlite3.Connection] = None
+        self.db_pid: Optional[int] = None
+        self.configure(max_entries, db_path)
+
+    def configure(self, max_entries: int, db_path: Optional[str] = None):
+        with self.lock:
+            self.max_entries = max_entries
+            self.db_path = db_path
+            self._close_db()
+            self._evict()
+            self.hits = self.memory_hits = self.disk_hits = self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.db_path is not None
+
+    @staticmethod
+    def get_key(**parts: Any) -> str:
+        """Hash the (json serializable) parts a result depends on."""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the cached submit response ("output", "error" and "logs"), if any."""
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            response: Optional[Dict[str, Any]] = self.entries.get(key)
+            if response is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+            elif self.db_path is not None:
+                row = (
+                    self._get_db()
+                    .execute(
+                        "SELECT output, error, logs FROM results WHERE key = ?", (key,)
+                    )
+                    .fetchone()
+                )
+                if row is not None:
+                    response = {"output": row[0], "error": row[1], "logs": row[2]}
+                    self._put_memory(key, response)
+                    self.disk_hits += 1
+
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(response)
+
+    def put(self, key: str, response: Dict[str, Any]):
+        if not self.enabled:
+            return
+
+        response = {
+            "output": response.get("output", ""),
+            "error": response.get("error", ""),
+            "logs": response["logs"],
+        }
+        with self.lock:
+            self._put_memory(key, response)
+            if self.db_path is not None:
+                db = self._get_db()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                        (key, response["output"], response["error"], response["logs"]),
+                    )
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self.entries),
+            }
+
+    def clear(self):
+        """Clear the in-memory tier (the disk tier is kept)."""
+        with self.lock:
+            self.entries.clear()
+
+    def reinit_lock(self):
+        self.lock = Lock()
+
+    # helpers
+
+    def _put_memory(self, key: str, response: Dict[str, Any]):
+        self.entries[key] = response
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _get_db(self) -> sqlite3.Connection:
+        # NOTE: a connection must not cross a fork, every worker opens its own
+        if self.db is None or self.db_pid != os.getpid():
+            self.db = sqlite3.connect(
+                self.db_path, timeout=30, check_same_thread=False  # type: ignore
+            )
+            self.db_pid = os.getpid()
+            self.db.execute("PRAGMA journal_mode=WAL")
+            with self.db:
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS results "
+                    "(key TEXT PRIMARY KEY, output TEXT, error TEXT, logs BLOB)"
+                )
+        return self.db
+
+    def _close_db(self):
+        if self.db is not None and self.db_pid == os.getpid():
+            self.db.close()
+        self.db = None
+        self.db_pid = None
+
+
+result_cache = ResultCache()
+
+# see `metrics`: a forked child must not inherit the lock held by another thread
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=result_cache.reinit_lock)
@@ -1,44 +1,54 @@
-import sys
-import json
-import traceback
-from threading import Thread, Event
-from typing import List, Dict, Optional
-from io import StringIO
+from threading import Thread, Event, Lock
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Union
 
 import rpyc
 from rpyc.utils.server import ThreadPoolServer
 
-from r2e_test_server.testing.r2e_testprogram import R2ETestProgram
-
-
-class CaptureOutput:
-    def __init__(self, stdout=None, stderr=None):
-        self._stdout = stdout or sys.stdout
-        self._stderr = stderr or sys.stderr
-
-    def __enter__(self):
-        self.old_stdout, self.old_stderr = sys.stdout, sys.stderr
-        self.old_stdout.flush()
-        self.old_stderr.flush()
-        sys.stdout, sys.stderr = self._stdout, self._stderr
-
-    def __exit__(self, exc_type, exc_value, traceback):
-        self._stdout.flush()
-        self._stderr.flush()
-        sys.stdout = self.old_stdout
-        sys.stderr = self.old_stderr
+from r2e_test_server.jobs import R2EJobs, async_callback
+from r2e_test_server.session import R2ESession
+from r2e_test_server.metrics import metrics, start_metrics_server
+from r2e_test_server.capture import install_routed_streams
+from r2e_test_server.result_cache import result_cache
+from r2e_test_server.modules.cache import fut_module_cache
+from r2e_test_server.workers import R2EWorkerPool, R2ERemoteSession
 
 
 @rpyc.service
 class R2EService(rpyc.Service):
     def __init__(self):
-        self.codegen_mode: bool = False
+        # every service (i.e., connection) gets a fresh, isolated session,
+        # opened on first use
+        self._session: Optional[Union[R2ESession, R2ERemoteSession]] = None
+        self.open_lock = Lock()
+        # the session runs one call at a time, synchronous or in a job
+        self.lock = Lock()
+        self.jobs = R2EJobs(self.lock)
+
+    @property
+    def session(self) -> Union[R2ESession, R2ERemoteSession]:
+        with self.open_lock:
+            if self._session is None:
+                self._session = open_session()
+            return self._session
 
     def on_connect(self, conn):
-        pass
+        metrics.add("r2e_active_sessions")
 
     def on_disconnect(self, conn):
-        pass
+        # the session is closed once its running job (if any) is done
+        if self._session is not None:
+            self.jobs.close(self._session.close)
+        metrics.add("r2e_active_sessions", -1)
+
+    @contextmanager
+    def session_call(self, method: str) -> Iterator[None]:
+        """Hold the session for a call, timing it once the session is held."""
+        metrics.add("r2e_queue_depth")
+        with self.lock:
+            metrics.add("r2e_queue_depth", -1)
+            with metrics.time("r2e_call_duration_seconds", method=method):
+                yield
 
     @rpyc.exposed
     def stop_server(self):
@@ -46,100 +56,154 @@ class R2EService(rpyc.Service):
 
     @rpyc.exposed
     def setup_repo(self, data: str):
-        data_dict = json.loads(data)
-        self.repo_id: Optional[str] = data_dict["repo_id"]
-        self.repo_path: str = data_dict["repo_path"]
+        with self.session_call("setup_repo"):
+            self.session.setup_repo(data)
 
     @rpyc.exposed
     def setup_function(self, data: str):
-        data_dict = json.loads(data)
-        self.funclass_names: List[str] = data_dict["funclass_names"]
-        self.file_path = data_dict["file_path"]
+        with self.session_call("setup_function"):
+            self.session.setup_function(data)
 
     @rpyc.exposed
     def setup_test(self, data: str):
-        data_dict = json.loads(data)
-        self.generated_tests: Dict[str, str] = data_dict["generated_tests"]
+        with self.session_call("setup_test"):
+            self.session.setup_test(data)
 
     @rpyc.exposed
     def setup_codegen_mode(self):
-        self.codegen_mode = True
+        with self.session_call("setup_codegen_mode"):
+            self.session.setup_codegen_mode()
 
     @rpyc.exposed
-    def init(self):
-        stdout_buffer = StringIO()
-        stderr_buffer = StringIO()
-        try:
-            with CaptureOutput(stdout=stdout_buffer, stderr=stderr_buffer):
-                self.r2e_test_program = R2ETestProgram(
-                    self.repo_id,
-                    self.repo_path,
-                    self.funclass_names,
-                    self.file_path,
-                    self.generated_tests,
-                    self.codegen_mode,
-                )
-
-            output = stdout_buffer.getvalue().strip()
-            error = stderr_buffer.getvalue().strip()
-
-            return {"output": output, "error": error}
-
-        except Exception as e:
-            traceback_message = traceback.format_exc()
-            output = stdout_buffer.getvalue().strip()
-            return {
-                "error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}",
-                "output": output,
-            }
+    def setup_result_encoding(self, data: str):
+        with self.session_call("setup_result_encoding"):
+            self.session.setup_result_encoding(data)
 
     @rpyc.exposed
-    def submit(self):
-        stdout_buffer = StringIO()
-        stderr_buffer = StringIO()
-        try:
-            with CaptureOutput(stdout=stdout_buffer, stderr=stderr_buffer):
-                logs = self.r2e_test_program.submit()
-                output = stdout_buffer.getvalue().strip()
-                error = stderr_buffer.getvalue().strip()
+    def init(self):
+        with self.session_call("init"):
+            return self.session.init()
 
-                return {"output": output, "error": error, "logs": logs}
+    @rpyc.exposed
+    def submit(self, data: Optional[str] = None, on_event: Optional[Callable] = None):
+        """Submit the function under test.
 
-        except Exception as e:
-            traceback_message = traceback.format_exc()
-            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+        With `on_event`, the result of every test is streamed to the client,
+        as `on_event(event)`, as soon as the test finishes.
+        """
+        if on_event is not None:
+            on_event = async_callback(on_event)
+        with self.session_call("submit"):
+            return self.session.submit(data, on_event)
 
     @rpyc.exposed
-    def execute(self, command: str):
-        stdout_buffer = StringIO()
-        stderr_buffer = StringIO()
-        try:
-            with CaptureOutput(stdout=stdout_buffer, stderr=stderr_buffer):
-                self.r2e_test_program.compile_and_exec(command.strip())
-                output = stdout_buffer.getvalue().strip()
-                error = stderr_buffer.getvalue().strip()
+    def submit_batch(self, data: str):
+        with self.session_call("submit_batch"):
+            return self.session.submit_batch(data)
 
-                return {"output": output, "error": error}
+    @rpyc.exposed
+    def submit_async(
+        self,
+        data: Optional[str] = None,
+        callback: Optional[Callable] = None,
+        on_event: Optional[Callable] = None,
+    ) -> str:
+        """Start a `submit` in the background and return its job id.
+
+        The result of the job is handed out by `poll`/`wait`, or passed to
+        `callback(job_id, result)` when the job is done. The results of the
+        tests are streamed to `on_event`, as in `submit`.
+        """
+        if on_event is not None:
+            on_event = async_callback(on_event)
+        return self.jobs.start(self.session.submit, data, on_event, callback=callback)
 
-        except Exception as e:
-            traceback_message = traceback.format_exc()
-            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+    @rpyc.exposed
+    def poll(self, job_id: str):
+        return self.jobs.poll(job_id)
 
+    @rpyc.exposed
+    def wait(self, job_id: str, timeout: Optional[float] = None):
+        return self.jobs.wait(job_id, timeout)
 
-server_stop_event = Event()
+    @rpyc.exposed
+    def result_cache_stats(self):
+        """Hits and misses of the result cache (summed over the workers, if any)."""
+        if worker_pool is None:
+            return result_cache.stats()
+        return worker_pool.result_cache_stats()
 
+    @rpyc.exposed
+    def execute(self, command: str):
+        with self.session_call("execute"):
+            return self.session.execute(command)
 
-def start_server(port: int):
-    server = ThreadPoolServer(R2EService(), port=port)
+    @rpyc.exposed
+    def reset(self):
+        with self.session_call("reset"):
+            return self.session.reset()
 
-    # Run the server and wait for a stop event
-    server_thread = Thread(target=server.start)
-    server_thread.start()
-    server_stop_event.wait()
 
-    # Once received, close the server and join the thread
-    server.close()
-    server_thread.join()
+server_stop_event = Event()
+worker_pool: Optional[R2EWorkerPool] = None
+
+
+def open_session() -> Union[R2ESession, R2ERemoteSession]:
+    """Open a session in the worker pool, if any, else in the server process."""
+    if worker_pool is None:
+        return R2ESession()
+    return worker_pool.open_session()
+
+
+def start_server(
+    port: int,
+    num_workers: int = 0,
+    preload: Optional[List[str]] = None,
+    module_cache_size: int = 0,
+    module_cache_mb: int = 512,
+    result_cache_size: int = 0,
+    result_cache_db: Optional[str] = None,
+    metrics_port: Optional[int] = None,
+):
+    global worker_pool
+
+    # route the output of every session to its own capture buffers
+    install_routed_streams()
+
+    # NOTE: with workers, every worker keeps its own cache
+    fut_module_cache.configure(module_cache_size, module_cache_mb * 1024 * 1024)
+    # NOTE: with workers, every worker keeps its own in-memory tier
+    result_cache.configure(result_cache_size, result_cache_db)
+
+    # fork the workers before the server starts any thread
+    if num_workers > 0:
+        worker_pool = R2EWorkerPool(num_workers, preload=preload)
+
+    # the workers are not daemons, stop them even if the server fails to start
+    metrics_server = None
+    try:
+        if metrics_port is not None:
+            metrics_server = start_metrics_server(metrics_port)
+
+        # pass the service class (not an instance) so that rpyc
+        # creates a separate service, and session, per connection
+        server = ThreadPoolServer(R2EService, port=port)
+
+        # Run the server and wait for a stop event
+        server_thread = Thread(target=server.start)
+        server_thread.start()
+        server_stop_event.wait()
+
+        # Once received, close the server and join the thread
+        server.close()
+        server_thread.join()
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+        if worker_pool is not None:
+            worker_pool.close()
+            worker_pool = None
     print("Server stopped")
 
 
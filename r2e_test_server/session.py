@@ -0,0 +1,295 @@
+import os
+import sys
+import json
+import hashlib
+import traceback
+from io import StringIO
+from threading import RLock
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+from r2e_test_server.capture import CaptureOutput
+from r2e_test_server.metrics import metrics
+from r2e_test_server.encoding import R2EResultEncoder
+from r2e_test_server.result_cache import result_cache
+from r2e_test_server.testing.r2e_testprogram import R2ETestProgram
+
+
+# the programs of all the sessions share process-global state (sys.path,
+# sys.modules["fut_module"], coverage.py's collectors, sys.monitoring), so
+# only one session loads or runs its program at a time in a process
+program_lock = RLock()
+
+
+class R2ESession:
+    """State of a single client of the R2E test server.
+
+    Every connection to the server gets its own session, so the repo,
+    function, tests and the loaded test program of one client are never
+    seen (or overwritten) by another.
+
+    With the result cache enabled, the test program is only loaded by the
+    first `execute` or submit missing the cache.
+
+    Note: the sessions of a process run their programs one at a time (see
+    `program_lock`), use a worker pool to run them concurrently.
+    """
+
+    def __init__(self):
+        self.codegen_mode: bool = False
+        self.r2e_test_program: Optional[R2ETestProgram] = None
+        self.result_encoder = R2EResultEncoder()
+        # the arguments of the test program, once `init` is called
+        self.program_args: Optional[Tuple] = None
+        self.file_hash: Optional[str] = None
+        # the commands executed since `init`/`reset`: the candidate source
+        self.commands: List[str] = []
+
+    def setup_repo(self, data: str):
+        data_dict = json.loads(data)
+        self.repo_id: Optional[str] = data_dict["repo_id"]
+        self.repo_path: str = data_dict["repo_path"]
+
+    def setup_function(self, data: str):
+        data_dict = json.loads(data)
+        self.funclass_names: List[str] = data_dict["funclass_names"]
+        self.file_path = data_dict["file_path"]
+
+    def setup_test(self, data: str):
+        data_dict = json.loads(data)
+        self.generated_tests: Dict[str, str] = data_dict["generated_tests"]
+
+    def setup_codegen_mode(self):
+        self.codegen_mode = True
+
+    def setup_result_encoding(self, data: str):
+        data_dict = json.loads(data)
+        self.result_encoder = R2EResultEncoder(
+            data_dict.get("format", "json"), data_dict.get("compression")
+        )
+
+    def init(self):
+        stdout_buffer = StringIO()
+        stderr_buffer = StringIO()
+        try:
+            with program_lock, CaptureOutput(
+                stdout=stdout_buffer, stderr=stderr_buffer
+            ):
+                program_args = (
+                    self.repo_id,
+                    self.repo_path,
+                    self.funclass_names,
+                    self.file_path,
+                    self.generated_tests,
+                    self.codegen_mode,
+                )
+                repo_path = R2ETestProgram.resolve_repo_path(
+                    self.repo_id, self.repo_path
+                )
+                with open(os.path.join(repo_path, self.file_path), "rb") as file:
+                    file_hash = hashlib.sha256(file.read()).hexdigest()
+
+                # loaded on the first cache miss, see `get_program`
+                program = None
+                if not result_cache.enabled:
+                    program = R2ETestProgram(*program_args)
+
+                self.r2e_test_program = program
+                self.program_args = program_args
+                self.file_hash = file_hash
+                self.commands = []
+
+            output = stdout_buffer.getvalue().strip()
+            error = stderr_buffer.getvalue().strip()
+
+            return {"output": output, "error": error}
+
+        except Exception as e:
+            metrics.add("r2e_failures_total", method="init")
+            traceback_message = traceback.format_exc()
+            output = stdout_buffer.getvalue().strip()
+            return {
+                "error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}",
+                "output": output,
+            }
+
+    def submit(
+        self,
+        data: Optional[str] = None,
+        on_event: Optional[Callable[[Dict], None]] = None,
+    ):
+        stdout_buffer = StringIO()
+        stderr_buffer = StringIO()
+        try:
+            options = json.loads(data) if data else {}
+
+            # NOTE: streamed submits run the tests, but still fill the cache
+            cache_key = self.get_cache_key(self.commands, options)
+            if cache_key is not None and on_event is None:
+                response = result_cache.get(cache_key)
+                if response is not None:
+                    return response
+
+            with program_lock, CaptureOutput(
+                stdout=stdout_buffer, stderr=stderr_buffer
+            ):
+                program = self.get_program()
+                logs = program.submit(
+                    encoder=self.result_encoder, on_event=on_event, **options
+                )
+                output = stdout_buffer.getvalue().strip()
+                error = stderr_buffer.getvalue().strip()
+
+            response = {"output": output, "error": error, "logs": logs}
+            # timeouts and crashes may not happen again
+            if cache_key is not None and program.last_submit_reproducible:
+                result_cache.put(cache_key, response)
+            return response
+
+        except Exception as e:
+            metrics.add("r2e_failures_total", method="submit")
+            traceback_message = traceback.format_exc()
+            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+
+    def submit_batch(self, data: str):
+        stdout_buffer = StringIO()
+        stderr_buffer = StringIO()
+        try:
+            data_dict = json.loads(data)
+            candidates: List[str] = data_dict["candidates"]
+            options = data_dict.get("options", {})
+
+            # NOTE: not the entries of `execute` + `submit`, a candidate that
+            # fails to execute gets the error only
+            cache_keys = [
+                self.get_cache_key(
+                    self.commands + [candidate.strip()], options, batch=True
+                )
+                for candidate in candidates
+            ]
+            logs: List[Any] = []
+            for cache_key in cache_keys:
+                response = None if cache_key is None else result_cache.get(cache_key)
+                logs.append(None if response is None else response["logs"])
+            misses = [idx for idx, log in enumerate(logs) if log is None]
+
+            with program_lock, CaptureOutput(
+                stdout=stdout_buffer, stderr=stderr_buffer
+            ):
+                if misses:
+                    program = self.get_program()
+                    miss_logs = program.submit_batch(
+                        [candidates[idx] for idx in misses],
+                        encoder=self.result_encoder,
+                        **options,
+                    )
+                    reproducible = program.last_batch_reproducible
+                    for idx, log, is_reproducible in zip(
+                        misses, miss_logs, reproducible
+                    ):
+                        logs[idx] = log
+                        cache_key = cache_keys[idx]
+                        if cache_key is not None and is_reproducible:
+                            # the output of a batch is not split by candidate
+                            result_cache.put(cache_key, {"logs": log})
+                output = stdout_buffer.getvalue().strip()
+                error = stderr_buffer.getvalue().strip()
+
+                return {"output": output, "error": error, "logs": logs}
+
+        except Exception as e:
+            metrics.add("r2e_failures_total", method="submit_batch")
+            traceback_message = traceback.format_exc()
+            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+
+    def execute(self, command: str):
+        stdout_buffer = StringIO()
+        stderr_buffer = StringIO()
+        try:
+            command = command.strip()
+            with program_lock, CaptureOutput(
+                stdout=stdout_buffer, stderr=stderr_buffer
+            ):
+                program = self.get_program()
+                # recorded even if it fails, it may have changed the module
+                self.commands.append(command)
+                program.compile_and_exec(command)
+                output = stdout_buffer.getvalue().strip()
+                error = stderr_buffer.getvalue().strip()
+
+                return {"output": output, "error": error}
+
+        except Exception as e:
+            metrics.add("r2e_failures_total", method="execute")
+            traceback_message = traceback.format_exc()
+            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+
+    def reset(self):
+        stdout_buffer = StringIO()
+        stderr_buffer = StringIO()
+        try:
+            with program_lock, CaptureOutput(
+                stdout=stdout_buffer, stderr=stderr_buffer
+            ):
+                if self.r2e_test_program is not None or self.program_args is None:
+                    self.get_program().reset()
+                self.commands = []
+                output = stdout_buffer.getvalue().strip()
+                error = stderr_buffer.getvalue().strip()
+
+                return {"output": output, "error": error}
+
+        except Exception as e:
+            metrics.add("r2e_failures_total", method="reset")
+            traceback_message = traceback.format_exc()
+            return {"error": f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"}
+
+    def close(self):
+        """Release the test program (and the FUT module) held by the session."""
+        with program_lock:
+            if self.r2e_test_program is not None:
+                fut_module = self.r2e_test_program.fut_module
+                if sys.modules.get("fut_module") is fut_module:
+                    del sys.modules["fut_module"]
+            self.r2e_test_program = None
+
+    # helpers
+
+    def get_program(self) -> R2ETestProgram:
+        """Get the test program, loading it if needed."""
+        if self.program_args is None:
+            raise RuntimeError("Session is not initialized, call `init` first.")
+
+        # NOTE: no commands are executed before the program is loaded
+        if self.r2e_test_program is None:
+            self.r2e_test_program = R2ETestProgram(*self.program_args)
+        return self.r2e_test_program
+
+    def get_cache_key(
+        self, commands: List[str], options: Dict, batch: bool = False
+    ) -> Optional[str]:
+        """Key of the result cache for a submit, None if there is no cache.
+
+        With `batch`, the key of a candidate of `submit_batch`.
+        """
+        if not result_cache.enabled or self.program_args is None:
+            return None
+
+        repo_id, repo_path, funclass_names, file_path, generated_tests, codegen_mode = (
+            self.program_args
+        )
+        tests_hash = hashlib.sha256(
+            json.dumps(generated_tests, sort_keys=True).encode()
+        ).hexdigest()
+        candidate_hash = hashlib.sha256(json.dumps(commands).encode()).hexdigest()
+        return result_cache.get_key(
+            repo=[repo_id, R2ETestProgram.resolve_repo_path(repo_id, repo_path)],
+            file_path=file_path,
+            file_hash=self.file_hash,
+            funclass_names=funclass_names,
+            tests_hash=tests_hash,
+            codegen_mode=codegen_mode,
+            candidate_hash=candidate_hash,
+            options=options,
+            encoding=[self.result_encoder.format, self.result_encoder.compression],
+            batch=batch,
+        )
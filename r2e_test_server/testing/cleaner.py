@@ -1,6 +1,7 @@
 import re
 import ast
 import sys
+from typing import Collection, List
 
 from r2e_test_server.ast.transformer import ImportAliasReplacer
 
@@ -24,32 +25,29 @@ class R2ETestCleaner:
         Returns:
             str: The cleaned test case.
         """
+        cleaned_tree = R2ETestCleaner.clean_test_tree(test_case, [fut_name, ref_fut_name])
+        return ast.unparse(cleaned_tree)
 
-        tree = ast.parse(test_case)
-        cleaned_tree = ast.Module(body=[], type_ignores=[])
-        tree = ImportAliasReplacer(tree, names=[fut_name, ref_fut_name]).transform()
-
-        cleaned_tree.body = [
-            node
-            for node in tree.body
-            if not R2ETestCleaner._should_skip_node(node, fut_name, ref_fut_name)
-        ]
+    @staticmethod
+    def clean_test_tree(test_case: str, names: List[str]) -> ast.Module:
+        """Clean the generated test case for all the given names in a single pass.
 
-        cleaned_generated_test = ast.unparse(cleaned_tree)
-        cleaned_generated_test = re.sub(
-            r"unittest\.main\(\)", "pass", cleaned_generated_test
-        )
-        cleaned_generated_test = re.sub(
-            r"(your_module\.|original_module\.)", "fut_module.", cleaned_generated_test
-        )
+        Args:
+            test_case (str): The generated test case.
+            names (List[str]): The names of the functions under test and their references.
 
-        return cleaned_generated_test
+        Returns:
+            ast.Module: The cleaned test case, ready to be compiled.
+        """
+        tree = ast.parse(test_case)
+        cleaned_tree = R2ETestCaseTransformer(tree, names).transform()
+        return ast.fix_missing_locations(cleaned_tree)
 
     @staticmethod
-    def _should_skip_node(node, fut_name, ref_fut_name):
+    def _should_skip_node(node, names: Collection[str]):
         """helper: checks if a node in the generated test's AST should be skipped"""
         aliases_fut_or_reference = lambda node: any(
-            alias.name in [fut_name, ref_fut_name] for alias in node.names
+            alias.name in names for alias in node.names
         )
 
         if isinstance(node, ast.Import) and aliases_fut_or_reference(node):
@@ -60,13 +58,76 @@ class R2ETestCleaner:
             if node.module is not None and "fut_module" in node.module:
                 return True
 
-            elif node.module in [fut_name, ref_fut_name]:
+            elif node.module in names:
                 return True
 
             elif aliases_fut_or_reference(node):
                 return True
 
-        if isinstance(node, ast.FunctionDef) and node.name in [fut_name, ref_fut_name]:
+        if isinstance(node, ast.FunctionDef) and node.name in names:
             return True
 
         return False
+
+
+class R2ETestCaseTransformer(ImportAliasReplacer):
+    """Clean a generated test case in one pass over its AST.
+
+    - removes imports and re-implementations of the FUTs and references
+    - replaces aliases of the FUTs and references with their names
+    - replaces `your_module.` and `original_module.` with `fut_module.`, also in
+      strings (e.g., `mock.patch("your_module.helper")`)
+    - replaces `unittest.main()` with `pass`
+
+    Args:
+        tree (ast.Module): AST tree of the test case.
+        names (List[str]): names of the functions under test and their references.
+    """
+
+    MODULE_NAMES = ("your_module", "original_module")
+    MODULE_PREFIX = re.compile(r"\b(your_module|original_module)\.")
+
+    def __init__(self, tree: ast.Module, names: List[str]):
+        super().__init__(tree, names)
+        self.names = set(names)
+
+    def visit_Module(self, node):
+        node.body = [
+            stmt
+            for stmt in node.body
+            if not R2ETestCleaner._should_skip_node(stmt, self.names)
+        ]
+        return self.generic_visit(node)
+
+    def visit_Expr(self, node):
+        if self.is_unittest_main(node.value):
+            return ast.copy_location(ast.Pass(), node)
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id in self.MODULE_NAMES:
+            node.value = ast.copy_location(
+                ast.Name(id="fut_module", ctx=node.value.ctx), node.value
+            )
+        return self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str):
+            node.value = self.MODULE_PREFIX.sub("fut_module.", node.value)
+        return node
+
+    if sys.version_info < (3, 8):
+
+        def visit_Str(self, node):
+            node.s = self.MODULE_PREFIX.sub("fut_module.", node.s)
+            return node
+
+    @staticmethod
+    def is_unittest_main(node) -> bool:
+        return (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "main"
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "unittest"
+        )
@@ -1,7 +1,50 @@
 import inspect
+from bisect import bisect_left, bisect_right
 from types import ModuleType
 from coverage import Coverage
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+
+from r2e_test_server.modules.index import SourceIndex
+
+
+class R2EFileCoverage(object):
+    """Coverage analysis of a file, shared by the functions/methods in it.
+
+    The file is analyzed once, from the coverage data in memory; each
+    R2ECodeCoverage then slices its function's lines and branches out of
+    the (sorted) analysis.
+
+    Args:
+        cov (Coverage): the coverage measurement (stopped).
+        file_path (str): the file to analyze.
+    """
+
+    def __init__(self, cov: Coverage, file_path: str):
+        analysis = cov._analyze(file_path)
+
+        self.executable_lines: List[int] = sorted(analysis.statements)
+        self.excluded_lines: List[int] = sorted(analysis.excluded)
+        self.unexecuted_lines: List[int] = sorted(analysis.missing)
+        self.missing_branches = SortedBranches(analysis.missing_branch_arcs())
+        self.executed_branches = SortedBranches(analysis.executed_branch_arcs())
+
+    @staticmethod
+    def slice_lines(lines: List[int], first_line: int, last_line: int) -> List[int]:
+        """The lines (sorted) between `first_line` and `last_line` (inclusive)."""
+        return lines[bisect_left(lines, first_line) : bisect_right(lines, last_line)]
+
+
+class SortedBranches(object):
+    """Branch arcs `{from_line: [to_lines]}`, sorted by their from line."""
+
+    def __init__(self, arcs: Dict[int, List[int]]):
+        self.lines: List[int] = sorted(arcs)
+        self.arcs = arcs
+
+    def slice(self, first_line: int, last_line: int) -> Dict[int, List[int]]:
+        """The arcs from the lines between `first_line` and `last_line` (inclusive)."""
+        lines = R2EFileCoverage.slice_lines(self.lines, first_line, last_line)
+        return {line: self.arcs[line] for line in lines}
 
 
 class R2ECodeCoverage(object):
@@ -11,11 +54,15 @@ class R2ECodeCoverage(object):
         fut_module: ModuleType,
         fut_module_path: str,
         funclass_name: str,
+        source_index: Optional[SourceIndex] = None,
+        file_coverage: Optional[R2EFileCoverage] = None,
     ):
         self.cov = cov
         self.fut_module = fut_module
         self.fut_module_path = fut_module_path
         self.funclass_name = funclass_name
+        self.source_index = source_index
+        self.file_coverage = file_coverage
 
     def report_coverage(self):
         if not self.source_exists():
@@ -77,53 +124,35 @@ class R2ECodeCoverage(object):
         return branch_coverage_metrics
 
     def load_coverage_data(self):
-        """Load the coverage data for the FUT from coverage.py"""
-        self.cov.load()
-        analysis = self.cov._analyze(self.fut_module_path)
-
-        self.executable_lines: List = sorted(analysis.statements)
-        self.excluded_lines: List = sorted(analysis.excluded)
-        self.unexecuted_lines: List = sorted(analysis.missing)
-        self.missing_branches: Dict = analysis.missing_branch_arcs()
-        self.executed_branches: Dict = analysis.executed_branch_arcs()
+        """Load the coverage analysis of the FUT's file (once per file)."""
+        if self.file_coverage is None:
+            self.file_coverage = R2EFileCoverage(self.cov, self.fut_module_path)
 
     def limit_data_to_target_source(self):
-        """Filter the coverage data to only the FUT's source code."""
-        line_filter_func = (
-            lambda line: self.fut_first_line <= line <= self.fut_last_line
-        )
-        branch_filter_func = (
-            lambda branch: self.fut_first_line <= branch[0] <= self.fut_last_line
-        )
+        """Slice the coverage data of the FUT's source code out of the file's."""
+        assert self.file_coverage is not None
+        file_coverage = self.file_coverage
+        window: Tuple[int, int] = (self.fut_first_line, self.fut_last_line)
 
-        self.executable_lines = self.filter_lines_list(
-            self.executable_lines, line_filter_func
+        self.executable_lines = file_coverage.slice_lines(
+            file_coverage.executable_lines, *window
         )
-        self.unexecuted_lines = self.filter_lines_list(
-            self.unexecuted_lines, line_filter_func
+        self.unexecuted_lines = file_coverage.slice_lines(
+            file_coverage.unexecuted_lines, *window
         )
-        self.excluded_lines = self.filter_lines_list(
-            self.excluded_lines, line_filter_func
-        )
-        self.missing_branches = self.filter_lines_dict(
-            self.missing_branches, branch_filter_func
-        )
-        self.executed_branches = self.filter_lines_dict(
-            self.executed_branches, branch_filter_func
+        self.excluded_lines = file_coverage.slice_lines(
+            file_coverage.excluded_lines, *window
         )
+        self.missing_branches = file_coverage.missing_branches.slice(*window)
+        self.executed_branches = file_coverage.executed_branches.slice(*window)
 
     # helper functions
 
-    def filter_lines_dict(self, data, filter_func) -> Dict:
-        """Apply a filter function to a dictionary of items."""
-        return dict(filter(filter_func, data.items()))
-
-    def filter_lines_list(self, data, filter_func) -> List:
-        """Apply a filter function to a list of items."""
-        return list(filter(filter_func, data))
-
     def source_exists(self) -> bool:
         """Check if the source code exists in a file."""
+        if self.source_index is not None:
+            return self.indexed_source_exists()
+
         try:
 
             # method case
@@ -146,3 +175,26 @@ class R2ECodeCoverage(object):
         self.fut_first_line = lines_info[1]
         self.fut_last_line = self.fut_first_line + len(lines_info[0]) - 1
         return True
+
+    def indexed_source_exists(self) -> bool:
+        """Check if the source code exists in the file, using the file's index."""
+        assert self.source_index is not None
+        try:
+            funclass_obj: Any = self.fut_module
+            for name in self.funclass_name.split("."):
+                funclass_obj = getattr(funclass_obj, name)
+        except AttributeError:
+            return False
+
+        # not from the file, e.g., exec()d from a string
+        code = getattr(inspect.unwrap(funclass_obj), "__code__", None)
+        if code is not None and code.co_filename != self.fut_module_path:
+            return False
+
+        span = self.source_index.get_span(self.funclass_name)
+        if span is None:
+            return False
+
+        # set FUT's first and last line, if exists
+        self.fut_first_line, self.fut_last_line = span
+        return True
@@ -0,0 +1,362 @@
+import sys
+import pickle
+import hashlib
+import itertools
+from collections import deque
+from types import (
+    BuiltinFunctionType,
+    CodeType,
+    FunctionType,
+    MethodType,
+    ModuleType,
+)
+from unittest import TestSuite
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from r2e_test_server.testing.result import R2ETestResult
+from r2e_test_server.testing.runner import R2ETestRunner, iter_tests
+
+
+# outcomes reused as long as the functions the test ran do not change
+REUSABLE_OUTCOMES = ("passed", "skipped", "expected_failure")
+
+SIMPLE_TYPES = (int, float, complex, str, bytes, bool, type(None))
+IGNORED_CLASS_ATTRIBUTES = ("__dict__", "__weakref__", "__doc__", "__firstlineno__")
+# values compared by identity (changes to these are not tracked), as are
+# decorated functions (with `__wrapped__`)
+IDENTITY_TYPES = (ModuleType, type, FunctionType, BuiltinFunctionType, MethodType)
+
+# values that cannot be fingerprinted get a new fingerprint every time
+_unknown_values = itertools.count()
+
+
+class R2ETestImpact:
+    """Test impact analysis: rerun only the tests affected by a change.
+
+    The first run records, for every test, its outcomes and its footprint:
+    the functions and methods of the module (keyed by their qualified name)
+    that ran during the test. The next runs rerun a test only if a function
+    of its footprint changed, or if it did not pass, and reuse the recorded
+    outcomes of the other tests.
+
+    A function changes if its code (ignoring the file and line numbers),
+    defaults or closure change, so re-executing the same definition is no
+    change. Any other change of the module's globals, or of the attributes
+    of its classes, reruns all the tests. Values are compared by content
+    (containers recursively, other objects by their pickle), and the ones
+    that cannot be pickled always count as changed.
+
+    Note: only the calls made in the thread running the tests are recorded
+    before python 3.12 (`sys.setprofile`), all threads with `sys.monitoring`.
+    """
+
+    def __init__(self):
+        self.fingerprints: Dict[str, str] = {}
+        self.module_name: Optional[str] = None
+        self.data_fingerprint: Optional[str] = None
+        self.code_keys: Dict[CodeType, str] = {}
+        self.code_fingerprints: Dict[CodeType, str] = {}
+        # {suite id: {test id: record}}
+        self.records: Dict[str, Dict[str, "_TestRecord"]] = {}
+
+    def update(self, module: ModuleType):
+        """Fingerprint the module and forget the records of the affected tests.
+
+        Call before the module is instrumented.
+        """
+        fingerprints, code_keys, data_fingerprint = self.fingerprint_module(module)
+
+        if data_fingerprint != self.data_fingerprint:
+            self.records = {}
+        else:
+            changed = {
+                key
+                for key in fingerprints.keys() | self.fingerprints.keys()
+                if fingerprints.get(key) != self.fingerprints.get(key)
+            }
+            for records in self.records.values():
+                for test_id, record in list(records.items()):
+                    if record.footprint & changed or not record.reusable:
+                        del records[test_id]
+
+        self.fingerprints = fingerprints
+        self.code_keys = code_keys
+        self.data_fingerprint = data_fingerprint
+
+    def run(self, test_idx: str, test_suite: TestSuite, runner: R2ETestRunner):
+        """Run the tests of a suite affected by the changes, reuse the others.
+
+        Returns:
+            Tuple[R2ETestResult, List, Dict]: the result of the run (of the
+            affected tests), and the errors and stats of the whole suite.
+        """
+        tests = list(iter_tests(test_suite))
+        records = self.records.setdefault(test_idx, {})
+
+        recorder = _FootprintRecorder(self.code_keys, runner.on_event)
+        runner.on_event = recorder.on_event
+        affected = TestSuite([test for test in tests if test.id() not in records])
+
+        recorder.start()
+        try:
+            result, _, _ = runner.run(affected)
+        finally:
+            recorder.stop()
+
+        for test_id, record in recorder.records.items():
+            # calls outside of the tests (e.g., in setUpClass) count for all
+            record.footprint |= recorder.shared_footprint
+            records[test_id] = record
+        for test in result.not_run_tests:
+            outcome = (R2ETestResult.test_name(test), "not_run")
+            records[test.id()] = _TestRecord([outcome])
+
+        outcomes, errors = [], []
+        for test in tests:
+            record = records.get(test.id())
+            if record is not None:
+                outcomes += record.outcomes
+                errors += record.errors
+        return result, errors, R2ETestResult.build_stats(outcomes)
+
+    # fingerprints
+
+    def fingerprint_module(
+        self, module: ModuleType
+    ) -> Tuple[Dict[str, str], Dict[CodeType, str], str]:
+        """Fingerprint the functions of a module and the rest of its globals.
+
+        Returns:
+            Tuple[Dict[str, str], Dict[CodeType, str], str]: the fingerprint of
+            each function/method, the function/method of each code object and
+            the fingerprint of the rest of the module.
+        """
+        self.module_name = module.__name__
+        functions: Dict[str, FunctionType] = {}
+        data = []
+        for name, value in sorted(module.__dict__.items()):
+            if isinstance(value, FunctionType):
+                functions[name] = value
+            elif isinstance(value, type) and value.__module__ == module.__name__:
+                data.append((name, self.fingerprint_class(name, value, functions)))
+            else:
+                data.append((name, self.fingerprint_value(value)))
+
+        code_fingerprints, self.code_fingerprints = self.code_fingerprints, {}
+        fingerprints, code_keys = {}, {}
+        for key, function in functions.items():
+            fingerprints[key] = self.fingerprint_function(function, code_fingerprints)
+            for code in _iter_codes(function.__code__):
+                code_keys[code] = key
+
+        data_fingerprint = hashlib.sha1(repr(data).encode()).hexdigest()
+        return fingerprints, code_keys, data_fingerprint
+
+    def fingerprint_class(
+        self, name: str, class_obj: type, functions: Dict[str, FunctionType]
+    ) -> Any:
+        """Fingerprint the attributes of a class, adding its methods to `functions`."""
+        data: List[Any] = [[base.__qualname__ for base in class_obj.__bases__]]
+        for attr_name, value in sorted(vars(class_obj).items()):
+            kind = type(value).__name__
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            elif isinstance(value, property):
+                accessors = zip("gsd", (value.fget, value.fset, value.fdel))
+                for accessor, function in accessors:
+                    if isinstance(function, FunctionType):
+                        functions[f"{name}.{attr_name}.{accessor}"] = function
+                data.append((attr_name, kind))
+                continue
+
+            if isinstance(value, FunctionType):
+                functions[f"{name}.{attr_name}"] = value
+                data.append((attr_name, kind))
+            elif attr_name not in IGNORED_CLASS_ATTRIBUTES:
+                data.append((attr_name, self.fingerprint_value(value)))
+        return data
+
+    def fingerprint_function(
+        self, function: FunctionType, code_fingerprints: Dict[CodeType, str]
+    ) -> str:
+        closure = []
+        for cell in function.__closure__ or ():
+            try:
+                closure.append(cell.cell_contents)
+            except ValueError:
+                # an empty cell
+                closure.append(None)
+
+        kwdefaults = tuple(sorted((function.__kwdefaults__ or {}).items()))
+        data = (
+            self.fingerprint_code(function.__code__, code_fingerprints),
+            self.fingerprint_value(function.__defaults__),
+            self.fingerprint_value(kwdefaults),
+            self.fingerprint_value(tuple(closure)),
+        )
+        return hashlib.sha1(repr(data).encode()).hexdigest()
+
+    def fingerprint_code(
+        self, code: CodeType, code_fingerprints: Dict[CodeType, str]
+    ) -> str:
+        """Fingerprint a code object, ignoring its file and line numbers.
+
+        The fingerprints of the last update are reused, and kept for the next.
+        """
+        fingerprint = code_fingerprints.get(code) or self.code_fingerprints.get(code)
+        if fingerprint is None:
+            consts = tuple(
+                self.fingerprint_code(const, code_fingerprints)
+                if isinstance(const, CodeType)
+                else repr(const)
+                for const in code.co_consts
+            )
+            data = (
+                code.co_code,
+                consts,
+                code.co_names,
+                code.co_varnames,
+                code.co_freevars,
+                code.co_cellvars,
+                getattr(code, "co_exceptiontable", b""),
+                code.co_argcount,
+                getattr(code, "co_posonlyargcount", 0),
+                code.co_kwonlyargcount,
+                code.co_flags,
+            )
+            fingerprint = hashlib.sha1(repr(data).encode()).hexdigest()
+        self.code_fingerprints[code] = fingerprint
+        return fingerprint
+
+    def fingerprint_value(self, value: Any, seen: frozenset = frozenset()) -> str:
+        """Fingerprint a value by its content (`seen`: the enclosing containers)."""
+        if isinstance(value, SIMPLE_TYPES):
+            return repr(value)
+
+        kind = type(value).__qualname__
+        if isinstance(value, IDENTITY_TYPES) or hasattr(value, "__wrapped__"):
+            return f"{kind}@{id(value)}"
+        if id(value) in seen:
+            return f"{kind}@cycle"
+
+        seen = seen | {id(value)}
+        if isinstance(value, dict):
+            items = [
+                (self.fingerprint_value(key, seen), self.fingerprint_value(item, seen))
+                for key, item in value.items()
+            ]
+            return f"{kind}{items!r}"
+        if isinstance(value, (list, tuple, deque)):
+            items = [self.fingerprint_value(item, seen) for item in value]
+            return f"{kind}{items!r}"
+        if isinstance(value, (set, frozenset)):
+            items = sorted(self.fingerprint_value(item, seen) for item in value)
+            return f"{kind}{items!r}"
+
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            # a global of another module (e.g., imported from it) is out of scope
+            owner = sys.modules.get(type(value).__module__)
+            if owner is not None and owner.__name__ != self.module_name:
+                if any(item is value for item in vars(owner).values()):
+                    return f"{kind}@{id(value)}"
+            return f"{kind}@unknown{next(_unknown_values)}"
+        return f"{kind}:{hashlib.sha1(data).hexdigest()}"
+
+
+class _TestRecord:
+    """The outcomes (of the test and its subtests) and footprint of a test."""
+
+    def __init__(self, outcomes: Optional[List[Tuple[str, str]]] = None):
+        self.outcomes: List[Tuple[str, str]] = outcomes or []
+        self.errors: List[Dict] = []
+        self.footprint: Set[str] = set()
+
+    @property
+    def reusable(self) -> bool:
+        return all(outcome in REUSABLE_OUTCOMES for _, outcome in self.outcomes)
+
+
+class _FootprintRecorder:
+    """Records the functions of the module that each test runs.
+
+    Args:
+        code_keys (Dict[CodeType, str]): the function of each code object.
+        on_event (Callable): passed the events of the tests, if any.
+    """
+
+    def __init__(
+        self,
+        code_keys: Dict[CodeType, str],
+        on_event: Optional[Callable[[Dict], None]] = None,
+    ):
+        self.code_keys = code_keys
+        self.forward_event = on_event
+        self.records: Dict[str, _TestRecord] = {}
+        self.shared_footprint: Set[str] = set()
+        self.footprint = self.shared_footprint
+        self.current: Optional[_TestRecord] = None
+        self.use_monitoring = False
+        self.previous_profile = None
+
+    def start(self):
+        monitoring = getattr(sys, "monitoring", None)
+        tool_id = getattr(monitoring, "PROFILER_ID", None)
+        if monitoring is not None and monitoring.get_tool(tool_id) is None:
+            monitoring.use_tool_id(tool_id, "r2e_test_impact")
+            monitoring.register_callback(
+                tool_id, monitoring.events.PY_START, self.on_py_start
+            )
+            for code in self.code_keys:
+                monitoring.set_local_events(tool_id, code, monitoring.events.PY_START)
+            self.use_monitoring = True
+        else:
+            self.previous_profile = sys.getprofile()
+            sys.setprofile(self.on_profile)
+
+    def stop(self):
+        if not self.use_monitoring:
+            sys.setprofile(self.previous_profile)
+            return
+
+        monitoring = getattr(sys, "monitoring")
+        tool_id = monitoring.PROFILER_ID
+        for code in self.code_keys:
+            monitoring.set_local_events(tool_id, code, 0)
+        monitoring.register_callback(tool_id, monitoring.events.PY_START, None)
+        monitoring.free_tool_id(tool_id)
+        self.use_monitoring = False
+
+    def on_event(self, event: Dict):
+        if event["event"] == "start":
+            self.current = self.records[event["id"]] = _TestRecord()
+            self.footprint = self.current.footprint
+        elif event["event"] == "stop":
+            self.current = None
+            self.footprint = self.shared_footprint
+        elif event["event"] == "outcome" and self.current is not None:
+            # subtests report to the test running them
+            self.current.outcomes.append((event["name"], event["outcome"]))
+            if event["error"] is not None:
+                self.current.errors.append(event["error"])
+
+        if self.forward_event is not None:
+            self.forward_event(event)
+
+    def on_py_start(self, code: CodeType, instruction_offset: int):
+        self.footprint.add(self.code_keys[code])
+
+    def on_profile(self, frame, event: str, arg):
+        if event == "call":
+            key = self.code_keys.get(frame.f_code)
+            if key is not None:
+                self.footprint.add(key)
+
+
+def _iter_codes(code: CodeType):
+    """A code object and the code objects nested in it (lambdas, inner functions)."""
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            yield from _iter_codes(const)
@@ -1,4 +1,6 @@
-from typing import Any, Dict, List, Tuple
+import functools
+from types import CodeType
+from typing import Any, Dict, List, Tuple, Union
 from unittest import TestLoader, TestSuite, TestCase
 
 from r2e_test_server.testing.cleaner import R2ETestCleaner
@@ -26,19 +28,14 @@ class R2ETestLoader:
     ) -> TestSuite:
         """Load a test case into a test suite and add it to the namespace."""
 
-        for funclass_name in funclass_names:
-            ref_name = f"reference_{funclass_name}"
-
-            try:
-                test_case = R2ETestCleaner.clean_test_case(
-                    test_case, funclass_name, ref_name
-                )
-            except Exception as e:
-                print("[ERROR] Could not load test case!")
-                raise
+        try:
+            compiled_test = R2ETestLoader.compile_test(test_case, tuple(funclass_names))
+        except Exception as e:
+            print("[ERROR] Could not load test case!")
+            raise
 
         try:
-            R2ETestLoader.add_test_to_namespace(test_case, nspace)
+            R2ETestLoader.add_test_to_namespace(compiled_test, nspace)
 
             test_suite, test_classes = R2ETestLoader.create_test_suite(nspace)
             R2ETestLoader.clean_namespace(nspace, test_classes)
@@ -48,7 +45,21 @@ class R2ETestLoader:
         return test_suite
 
     @staticmethod
-    def add_test_to_namespace(test_case: str, nspace: Dict[str, Any]):
+    @functools.lru_cache(maxsize=256)
+    def compile_test(test_case: str, funclass_names: Tuple[str, ...]) -> CodeType:
+        """Clean and compile a test case.
+
+        Cached by test case and funclass names, as the same tests are often resubmitted.
+        """
+        names = []
+        for funclass_name in funclass_names:
+            names += [funclass_name, f"reference_{funclass_name}"]
+
+        cleaned_tree = R2ETestCleaner.clean_test_tree(test_case, names)
+        return compile(cleaned_tree, "<string>", "exec")
+
+    @staticmethod
+    def add_test_to_namespace(test_case: Union[str, CodeType], nspace: Dict[str, Any]):
         """Add the test case to the namespace."""
         exec(test_case, nspace, nspace)
 
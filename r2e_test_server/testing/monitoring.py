@@ -0,0 +1,300 @@
+import os
+import sys
+import ast
+import dis
+from bisect import bisect_left
+from types import CodeType
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import coverage
+from coverage.parser import PythonParser
+
+
+# sys.monitoring (python 3.12+), None before
+monitoring: Any = getattr(sys, "monitoring", None)
+
+# unconditional jumps, followed to find where a branch leads
+JUMP_OPS = ("JUMP_FORWARD", "JUMP_BACKWARD", "JUMP_BACKWARD_NO_INTERRUPT", "JUMP")
+RETURN_OPS = ("RETURN_VALUE", "RETURN_CONST")
+# conditional jumps (and other branches), where the BRANCH event of the jump decides
+BRANCH_OPCODES = frozenset(dis.hasjrel + dis.hasjabs)
+
+# instructions followed from a branch destination before giving up
+MAX_RESOLVE_STEPS = 32
+
+
+class R2EMonitoringCoverage(object):
+    """Line and branch coverage of a file using `sys.monitoring` (python 3.12+).
+
+    Much cheaper than coverage.py's trace function: only the code objects
+    of the file (and, if given, in the spans of the functions under test)
+    get LINE and BRANCH events, every line event is disabled after its
+    first hit and every branch once the targets that the lines run cannot
+    tell were taken (e.g., the body of a loop can only be reached from the
+    loop, so a loop without `break` is disabled at its first event).
+
+    The measured arcs are handed to coverage.py for the analysis (see
+    `get_coverage`), so the reports match the coverage.py backend.
+
+    Note: all the threads are measured, as with coverage.py, and only one
+    measurement can run at a time in a process.
+
+    Args:
+        file_path (str): the file to measure.
+        spans (List[Tuple[int, int]]): line spans of the functions to measure,
+            the whole file if None.
+    """
+
+    def __init__(self, file_path: str, spans: Optional[List[Tuple[int, int]]] = None):
+        self.file_path = os.path.abspath(file_path)
+        self.spans = spans
+
+        parser = PythonParser(filename=file_path)
+        parser.parse_source()
+        self.parser = parser
+        arcs = parser.arcs()
+        self.exits: Dict[int, int] = {
+            from_line: to_line for from_line, to_line in arcs if to_line < 0
+        }
+
+        targets: Dict[int, Set[int]] = defaultdict(set)
+        for from_line, to_line in arcs:
+            targets[from_line].add(to_line)
+        self.implied_targets = self.get_implied_targets(ast.parse(parser.text), targets)
+        # the targets of each branch line that only BRANCH events can tell
+        self.needed_targets: Dict[int, Set[int]] = {
+            line: targets[line] - self.implied_targets.get(line, set())
+            for line, count in parser.exit_counts().items()
+            if count > 1
+        }
+
+        self.lines: Set[int] = set()
+        self.arcs: Set[Tuple[int, int]] = set()
+        self.branches: Dict[Tuple[CodeType, int], Set[int]] = {}
+        self.branch_targets: Dict[Tuple[CodeType, int], Set[int]] = {}
+        self.instructions: Dict[CodeType, Tuple[List[int], List[dis.Instruction]]] = {}
+        self.monitored_codes: List[CodeType] = []
+
+    @staticmethod
+    def available() -> bool:
+        """Check if the interpreter supports the backend and its tool id is free."""
+        return (
+            monitoring is not None
+            and monitoring.get_tool(monitoring.COVERAGE_ID) is None
+        )
+
+    def start(self):
+        tool_id = monitoring.COVERAGE_ID
+
+        # raises ValueError if the tool id is in use
+        monitoring.use_tool_id(tool_id, "r2e_coverage")
+
+        # re-enable the events disabled by a previous measurement
+        monitoring.restart_events()
+        monitoring.register_callback(tool_id, monitoring.events.PY_START, self.on_start)
+        monitoring.register_callback(tool_id, monitoring.events.LINE, self.on_line)
+        monitoring.register_callback(tool_id, monitoring.events.BRANCH, self.on_branch)
+        monitoring.set_events(tool_id, monitoring.events.PY_START)
+
+    def stop(self):
+        tool_id = monitoring.COVERAGE_ID
+
+        monitoring.set_events(tool_id, 0)
+        for code in self.monitored_codes:
+            monitoring.set_local_events(tool_id, code, 0)
+        for event in (
+            monitoring.events.PY_START,
+            monitoring.events.LINE,
+            monitoring.events.BRANCH,
+        ):
+            monitoring.register_callback(tool_id, event, None)
+        monitoring.free_tool_id(tool_id)
+
+        self.monitored_codes = []
+        self.instructions.clear()
+
+    def get_coverage(self) -> coverage.Coverage:
+        """A coverage.py measurement (in memory) holding the measured arcs."""
+        executed_lines = self.parser.translate_lines(self.lines)
+
+        # NOTE: lines are recorded as arcs entering the line,
+        # coverage.py derives the executed lines from the arcs
+        arcs = set(self.arcs)
+        arcs.update((-line, line) for line in self.lines)
+        for from_line, to_lines in self.implied_targets.items():
+            if from_line in executed_lines:
+                arcs.update(
+                    (from_line, to_line)
+                    for to_line in to_lines
+                    if to_line in executed_lines
+                )
+
+        cov = coverage.Coverage(data_file=None, include=[self.file_path], branch=True)
+        cov.get_data().add_arcs({self.file_path: arcs})
+        return cov
+
+    # events
+
+    def on_start(self, code: CodeType, instruction_offset: int):
+        if self.should_monitor(code):
+            monitoring.set_local_events(
+                monitoring.COVERAGE_ID,
+                code,
+                monitoring.events.LINE | monitoring.events.BRANCH,
+            )
+            self.monitored_codes.append(code)
+
+        # the local events (if any) take over
+        return monitoring.DISABLE
+
+    def on_line(self, code: CodeType, line_number: int):
+        self.lines.add(line_number)
+        return monitoring.DISABLE
+
+    def on_branch(self, code: CodeType, instruction_offset: int, destination_offset: int):
+        key = (code, instruction_offset)
+        destinations = self.branches.setdefault(key, set())
+        if destination_offset in destinations:
+            return None
+        destinations.add(destination_offset)
+
+        arc = self.resolve_branch(code, instruction_offset, destination_offset)
+        if arc is None:
+            # both directions of the branch were taken
+            return monitoring.DISABLE if len(destinations) > 1 else None
+        self.arcs.add(arc)
+
+        from_line = self.parser.first_line(arc[0])
+        to_line = arc[1] if arc[1] < 0 else self.parser.first_line(arc[1])
+        seen_targets = self.branch_targets.setdefault(key, set())
+        seen_targets.add(to_line)
+
+        needed_targets = self.needed_targets.get(from_line)
+        if needed_targets is None or needed_targets <= seen_targets:
+            return monitoring.DISABLE
+        return None
+
+    # helpers
+
+    @staticmethod
+    def get_implied_targets(
+        tree: ast.AST, targets: Dict[int, Set[int]]
+    ) -> Dict[int, Set[int]]:
+        """Targets of branch lines that can only be reached from the branch.
+
+        These are the first line of the body/else of an `if` or a loop, and
+        the statement after a loop without `break`. Running such a target
+        implies the arc from the branch.
+
+        Returns:
+            Dict[int, Set[int]]: the implied targets of each branch line.
+        """
+        implied: Dict[int, Set[int]] = {}
+        for node in ast.walk(tree):
+            for field in ("body", "orelse", "finalbody"):
+                statements = getattr(node, field, None)
+                if not isinstance(statements, list):
+                    continue
+
+                for index, statement in enumerate(statements):
+                    if not isinstance(statement, (ast.If, ast.For, ast.While)):
+                        continue
+
+                    lines = {statement.body[0].lineno}
+                    if statement.orelse:
+                        lines.add(statement.orelse[0].lineno)
+                    elif (
+                        not isinstance(statement, ast.If)
+                        and index + 1 < len(statements)
+                        and not _has_break(statement)
+                    ):
+                        lines.add(statements[index + 1].lineno)
+
+                    lines &= targets.get(statement.lineno, set())
+                    if lines:
+                        implied[statement.lineno] = lines
+        return implied
+
+    def should_monitor(self, code: CodeType) -> bool:
+        if os.path.abspath(code.co_filename) != self.file_path:
+            return False
+        if self.spans is None:
+            return True
+        return any(first <= code.co_firstlineno <= last for first, last in self.spans)
+
+    def resolve_branch(
+        self, code: CodeType, instruction_offset: int, destination_offset: int
+    ) -> Optional[Tuple[int, int]]:
+        """Map a branch (between instructions) to an arc between lines.
+
+        The destination of a branch is often on the same line as the branch
+        (e.g., the loop variable of a `for`, a jump back to the loop), so the
+        instructions are followed to the first one on another line, or to
+        a return (an exit arc, as in coverage.py). None if another branch
+        comes first, the event of that branch tells where it goes.
+        """
+        offsets, instructions = self.get_instructions(code)
+        from_line = self.get_line(code, offsets, instructions, instruction_offset)
+        if from_line is None:
+            return None
+
+        index = bisect_left(offsets, destination_offset)
+        for _ in range(MAX_RESOLVE_STEPS):
+            if index >= len(instructions):
+                break
+            instruction = instructions[index]
+            line = instruction.positions.lineno if instruction.positions else None
+
+            if line is not None and line != from_line:
+                return from_line, line
+            if instruction.opname in RETURN_OPS:
+                exit_line = self.exits.get(self.parser.first_line(from_line))
+                return None if exit_line is None else (from_line, exit_line)
+            if instruction.opname in JUMP_OPS:
+                index = bisect_left(offsets, instruction.argval)
+            elif instruction.opcode in BRANCH_OPCODES:
+                # e.g., the patterns of a `case`, the conditions of an `and`
+                return None
+            else:
+                index += 1
+
+        return None
+
+    def get_instructions(self, code: CodeType):
+        if code not in self.instructions:
+            instructions = list(dis.get_instructions(code))
+            offsets = [instruction.offset for instruction in instructions]
+            self.instructions[code] = (offsets, instructions)
+        return self.instructions[code]
+
+    @staticmethod
+    def get_line(
+        code: CodeType,
+        offsets: List[int],
+        instructions: List[dis.Instruction],
+        offset: int,
+    ) -> Optional[int]:
+        index = bisect_left(offsets, offset)
+        if index >= len(instructions):
+            return None
+        positions = instructions[index].positions
+        return positions.lineno if positions else None
+
+
+def _has_break(loop: ast.AST) -> bool:
+    """Check if a `break` exits the loop (not a nested one)."""
+    nodes = list(loop.body)  # type: ignore
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Break):
+            return True
+        if isinstance(
+            node,
+            (ast.For, ast.AsyncFor, ast.While, ast.FunctionDef, ast.AsyncFunctionDef),
+        ):
+            # breaks in the else of a nested loop still exit this loop
+            nodes.extend(getattr(node, "orelse", []))
+            continue
+        nodes.extend(ast.iter_child_nodes(node))
+    return False
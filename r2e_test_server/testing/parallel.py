@@ -0,0 +1,359 @@
+import sys
+import json
+import time
+import signal
+import coverage
+import multiprocessing
+from io import StringIO
+from unittest import TestSuite
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from r2e_test_server.capture import CaptureOutput
+from r2e_test_server.testing.result import R2ETestResult
+from r2e_test_server.testing.runner import R2ETestLimits, R2ETestRunner, iter_tests
+from r2e_test_server.instrument.arguments import CaptureArgsInstrumenter, Serializers
+
+
+# seconds a test may overrun its timeout before its process is killed
+KILL_GRACE_PERIOD = 1.0
+
+
+class R2EParallelRunner:
+    """Run independent test suites concurrently, each in a forked process.
+
+    The forked processes inherit the loaded tests and the (instrumented)
+    FUT module. Each process records the coverage of its suite in its own
+    data file (`data_file` + a unique suffix), for the caller to combine with
+    `Coverage.combine`. No coverage is recorded if `data_file` is None.
+
+    The processes report the progress of their tests, so a process that
+    goes over its limits is killed and its suite still gets results: the
+    tests that did not finish are reported as timeouts.
+
+    With `fail_fast`, the first failing test stops the whole run: the other
+    processes are killed and their unfinished tests, like the tests of the
+    suites not started yet, are reported as `not_run`.
+
+    Args:
+        num_processes (int): maximum number of suites running at a time.
+        data_file (str): base name of the coverage data files, if any.
+        include (List[str]): files to measure the coverage of.
+        limits (R2ETestLimits): timeouts and resource limits of the tests.
+        fail_fast (bool): stop at the first failure/error/timeout.
+    """
+
+    def __init__(
+        self,
+        num_processes: int,
+        data_file: Optional[str],
+        include: List[str],
+        limits: Optional[R2ETestLimits] = None,
+        fail_fast: bool = False,
+    ):
+        self.num_processes = num_processes
+        self.data_file = data_file
+        self.include = include
+        self.limits = limits or R2ETestLimits()
+        self.fail_fast = fail_fast
+        self.ctx = multiprocessing.get_context("fork")
+
+    def run(
+        self,
+        test_suites: Dict[str, TestSuite],
+        instrumenter: Optional[CaptureArgsInstrumenter] = None,
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+    ) -> Dict[str, Tuple[List, Dict]]:
+        """Run the test suites.
+
+        Args:
+            on_event (Callable): called with the suite id and every event
+                of its tests, as the processes report them.
+
+        Returns:
+            Dict[str, Tuple[List, Dict]]: `{test_id: (errors, stats)}` for each suite.
+
+        Note: the output of the suites is written to this process' stdout/stderr
+        and their captured arguments are added to the `instrumenter`.
+        """
+        results: Dict[str, Tuple[List, Dict]] = {}
+        pending = list(test_suites.items())
+        running: Dict[Any, _SuiteProcess] = {}
+        failed = False
+
+        while pending or running:
+            while pending and len(running) < self.num_processes:
+                test_id, test_suite = pending.pop(0)
+                reader, writer = self.ctx.Pipe(duplex=False)
+                process = self.ctx.Process(
+                    target=self.run_suite, args=(writer, test_suite, instrumenter)
+                )
+                process.start()
+                writer.close()
+                running[reader] = _SuiteProcess(test_id, test_suite, process)
+
+            for reader in wait(list(running), timeout=self.next_deadline(running)):
+                suite_process = running[reader]
+                if self.receive(reader, suite_process, instrumenter, on_event):
+                    del running[reader]
+                    results[suite_process.test_id] = suite_process.results()
+                    failed = failed or not results[suite_process.test_id][1]["valid"]
+                failed = failed or suite_process.failed
+
+            now = time.monotonic()
+            for reader, suite_process in list(running.items()):
+                if suite_process.deadline(self.limits) <= now:
+                    self.stop_suite(reader, suite_process, instrumenter, on_event)
+                    del running[reader]
+                    results[suite_process.test_id] = suite_process.results()
+                    failed = True
+
+            if self.fail_fast and failed:
+                for reader, suite_process in list(running.items()):
+                    if suite_process.failed:
+                        # stops by itself, right after its failing test
+                        continue
+                    self.stop_suite(
+                        reader, suite_process, instrumenter, on_event, cancel=True
+                    )
+                    del running[reader]
+                    results[suite_process.test_id] = suite_process.results()
+
+                runner = R2ETestRunner()
+                for test_id, test_suite in pending:
+                    _, err, stats = runner.not_run(test_suite)
+                    results[test_id] = (err, stats)
+                pending.clear()
+
+        # keep the order of the test suites
+        return {test_id: results[test_id] for test_id in test_suites}
+
+    def run_suite(
+        self,
+        conn,
+        test_suite: TestSuite,
+        instrumenter: Optional[CaptureArgsInstrumenter],
+    ):
+        """Run a test suite in the forked process and send back its results."""
+        self.limits.apply_resource_limits()
+        stdout_buffer, stderr_buffer = StringIO(), StringIO()
+
+        with CaptureOutput(stdout=stdout_buffer, stderr=stderr_buffer):
+            cov = None
+            if self.data_file is not None:
+                cov = coverage.Coverage(
+                    data_file=self.data_file,
+                    data_suffix=True,
+                    include=self.include,
+                    branch=True,
+                )
+                cov.start()
+            try:
+                runner = R2ETestRunner(
+                    failfast=self.fail_fast,
+                    test_timeout=self.limits.test_timeout,
+                    on_event=lambda event: conn.send(("event", event)),
+                )
+                _, err, stats = runner.run(test_suite)
+            finally:
+                if cov is not None:
+                    cov.stop()
+                    cov.save()
+
+        logs = instrumenter.get_logs() if instrumenter is not None else []
+        conn.send(
+            (
+                "done",
+                (
+                    err,
+                    stats,
+                    json.dumps(logs, default=Serializers.serialize_default),
+                    stdout_buffer.getvalue(),
+                    stderr_buffer.getvalue(),
+                ),
+            )
+        )
+        conn.close()
+
+    def receive(
+        self,
+        conn,
+        suite_process: "_SuiteProcess",
+        instrumenter: Optional[CaptureArgsInstrumenter],
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+    ) -> bool:
+        """Receive a message of a suite's process.
+
+        Returns:
+            bool: whether the process is done (or died).
+        """
+        try:
+            kind, message = conn.recv()
+        except (EOFError, OSError):
+            conn.close()
+            suite_process.process.join()
+            return True
+
+        if kind == "event":
+            suite_process.add_event(message)
+            if on_event is not None:
+                on_event(suite_process.test_id, message)
+            return False
+
+        conn.close()
+        suite_process.process.join()
+
+        err, stats, logs, output, error = message
+        suite_process.final_results = (err, stats)
+
+        sys.stdout.write(output)
+        sys.stderr.write(error)
+        if instrumenter is not None:
+            instrumenter.add_logs(json.loads(logs))
+
+        return True
+
+    def stop_suite(
+        self,
+        conn,
+        suite_process: "_SuiteProcess",
+        instrumenter: Optional[CaptureArgsInstrumenter],
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+        cancel: bool = False,
+    ):
+        """Kill the process of a suite (unless it is done).
+
+        Args:
+            cancel (bool): report the unfinished tests as not run,
+                instead of timeouts.
+        """
+        # the events still in the pipe tell which tests finished
+        done = False
+        while not done and conn.poll():
+            done = self.receive(conn, suite_process, instrumenter, on_event)
+        if not done:
+            suite_process.kill(cancel)
+            conn.close()
+
+    def next_deadline(self, running: Dict[Any, "_SuiteProcess"]) -> Optional[float]:
+        """Seconds until the first running suite goes over its limits, if any."""
+        deadlines = [
+            suite_process.deadline(self.limits) for suite_process in running.values()
+        ]
+        deadlines = [deadline for deadline in deadlines if deadline != float("inf")]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    @staticmethod
+    def crashed_suite_results(test_id: str, exitcode: Optional[int]) -> Tuple[List, Dict]:
+        """Results for a suite whose process died before reporting."""
+        stats = R2ETestResult(None, False, 0).get_stats()
+        stats["valid"] = False
+        err = [
+            {
+                "type": "ERROR",
+                "test": test_id,
+                "message": f"Test process exited with code {exitcode}",
+            }
+        ]
+        return err, stats
+
+
+class _SuiteProcess:
+    """A test suite running in a forked process, and the events it reported."""
+
+    def __init__(self, test_id: str, test_suite: TestSuite, process):
+        self.test_id = test_id
+        self.tests = list(iter_tests(test_suite))
+        self.process = process
+        self.start_time = time.monotonic()
+
+        self.outcomes: List[Tuple[str, str]] = []
+        self.errors: List[Dict] = []
+        self.stopped_tests = set()
+        self.current_test_start: Optional[float] = None
+
+        self.timed_out = False
+        self.cancelled = False
+        self.final_results: Optional[Tuple[List, Dict]] = None
+
+    def add_event(self, event: Dict):
+        if event["event"] == "start":
+            self.current_test_start = time.monotonic()
+        elif event["event"] == "stop":
+            self.current_test_start = None
+            self.stopped_tests.add(event["id"])
+        elif event["event"] == "outcome":
+            self.outcomes.append((event["name"], event["outcome"]))
+            if event["error"] is not None:
+                self.errors.append(event["error"])
+
+    @property
+    def failed(self) -> bool:
+        """Whether a test of the suite failed (so far)."""
+        return any(
+            outcome in ("failed", "errored", "timeout") for _, outcome in self.outcomes
+        )
+
+    def deadline(self, limits: R2ETestLimits) -> float:
+        """(Monotonic) time at which the process is killed."""
+        deadline = float("inf")
+        if limits.suite_timeout is not None:
+            deadline = self.start_time + limits.suite_timeout
+        if limits.test_timeout is not None and self.current_test_start is not None:
+            test_deadline = (
+                self.current_test_start + limits.test_timeout + KILL_GRACE_PERIOD
+            )
+            deadline = min(deadline, test_deadline)
+        return deadline
+
+    def kill(self, cancel: bool = False):
+        if cancel:
+            self.cancelled = True
+        else:
+            self.timed_out = True
+        self.process.kill()
+        self.process.join()
+
+    def results(self) -> Tuple[List, Dict]:
+        """The results of the suite, rebuilt from its events if the process died."""
+        if self.final_results is not None:
+            return self.final_results
+
+        exitcode = self.process.exitcode
+        if exitcode == -signal.SIGXCPU:
+            self.timed_out = True
+
+        if (
+            not self.stopped_tests
+            and not self.outcomes
+            and not self.timed_out
+            and not self.cancelled
+        ):
+            return R2EParallelRunner.crashed_suite_results(self.test_id, exitcode)
+
+        outcomes = list(self.outcomes)
+        errors = list(self.errors)
+        for test in self.tests:
+            if test.id() in self.stopped_tests:
+                continue
+            if self.cancelled:
+                outcomes.append((R2ETestResult.test_name(test), "not_run"))
+                continue
+            if self.timed_out:
+                outcomes.append((R2ETestResult.test_name(test), "timeout"))
+                message = "Test suite went over its time limit"
+            else:
+                outcomes.append((R2ETestResult.test_name(test), "errored"))
+                message = f"Test process exited with code {exitcode}"
+            errors.append(
+                {
+                    "type": "TIMEOUT" if self.timed_out else "ERROR",
+                    "test": str(test),
+                    "message": message,
+                }
+            )
+
+        return errors, R2ETestResult.build_stats(outcomes)
+
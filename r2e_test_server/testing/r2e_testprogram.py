@@ -1,19 +1,30 @@
 import os
 import ast
 import sys
-import json
+import time
 import coverage
+import tempfile
+import traceback
 import importlib
 import importlib.util
 from copy import deepcopy
-from typing import Any, Union, List, Dict, Optional, Tuple
+from functools import partial
+from typing import Any, Callable, Union, List, Dict, Mapping, Optional, Tuple
+from unittest import TestSuite
 from types import ModuleType, FunctionType
 
 
+from r2e_test_server.metrics import metrics
+from r2e_test_server.encoding import R2EResultEncoder
 from r2e_test_server.testing.loader import R2ETestLoader
-from r2e_test_server.testing.runner import R2ETestRunner
+from r2e_test_server.testing.impact import R2ETestImpact
+from r2e_test_server.testing.runner import R2ETestLimits, R2ETestRunner
+from r2e_test_server.testing.parallel import R2EParallelRunner
+from r2e_test_server.testing.monitoring import R2EMonitoringCoverage
 from r2e_test_server.ast.transformer import NameReplacer
-from r2e_test_server.testing.codecov import R2ECodeCoverage
+from r2e_test_server.testing.codecov import R2ECodeCoverage, R2EFileCoverage
+from r2e_test_server.modules.index import SourceIndex
+from r2e_test_server.modules.cache import fut_module_cache
 from r2e_test_server.modules.explorer import ModuleExplorer
 from r2e_test_server.instrument import Instrumenter, CaptureArgsInstrumenter
 
@@ -24,6 +35,22 @@ if sys.version_info < (3, 9):
     ast.unparse = lambda node: astor.to_source(node)
 
 
+# the fields of the submit results (and their keys)
+RESULT_FIELDS = {
+    "tests": "run_tests_logs",
+    "errors": "run_tests_errors",
+    "coverage": "coverage_logs",
+    "captured_args": "captured_arg_logs",
+}
+
+# the globals that are restored by value (see `R2ETestProgram.snapshotEnv`)
+MUTABLE_TYPES = (list, dict, set)
+
+# the globals of fut_module, the attributes of its classes, and copies of the
+# mutable globals
+EnvSnapshot = Tuple[Dict[str, Any], Dict[type, Dict[str, Any]], Dict[str, Any]]
+
+
 class R2ETestProgram(object):
     """A program that runs tests in the R2E framework.
 
@@ -43,10 +70,7 @@ class R2ETestProgram(object):
     ):
         ## file_path should be relative to repo_path
         self.repo_id = repo_id
-        if repo_id is None:
-            self.repo_path = os.path.abspath(repo_path)
-        else:
-            self.repo_path = f"/repos/{repo_id}"
+        self.repo_path = self.resolve_repo_path(repo_id, repo_path)
         self.funclass_names = funclass_names
         self.file_path = os.path.join(self.repo_path, file_path)
         self.generated_tests = generated_tests
@@ -54,19 +78,42 @@ class R2ETestProgram(object):
 
         with open(self.file_path, "r") as file:
             self.orig_file_content = file.read()
-            self.orig_file_ast = ast.parse(self.orig_file_content)
+
+        # parsed once, shared by refs, codegen mode and coverage
+        self.source_index = SourceIndex.get(self.file_path, self.orig_file_content)
+        self.orig_file_ast = self.source_index.tree
 
         # setup the env for testing
         # creates: fut_module and fut_module_deps
-        self.setupEnv()
+        with metrics.phase("import"):
+            self.setupEnv()
 
         # setup reference function
         # creates: ref_function(s) in fut_module
-        self.setupRefs()
+        with metrics.phase("refs"):
+            self.setupRefs()
 
         # removes the funclasses from fut_module if codegen_mode
         self.setup_codegen_mode()
 
+        # snapshot of the prepared env, to `reset` to without re-importing
+        self.init_snapshot = self.snapshotEnv()
+
+        # whether the results of the last submit (of each candidate of the
+        # last batch) can be reused, see `is_reproducible`
+        self.last_submit_reproducible = False
+        self.last_batch_reproducible: List[bool] = []
+
+        # footprints and outcomes of the tests, for incremental submits
+        self.test_impact = R2ETestImpact()
+
+    @staticmethod
+    def resolve_repo_path(repo_id: Optional[str], repo_path: str) -> str:
+        """The path of the repo: `repo_path` for local repos, else under /repos."""
+        if repo_id is None:
+            return os.path.abspath(repo_path)
+        return f"/repos/{repo_id}"
+
     def setupEnv(self):
         """Setup the environment for testing.
 
@@ -85,7 +132,7 @@ class R2ETestProgram(object):
     def setupRefs(self):
         """Creates a reference/oracle for testing.
 
-        reference is a deep copy of the code under test.
+        reference is a renamed copy of the code under test.
         exec()s to load reference function into the environment.
         """
         for funclass_name in self.funclass_names:
@@ -98,8 +145,12 @@ class R2ETestProgram(object):
             ref_name = f"reference_{funclass_name}"
             orig_ast = self.get_funclass_ast(funclass_name)
 
-            temp = deepcopy(orig_ast)
-            temp.name = ref_name
+            # re-parsing the FUT's own source is much cheaper than a deepcopy
+            try:
+                temp = ast.parse(self.source_index.get_source(funclass_name)).body[0]
+            except SyntaxError:
+                temp = deepcopy(orig_ast)
+            temp.name = ref_name  # type: ignore
             new_ast = ast.Module(body=[temp], type_ignores=[])
 
             new_ast = NameReplacer(new_ast, funclass_name, ref_name).transform()
@@ -118,36 +169,258 @@ class R2ETestProgram(object):
                     if class_obj:
                         delattr(self.fut_module, class_name)
                 else:
-                    funclass_object = self.get_funclass_object(funclass_name)
-                    if funclass_object and not isinstance(funclass_object, type):
+                    funclass_node = self.get_funclass_ast(funclass_name)
+                    if not isinstance(funclass_node, ast.ClassDef):
                         delattr(self.fut_module, funclass_name)
 
-    def submit(self) -> str:
+    def submit(
+        self,
+        num_processes: int = 0,
+        test_timeout: Optional[float] = None,
+        suite_timeout: Optional[float] = None,
+        cpu_limit: Optional[int] = None,
+        memory_limit: Optional[int] = None,
+        coverage_backend: str = "auto",
+        capture_mode: str = "all",
+        capture_limit: int = 10,
+        capture_max_bytes: int = 64 * 1024 * 1024,
+        capture_max_entries: int = 100_000,
+        encoder: Optional[R2EResultEncoder] = None,
+        fields: Optional[List[str]] = None,
+        fail_fast: bool = False,
+        on_event: Optional[Callable[[Dict], None]] = None,
+        incremental: bool = False,
+    ) -> Union[str, bytes]:
         """Submit the function/method under test to the R2E test framework.
 
+        Args:
+            num_processes (int): if > 0, run the test suites concurrently
+                in (up to) this many forked processes.
+            test_timeout (float): wall-clock seconds allowed for each test.
+            suite_timeout (float): wall-clock seconds allowed for each test suite.
+            cpu_limit (int): CPU seconds allowed for each test suite.
+            memory_limit (int): address space (in bytes) allowed for each test suite.
+            coverage_backend (str): "coverage" (coverage.py), "monitoring"
+                (sys.monitoring, python 3.12+) or "auto" (monitoring if available).
+            capture_mode (str): which calls of the FUT have their arguments
+                captured: "off", "first" (`capture_limit` calls per function),
+                "sample" (`capture_limit` random calls per function) or "all".
+            capture_limit (int): number of captured calls per function.
+            capture_max_bytes (int): memory budget of the captured calls,
+                beyond which they are spilled to a temporary file.
+            capture_max_entries (int): maximum number of captured calls.
+            encoder (R2EResultEncoder): encoding of the results,
+                indented JSON if None.
+            fields (List[str]): the fields of the results ("tests", "errors",
+                "coverage", "captured_args"), all if None. The coverage is
+                not measured and the arguments not captured unless requested.
+            fail_fast (bool): stop the tests (of all suites) at the first
+                failure/error/timeout, the rest are reported as not run.
+            on_event (Callable): called as soon as each test finishes, with
+                its suite ("test_id"), "name", "outcome", "duration" and
+                "error" (None if it passed).
+            incremental (bool): only rerun the tests affected by the changes
+                of fut_module since the last incremental submit, reusing the
+                outcomes of the others (see `R2ETestImpact`). The coverage and
+                the captured arguments then only cover the rerun tests.
+                Requires running the tests in this process (no processes or limits).
+
         Returns:
-            str: JSON string containing the test results.
-        """
-        # instrument code and build namespace
-        instrumenter = CaptureArgsInstrumenter()
-        self.instrumentCode(instrumenter)
+            Union[str, bytes]: the encoded test results.
 
-        # build namespace
-        nspace = self.buildNamespace()
+        Note: fut_module is restored to its state before the submit afterwards,
+        so the instrumentation (and the tests' side effects) do not pile up.
+        """
+        fields = list(RESULT_FIELDS) if fields is None else fields
+        unknown_fields = set(fields) - set(RESULT_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Unknown result fields: {sorted(unknown_fields)}")
+        if "captured_args" not in fields:
+            capture_mode = "off"
+
+        limits = R2ETestLimits(test_timeout, suite_timeout, cpu_limit, memory_limit)
+        if incremental and (num_processes > 0 or limits.enabled):
+            raise ValueError("Incremental submits cannot use processes or limits")
+
+        stream = None if on_event is None else partial(stream_outcome, on_event)
+        snapshot = self.snapshotEnv()
+        # the tests may import it, another program may have taken the slot
+        sys.modules["fut_module"] = self.fut_module
 
-        # run tests
-        run_tests_errors, run_tests_logs, codecovs = self.runTests(nspace=nspace)
-        captured_arg_logs = instrumenter.get_logs()
-        coverage_logs = [codecov.report_coverage() for codecov in codecovs]
+        try:
+            # fingerprinted before the instrumentation wraps the functions
+            if incremental:
+                self.test_impact.update(self.fut_module)
+
+            # instrument code and build namespace
+            instrumenter = CaptureArgsInstrumenter(
+                capture_mode,
+                capture_limit,
+                max_bytes=capture_max_bytes,
+                max_entries=capture_max_entries,
+            )
+            if capture_mode != "off":
+                self.instrumentCode(instrumenter)
+
+            # build namespace
+            nspace = self.buildNamespace()
+
+            # run tests
+            run_tests_errors, run_tests_logs, codecovs = self.runTests(
+                nspace=nspace,
+                num_processes=num_processes,
+                instrumenter=instrumenter,
+                limits=limits,
+                coverage_backend=coverage_backend,
+                measure_coverage="coverage" in fields,
+                fail_fast=fail_fast,
+                on_event=stream,
+                impact=self.test_impact if incremental else None,
+            )
+            # read from the instrumenter's store while the result is encoded
+            captured_arg_logs = instrumenter.get_log_lines()
+            with metrics.phase("coverage"):
+                coverage_logs = [codecov.report_coverage() for codecov in codecovs]
+        finally:
+            self.restoreEnv(snapshot)
 
+        self.last_submit_reproducible = self.is_reproducible(run_tests_logs)
         result = {
             "run_tests_logs": run_tests_logs,
             "run_tests_errors": run_tests_errors,
             "coverage_logs": coverage_logs,
             "captured_arg_logs": captured_arg_logs,
         }
+        result = {
+            key: result[key] for field, key in RESULT_FIELDS.items() if field in fields
+        }
+
+        try:
+            with metrics.phase("serialize"):
+                return (encoder or R2EResultEncoder()).encode(result)
+        finally:
+            instrumenter.close()
+
+    def submit_batch(
+        self,
+        candidates: List[str],
+        encoder: Optional[R2EResultEncoder] = None,
+        **options,
+    ) -> List[Union[str, bytes]]:
+        """Submit several candidate implementations of the function/method under test.
+
+        The FUT module and references are loaded once. Each candidate is
+        exec()d into fut_module, starting from the state before the batch.
+
+        Args:
+            candidates (List[str]): source code of the candidates.
+            encoder (R2EResultEncoder): encoding of the results,
+                indented JSON if None.
+            options: options for each `submit`.
+
+        Returns:
+            List[Union[str, bytes]]: the encoded test results of each candidate.
+        """
+        encoder = encoder or R2EResultEncoder()
+        snapshot = self.snapshotEnv()
+
+        results = []
+        reproducible = []
+        for candidate in candidates:
+            self.restoreEnv(snapshot)
+            try:
+                self.compile_and_exec(candidate.strip())
+                results.append(self.submit(encoder=encoder, **options))
+                reproducible.append(self.last_submit_reproducible)
+            except Exception as e:
+                traceback_message = traceback.format_exc()
+                error = f"Error: {traceback_message}\n\nSmall Error: {repr(e)}"
+                results.append(encoder.encode({"error": error}))
+                reproducible.append(True)
+
+        self.restoreEnv(snapshot)
+        self.last_batch_reproducible = reproducible
+        return results
+
+    @staticmethod
+    def is_reproducible(run_tests_logs: Dict[str, Dict]) -> bool:
+        """Whether the same submit would get the same test results.
+
+        Not if a test timed out or errored, or if the process of a suite died:
+        these may depend on the load of the machine rather than on the FUT.
+        """
+        return all(
+            stats["timeout_count"] == 0
+            and stats["errored_count"] == 0
+            # a suite whose process died before reporting has no outcomes
+            and (stats["valid"] or stats["failed_count"] or stats["not_run_count"])
+            for stats in run_tests_logs.values()
+        )
+
+    def reset(self):
+        """Reset fut_module to its state right after the program was set up."""
+        self.restoreEnv(self.init_snapshot)
+
+    def snapshotEnv(self) -> EnvSnapshot:
+        """Take a snapshot of the state of fut_module.
+
+        Covers the module's globals and the attributes of the classes defined
+        in it, which is what `compile_and_exec`, `instrumentCode` and the tests mutate.
+        The contents of the list, dict and set globals are deep copied, so a FUT
+        that appends to a global (e.g., `SEEN.append(x)`) sees it as it was on
+        every submit. Other mutable objects, and containers that cannot be deep
+        copied, are only restored to the same object.
+        """
+        module_dict = dict(self.fut_module.__dict__)
+        class_dicts = {
+            obj: dict(vars(obj))
+            for obj in module_dict.values()
+            if isinstance(obj, type) and obj.__module__ == self.fut_module.__name__
+        }
 
-        return json.dumps(result, indent=4)
+        # one memo: the copies share what the globals share
+        memo: Dict[int, Any] = {}
+        copies = {}
+        for name, value in module_dict.items():
+            # not __builtins__ (a dict), or the other globals set by Python
+            if isinstance(value, MUTABLE_TYPES) and not name.startswith("__"):
+                try:
+                    copies[name] = deepcopy(value, memo)
+                except Exception:
+                    pass
+        return module_dict, class_dicts, copies
+
+    def restoreEnv(self, snapshot: EnvSnapshot):
+        """Restore fut_module to the state of a snapshot from `snapshotEnv`."""
+        module_dict, class_dicts, copies = snapshot
+
+        for class_obj, class_dict in class_dicts.items():
+            for name in set(vars(class_obj)) - set(class_dict):
+                delattr(class_obj, name)
+            for name, value in class_dict.items():
+                if vars(class_obj).get(name) is not value:
+                    setattr(class_obj, name, value)
+
+        # NOTE: update in place, the functions of the module hold this dict as globals
+        self.fut_module.__dict__.clear()
+        self.fut_module.__dict__.update(module_dict)
+
+        # refill the globals in place (other objects may refer to them) with
+        # fresh copies, the snapshot may be restored again
+        memo = {id(copy): module_dict[name] for name, copy in copies.items()}
+        for name, copy in copies.items():
+            value = module_dict[name]
+            if isinstance(value, list):
+                value[:] = [deepcopy(item, memo) for item in copy]
+            elif isinstance(value, dict):
+                value.clear()
+                value.update(
+                    (deepcopy(key, memo), deepcopy(item, memo))
+                    for key, item in copy.items()
+                )
+            else:
+                value.clear()
+                value.update(deepcopy(item, memo) for item in copy)
 
     def instrumentCode(self, instrumenter: Instrumenter):
         """Instrument the code under test.
@@ -183,42 +456,197 @@ class R2ETestProgram(object):
         nspace.update(self.fut_module.__dict__)
         return nspace
 
-    def runTests(self, nspace: Dict[str, Any]):
+    def runTests(
+        self,
+        nspace: Dict[str, Any],
+        num_processes: int = 0,
+        instrumenter: Optional[CaptureArgsInstrumenter] = None,
+        limits: Optional[R2ETestLimits] = None,
+        coverage_backend: str = "auto",
+        measure_coverage: bool = True,
+        fail_fast: bool = False,
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+        impact: Optional[R2ETestImpact] = None,
+    ):
         """Run tests for the function under test.
 
         Args:
             FUT (FunctionUnderTest): function under test.
             nspace (dict): namespace to run tests in.
+            num_processes (int): if > 0, run the test suites in forked processes.
+            instrumenter (CaptureArgsInstrumenter): collects the arguments
+                captured in the forked processes.
+            limits (R2ETestLimits): timeouts and resource limits of the tests.
+                Enforced in forked processes, so the suites always run in
+                (at least) one forked process when any limit is set.
+            coverage_backend (str): the coverage backend of the serial run,
+                the forked processes always use coverage.py.
+            measure_coverage (bool): whether to measure the coverage, no
+                coverage reports are returned otherwise.
+            fail_fast (bool): stop at the first failure/error/timeout of
+                any suite, the remaining tests are reported as not run.
+            on_event (Callable): called with the suite id and every event
+                of its tests (see `R2ETestResult.emit_event`).
+            impact (R2ETestImpact): if given, only the tests affected by the
+                changes are run (serial run only).
 
         """
-        test_suites, nspace = R2ETestLoader.load_tests(
-            self.generated_tests, self.funclass_names, nspace
-        )
-
-        cov = coverage.Coverage(include=[self.file_path], branch=True)
-        cov.start()
-        runner = R2ETestRunner()
+        with metrics.phase("load_tests"):
+            test_suites, nspace = R2ETestLoader.load_tests(
+                self.generated_tests, self.funclass_names, nspace
+            )
 
-        combined_stats = {}
-        combined_errors = {}
-        for test_idx, test_suite in test_suites.items():
-            _, err, stats = runner.run(test_suite)
-            combined_stats[test_idx] = stats
-            combined_errors[test_idx] = err
+        limits = limits or R2ETestLimits()
+        if limits.enabled:
+            num_processes = max(num_processes, 1)
+
+        run_start = time.perf_counter()
+        if num_processes > 0:
+            (
+                cov,
+                file_coverage,
+                combined_errors,
+                combined_stats,
+            ) = self.runTestsInProcesses(
+                test_suites,
+                num_processes,
+                instrumenter,
+                limits,
+                measure_coverage,
+                fail_fast,
+                on_event,
+            )
+        else:
+            cov = self.startCoverage(coverage_backend) if measure_coverage else None
+
+            combined_stats = {}
+            combined_errors = {}
+            stopped = False
+            for test_idx, test_suite in test_suites.items():
+                runner = R2ETestRunner(
+                    failfast=fail_fast,
+                    on_event=None if on_event is None else partial(on_event, test_idx),
+                )
+                if stopped:
+                    _, err, stats = runner.not_run(test_suite)
+                elif impact is not None:
+                    result, err, stats = impact.run(test_idx, test_suite, runner)
+                    stopped = result.shouldStop
+                else:
+                    result, err, stats = runner.run(test_suite)
+                    stopped = result.shouldStop
+                combined_stats[test_idx] = stats
+                combined_errors[test_idx] = err
+
+            file_coverage = None
+            if cov is not None:
+                cov.stop()
+                if isinstance(cov, R2EMonitoringCoverage):
+                    cov = cov.get_coverage()
+                file_coverage = R2EFileCoverage(cov, self.file_path)
+
+        metrics.observe(
+            "r2e_phase_duration_seconds",
+            time.perf_counter() - run_start,
+            phase="run_tests",
+        )
 
-        cov.stop()
-        cov.save()
+        if cov is None:
+            return combined_errors, combined_stats, []
 
         codecovs = [
-            R2ECodeCoverage(cov, self.fut_module, self.file_path, funclass_name)
+            R2ECodeCoverage(
+                cov,
+                self.fut_module,
+                self.file_path,
+                funclass_name,
+                self.source_index,
+                file_coverage,
+            )
             for funclass_name in self.funclass_names
         ]
 
         return combined_errors, combined_stats, codecovs
 
+    def runTestsInProcesses(
+        self,
+        test_suites: Dict[str, TestSuite],
+        num_processes: int,
+        instrumenter: Optional[CaptureArgsInstrumenter] = None,
+        limits: Optional[R2ETestLimits] = None,
+        measure_coverage: bool = True,
+        fail_fast: bool = False,
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+    ):
+        """Run the test suites concurrently in forked processes.
+
+        Each process saves its own coverage data file, which are then
+        combined into a single coverage measurement and analyzed (before
+        the data files are removed). Without `measure_coverage`,
+        no coverage is recorded (and `cov` is None).
+        """
+        if not measure_coverage:
+            runner = R2EParallelRunner(
+                num_processes, None, [], limits=limits, fail_fast=fail_fast
+            )
+            results = runner.run(test_suites, instrumenter, on_event)
+            cov, file_coverage = None, None
+        else:
+            with tempfile.TemporaryDirectory(prefix="r2e_coverage_") as coverage_dir:
+                data_file = os.path.join(coverage_dir, ".coverage")
+
+                runner = R2EParallelRunner(
+                    num_processes,
+                    data_file,
+                    include=[self.file_path],
+                    limits=limits,
+                    fail_fast=fail_fast,
+                )
+                results = runner.run(test_suites, instrumenter, on_event)
+
+                cov = coverage.Coverage(
+                    data_file=data_file, include=[self.file_path], branch=True
+                )
+                cov.combine(data_paths=[coverage_dir])
+                file_coverage = R2EFileCoverage(cov, self.file_path)
+
+        combined_errors = {test_idx: err for test_idx, (err, _) in results.items()}
+        combined_stats = {test_idx: stats for test_idx, (_, stats) in results.items()}
+        return cov, file_coverage, combined_errors, combined_stats
+
+    def startCoverage(
+        self, backend: str
+    ) -> Union[coverage.Coverage, R2EMonitoringCoverage]:
+        """Start measuring the coverage of the file under test.
+
+        The sys.monitoring backend only monitors the functions/classes under
+        test. It falls back to coverage.py if another measurement holds it.
+        """
+        if backend not in ("auto", "coverage", "monitoring"):
+            raise ValueError(f"Unknown coverage backend: {backend}")
+        if backend == "monitoring" and not hasattr(sys, "monitoring"):
+            raise ValueError("The monitoring coverage backend requires python 3.12+")
+
+        if backend != "coverage" and R2EMonitoringCoverage.available():
+            spans = [self.source_index.get_span(name) for name in self.funclass_names]
+            monitor = R2EMonitoringCoverage(
+                self.file_path,
+                None if any(span is None for span in spans) else spans,  # type: ignore
+            )
+            try:
+                monitor.start()
+                return monitor
+            except ValueError:
+                pass
+
+        # NOTE: no data file, the coverage data stays in memory
+        cov = coverage.Coverage(data_file=None, include=[self.file_path], branch=True)
+        cov.start()
+        return cov
+
     # helpers
 
-    def get_fut_module(self) -> Tuple[ModuleType, Dict[str, Any]]:
+    def get_fut_module(self) -> Tuple[ModuleType, Mapping[str, Any]]:
         """Dynamically import and retrieve the module containing the function under test.
         Also retrieve the dependencies of the module.
 
@@ -226,7 +654,7 @@ class R2ETestProgram(object):
             FUT (FunctionUnderTest): function under test.
 
         Returns:
-            Tuple[ModuleType, Dict[str, Any]]: module and its dependencies.
+            Tuple[ModuleType, Mapping[str, Any]]: module and its dependencies.
         """
 
         try:
@@ -247,14 +675,14 @@ class R2ETestProgram(object):
 
     def import_fut_module_with_paths(
         self, paths: List[str]
-    ) -> Tuple[ModuleType, Dict[str, Any]]:
+    ) -> Tuple[ModuleType, Mapping[str, Any]]:
         """Attempt to dynamically import the fut_module with the given paths in sys.path.
 
         Args:
             paths (List[str]): paths to add to sys.path.
 
         Returns:
-            Tuple[ModuleType, Dict[str, Any]]: module and its dependencies.
+            Tuple[ModuleType, Mapping[str, Any]]: module and its dependencies.
 
         Note: if module is not found, the paths are removed from sys.path.
         the exception raised should be handled by the caller.
@@ -265,8 +693,15 @@ class R2ETestProgram(object):
                 sys.path.insert(0, path)
 
         try:
-            fut_module = self.import_module_dynamic("fut_module", self.file_path)
-            fut_module_deps = ModuleExplorer.get_dependencies(self.file_path)
+            fut_module = fut_module_cache.get(self.file_path, self.orig_file_content)
+            if fut_module is None:
+                fut_module = self.import_module_dynamic("fut_module", self.file_path)
+                fut_module_cache.put(self.file_path, self.orig_file_content, fut_module)
+            else:
+                sys.modules["fut_module"] = fut_module
+            fut_module_deps = ModuleExplorer.get_dependencies(
+                self.file_path, tree=self.orig_file_ast, paths=paths
+            )
         finally:
             for path in paths:
                 sys.path.remove(path)
@@ -297,15 +732,7 @@ class R2ETestProgram(object):
         self, funclass_name: str
     ) -> Union[ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef]:
         """Get the function or class AST node from the original file by name."""
-        for node in self.orig_file_ast.body:
-            if (
-                isinstance(node, ast.ClassDef)
-                or isinstance(node, ast.FunctionDef)
-                or isinstance(node, ast.AsyncFunctionDef)
-            ):
-                if node.name == funclass_name:
-                    return node
-        raise ValueError(f"Function or class {funclass_name} not found in the file.")
+        return self.source_index.get_node(funclass_name)
 
     def import_module_dynamic(self, module_name: str, module_path: str) -> ModuleType:
         """Dynamically import a module from a file path.
@@ -338,3 +765,9 @@ class R2ETestProgram(object):
             exec(compiled_code, self.fut_module.__dict__)
         else:
             exec(compiled_code, nspace)
+
+
+def stream_outcome(on_event: Callable[[Dict], None], test_idx: str, event: Dict):
+    """Pass the outcome events of the tests of suite `test_idx` to `on_event`."""
+    if event["event"] == "outcome":
+        on_event({"test_id": test_idx, **event})
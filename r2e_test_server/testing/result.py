@@ -1,4 +1,13 @@
+import time
 import unittest
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class R2ETestTimeout(BaseException):
+    """Raised in a test that runs for longer than its timeout.
+
+    Note: a BaseException, so that tests catching `Exception` do not swallow it.
+    """
 
 
 class R2ETestResult(unittest.TextTestResult):
@@ -7,74 +16,162 @@ class R2ETestResult(unittest.TextTestResult):
         self.passed_tests = []
         self.failed_tests = []
         self.errored_tests = []
+        self.timeout_tests = []
         self.skipped_tests = []
         self.expected_failure_tests = []
         self.unexpected_success_tests = []
+        # tests left out by a fail-fast stop (set by the runner)
+        self.not_run_tests = []
+        self.started_test_ids = set()
+
+        # set by the runner
+        self.on_event: Optional[Callable[[Dict], None]] = None
+        self.test_start_time = time.perf_counter()
+
+    def startTest(self, test):
+        super().startTest(test)
+        self.started_test_ids.add(test.id())
+        self.test_start_time = time.perf_counter()
+        self.emit_event("start", test)
+
+    def stopTest(self, test):
+        super().stopTest(test)
+        self.emit_event("stop", test)
 
     def addSuccess(self, test):
         super().addSuccess(test)
         self.passed_tests.append(test)
+        self.emit_event("outcome", test, "passed")
 
     def addFailure(self, test, err):
         super().addFailure(test, err)
         self.failed_tests.append(test)
+        self.emit_event("outcome", test, "failed", self.failures[-1])
 
     def addError(self, test, err):
         super().addError(test, err)
-        self.errored_tests.append(test)
+        if isinstance(err[1], R2ETestTimeout):
+            self.timeout_tests.append(test)
+            self.emit_event("outcome", test, "timeout", self.errors[-1])
+        else:
+            self.errored_tests.append(test)
+            self.emit_event("outcome", test, "errored", self.errors[-1])
 
     def addSkip(self, test, reason):
         super().addSkip(test, reason)
         self.skipped_tests.append((test, reason))
+        self.emit_event("outcome", test, "skipped")
 
     def addExpectedFailure(self, test, err):
         super().addExpectedFailure(test, err)
         self.expected_failure_tests.append(test)
+        self.emit_event("outcome", test, "expected_failure")
 
     def addUnexpectedSuccess(self, test):
         super().addUnexpectedSuccess(test)
         self.unexpected_success_tests.append(test)
+        self.emit_event("outcome", test, "unexpected_success")
 
     def addSubTest(self, test, subtest, err):
         super().addSubTest(test, subtest, err)
         if err is not None and err[0] is not None:
             if issubclass(err[0], test.failureException):
                 self.failed_tests.append(subtest)
+                self.emit_event("outcome", subtest, "failed", self.failures[-1])
+            elif issubclass(err[0], R2ETestTimeout):
+                self.timeout_tests.append(subtest)
+                self.emit_event("outcome", subtest, "timeout", self.errors[-1])
             else:
                 self.errored_tests.append(subtest)
+                self.emit_event("outcome", subtest, "errored", self.errors[-1])
 
-    def get_stats(self):
-        test_name = lambda t: (
+    @staticmethod
+    def test_name(t) -> str:
+        return (
             t._testMethodName
             if t._testMethodName != "runTest"
             else f"{t.test_case._testMethodName}.subTest"
         )
 
+    def get_stats(self):
+        test_name = R2ETestResult.test_name
+
+        outcomes = (
+            [(test_name(test), "passed") for test in self.passed_tests]
+            + [(test_name(test), "failed") for test in self.failed_tests]
+            + [(test_name(test), "errored") for test in self.errored_tests]
+            + [(test_name(test), "timeout") for test in self.timeout_tests]
+            + [(test_name(test), "skipped") for test, _ in self.skipped_tests]
+            + [(test_name(t), "expected_failure") for t in self.expected_failure_tests]
+            + [
+                (test_name(test), "unexpected_success")
+                for test in self.unexpected_success_tests
+            ]
+            + [(test_name(test), "not_run") for test in self.not_run_tests]
+        )
+        return R2ETestResult.build_stats(outcomes)
+
+    @staticmethod
+    def build_stats(outcomes: List[Tuple[str, str]]) -> Dict:
+        """Build the stats of a test suite from its `(test name, outcome)` pairs."""
+        names = lambda outcome: [name for name, o in outcomes if o == outcome]
+
         return {
             # "tests_count": self.testsRun,
-            "valid": len(self.failed_tests) == 0 and len(self.errored_tests) == 0,
-            "passed_count": len(self.passed_tests),
-            "passed_names": [test_name(test) for test in self.passed_tests],
-            "failed_count": len(self.failed_tests),
-            "failed_names": [test_name(test) for test in self.failed_tests],
-            "errored_count": len(self.errored_tests),
-            "errored_names": [test_name(test) for test in self.errored_tests],
-            "skipped_count": len(self.skipped_tests),
-            "expected_failures": len(self.expected_failure_tests),
-            "unexpected_successes": len(self.unexpected_success_tests),
+            "valid": all(
+                len(names(outcome)) == 0
+                for outcome in ("failed", "errored", "timeout", "not_run")
+            ),
+            "passed_count": len(names("passed")),
+            "passed_names": names("passed"),
+            "failed_count": len(names("failed")),
+            "failed_names": names("failed"),
+            "errored_count": len(names("errored")),
+            "errored_names": names("errored"),
+            "timeout_count": len(names("timeout")),
+            "timeout_names": names("timeout"),
+            "skipped_count": len(names("skipped")),
+            "expected_failures": len(names("expected_failure")),
+            "unexpected_successes": len(names("unexpected_success")),
+            "not_run_count": len(names("not_run")),
+            "not_run_names": names("not_run"),
         }
 
     def get_error_list(self):
-        def _init_error_entry(etype: str, test, err):
-            return {
-                "type": etype,
-                "test": self.getDescription(test),
-                "message": str(err),
-            }
+        timeout_tests = set(map(id, self.timeout_tests))
+        return [
+            self.error_entry(err[0], err[1], id(err[0]) in timeout_tests)
+            for err in self.errors
+        ] + [self.error_entry(fail[0], fail[1], is_failure=True) for fail in self.failures]
+
+    def error_entry(self, test, err, is_timeout=False, is_failure=False) -> Dict:
+        etype = "FAIL" if is_failure else "TIMEOUT" if is_timeout else "ERROR"
+        return {
+            "type": etype,
+            "test": self.getDescription(test),
+            "message": str(err),
+        }
 
-        all_errors = [_init_error_entry("ERROR", *err) for err in self.errors]
-        all_failures = [_init_error_entry("FAIL", *fail) for fail in self.failures]
-        return all_errors + all_failures
+    def emit_event(self, event: str, test, outcome: Optional[str] = None, err=None):
+        """Report the progress of the run to the `on_event` callback, if any."""
+        if self.on_event is None:
+            return
+
+        data = {"event": event, "id": test.id(), "name": R2ETestResult.test_name(test)}
+        if outcome is not None:
+            data["outcome"] = outcome
+            data["duration"] = time.perf_counter() - self.test_start_time
+            data["error"] = (
+                None
+                if err is None
+                else self.error_entry(
+                    err[0],
+                    err[1],
+                    is_timeout=outcome == "timeout",
+                    is_failure=outcome == "failed",
+                )
+            )
+        self.on_event(data)
 
 
 def merge_test_suite_stats(stats_per_suite):
@@ -87,9 +184,13 @@ def merge_test_suite_stats(stats_per_suite):
         "failed_names": [],
         "errored_count": 0,
         "errored_names": [],
+        "timeout_count": 0,
+        "timeout_names": [],
         "skipped_count": 0,
         "expected_failures": 0,
         "unexpected_successes": 0,
+        "not_run_count": 0,
+        "not_run_names": [],
     }
 
     for stats in stats_per_suite:
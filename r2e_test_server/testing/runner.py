@@ -1,15 +1,156 @@
 import json
+import signal
 import unittest
 import coverage
+import threading
+from unittest import TestCase, TestSuite
+from typing import Callable, Dict, Optional, Union
 
-from r2e_test_server.testing.result import R2ETestResult
+from r2e_test_server.testing.result import R2ETestResult, R2ETestTimeout
+
+
+class R2ETestLimits:
+    """Limits on the resources used by the tests.
+
+    Args:
+        test_timeout (float): wall-clock seconds for each test.
+        suite_timeout (float): wall-clock seconds for each test suite.
+        cpu_limit (int): CPU seconds for the process running a test suite.
+        memory_limit (int): address space (in bytes) of the process running a test suite.
+
+    Note: the limits are enforced in the (forked) process running the suite,
+    which is killed if a test cannot be interrupted.
+    """
+
+    def __init__(
+        self,
+        test_timeout: Optional[float] = None,
+        suite_timeout: Optional[float] = None,
+        cpu_limit: Optional[int] = None,
+        memory_limit: Optional[int] = None,
+    ):
+        self.test_timeout = test_timeout
+        self.suite_timeout = suite_timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+
+    @property
+    def enabled(self) -> bool:
+        return any(
+            limit is not None
+            for limit in (
+                self.test_timeout,
+                self.suite_timeout,
+                self.cpu_limit,
+                self.memory_limit,
+            )
+        )
+
+    def apply_resource_limits(self):
+        """Set the CPU and memory limits of the current process."""
+        import resource
+
+        if self.cpu_limit is not None:
+            # SIGXCPU at the soft limit, SIGKILL one second later
+            cpu_limit = int(self.cpu_limit)
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+        if self.memory_limit is not None:
+            memory_limit = int(self.memory_limit)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
 
 
 class R2ETestRunner(unittest.TextTestRunner):
+    """Test runner that returns the results of a suite as plain data.
+
+    Args:
+        test_timeout (float): if set, a test running for longer than this many
+            (wall-clock) seconds is interrupted and reported as a timeout.
+            Uses SIGALRM, so it only works in the main thread.
+        on_event (Callable): called with every start/outcome/stop event of the tests.
+
+    With `failfast`, the run stops at the first failure/error/timeout and
+    the tests that did not run are reported as `not_run`.
+    """
+
     resultclass = R2ETestResult
 
+    def __init__(
+        self,
+        *args,
+        test_timeout: Optional[float] = None,
+        on_event: Optional[Callable[[Dict], None]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.test_timeout = test_timeout
+        self.on_event = on_event
+
+    def _makeResult(self):
+        result: R2ETestResult = super()._makeResult()  # type: ignore
+        result.on_event = self.on_event
+        if self.test_timeout is not None:
+            result.on_event = self.timed_events(result.on_event, self.test_timeout)
+        return result
+
     def run(self, test):  # type: ignore
-        result: R2ETestResult = super().run(test)  # type: ignore
+        # NOTE: collected beforehand, the suites drop their tests as they run
+        tests = list(iter_tests(test)) if self.failfast else []
+
+        if self.test_timeout is None:
+            result: R2ETestResult = super().run(test)  # type: ignore
+        else:
+            if threading.current_thread() is not threading.main_thread():
+                raise ValueError("Test timeouts can only be used in the main thread.")
+
+            previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+            try:
+                result = super().run(test)  # type: ignore
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous_handler)
+
+        if result.shouldStop:
+            result.not_run_tests = [
+                t for t in tests if t.id() not in result.started_test_ids
+            ]
+
         stats = result.get_stats()
         err = result.get_error_list()
         return result, err, stats
+
+    def not_run(self, test):
+        """Results of a suite skipped entirely (after a fail-fast stop)."""
+        result: R2ETestResult = self._makeResult()  # type: ignore
+        result.not_run_tests = list(iter_tests(test))
+        return result, result.get_error_list(), result.get_stats()
+
+    @staticmethod
+    def timed_events(on_event: Optional[Callable[[Dict], None]], test_timeout: float):
+        """Wrap the event callback to start/cancel the timer of every test."""
+
+        def handle_event(event: Dict):
+            if event["event"] == "start":
+                signal.setitimer(signal.ITIMER_REAL, test_timeout)
+            elif event["event"] == "stop":
+                signal.setitimer(signal.ITIMER_REAL, 0)
+            if on_event is not None:
+                on_event(event)
+
+        return handle_event
+
+
+def iter_tests(test_suite: Union[TestSuite, TestCase]):
+    """The test cases of a (nested) suite, in the order they run."""
+    if isinstance(test_suite, TestCase):
+        yield test_suite
+        return
+
+    for test in test_suite:
+        if isinstance(test, TestSuite):
+            yield from iter_tests(test)
+        elif isinstance(test, TestCase):
+            yield test
+
+
+def _raise_timeout(signum, frame):
+    raise R2ETestTimeout("Test timed out")
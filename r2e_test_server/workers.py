@@ -0,0 +1,298 @@
+import itertools
+import importlib
+import traceback
+import multiprocessing
+from threading import Lock
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from r2e_test_server.session import R2ESession
+from r2e_test_server.metrics import metrics
+from r2e_test_server.result_cache import result_cache
+
+
+class R2EWorkerDied(Exception):
+    """Raised when the worker process serving a session is no longer alive."""
+
+
+def _worker_main(conn):
+    """Serve session calls sent over `conn` until the pool closes it.
+
+    A worker can host several sessions, each identified by its session id.
+    The metrics observed during a call are sent back before its result.
+    """
+    sessions: Dict[int, R2ESession] = {}
+    metrics.start_journal()
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError, KeyboardInterrupt):
+            break
+
+        # the pool asks the worker to stop
+        if message is None:
+            break
+
+        session_id, method, args, stream = message
+
+        try:
+            if method == "open":
+                sessions[session_id] = R2ESession()
+                result = None
+            elif method == "close":
+                session = sessions.pop(session_id, None)
+                if session is not None:
+                    session.close()
+                result = None
+            elif method == "result_cache_stats":
+                result = result_cache.stats()
+            elif stream:
+                # the events go back to the server before the result
+                on_event = lambda event: conn.send(("event", event))
+                result = getattr(sessions[session_id], method)(*args, on_event=on_event)
+            else:
+                result = getattr(sessions[session_id], method)(*args)
+            reply = ("ok", result)
+        except Exception:
+            reply = ("error", traceback.format_exc())
+
+        journal = metrics.drain()
+        if journal:
+            conn.send(("metrics", journal))
+        conn.send(reply)
+
+
+class R2EWorker:
+    """A pre-forked worker process and the pipe used to talk to it."""
+
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        # NOTE: not a daemon, test runs in the worker may need to fork themselves
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,))
+        self.process.start()
+        child_conn.close()
+
+        self.lock = Lock()
+        self.num_sessions = 0
+        self.alive = True
+
+    def is_alive(self) -> bool:
+        return self.alive and self.process.is_alive()
+
+    def call(
+        self,
+        session_id: int,
+        method: str,
+        args: Tuple = (),
+        on_event: Optional[Callable[[Dict], None]] = None,
+    ) -> Any:
+        """Run `method` of session `session_id` in the worker and return its result.
+
+        With `on_event`, the method is passed an `on_event` callback, whose
+        events are relayed to `on_event` as the worker sends them. The metrics
+        of the worker are merged into the server's.
+        """
+        with self.lock:
+            if not self.is_alive():
+                raise R2EWorkerDied(f"Worker process {self.process.pid} is not alive.")
+
+            try:
+                self.conn.send((session_id, method, args, on_event is not None))
+                status, payload = self.conn.recv()
+                while status in ("event", "metrics"):
+                    if status == "event":
+                        on_event(payload)  # type: ignore
+                    else:
+                        metrics.merge(payload)
+                    status, payload = self.conn.recv()
+            except (EOFError, OSError) as e:
+                self.alive = False
+                raise R2EWorkerDied(
+                    f"Worker process {self.process.pid} died: {repr(e)}"
+                ) from e
+
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
+
+    def close(self):
+        self.alive = False
+        try:
+            self.conn.send(None)
+            self.conn.close()
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class R2EWorkerPool:
+    """Pool of pre-forked worker processes that run the sessions' programs.
+
+    The workers are forked after the heavy dependencies (and `preload`
+    modules) are imported in the server, so they start warm. A session is
+    pinned to one worker for its lifetime; dead workers are replaced on demand.
+
+    Args:
+        num_workers (int): number of worker processes.
+        preload (List[str]): modules to import before forking the workers.
+    """
+
+    def __init__(self, num_workers: int, preload: Optional[List[str]] = None):
+        for module_name in ["rpyc", "coverage"] + list(preload or []):
+            importlib.import_module(module_name)
+
+        if "fork" in multiprocessing.get_all_start_methods():
+            self.ctx = multiprocessing.get_context("fork")
+        else:
+            self.ctx = multiprocessing.get_context()
+
+        self.lock = Lock()
+        self.session_ids = itertools.count()
+        self.workers = [R2EWorker(self.ctx) for _ in range(num_workers)]
+
+    def open_session(self) -> "R2ERemoteSession":
+        return R2ERemoteSession(self, next(self.session_ids))
+
+    def acquire(self) -> R2EWorker:
+        """Get the least loaded worker, replacing any dead worker first.
+
+        Note: unlike the first workers, the replacements are forked while the
+        server runs threads. The locks of the metrics and of the result cache
+        are re-created in the child, but any other lock held by another thread
+        at that moment (e.g., in a library) stays locked in the replacement.
+        """
+        with self.lock:
+            for idx, worker in enumerate(self.workers):
+                if not worker.is_alive():
+                    worker.close()
+                    self.workers[idx] = R2EWorker(self.ctx)
+
+            worker = min(self.workers, key=lambda w: w.num_sessions)
+            worker.num_sessions += 1
+            return worker
+
+    def release(self, worker: R2EWorker):
+        with self.lock:
+            worker.num_sessions -= 1
+
+    def result_cache_stats(self) -> Dict[str, int]:
+        """The result cache stats of all the workers, summed.
+
+        Note: waits for the call running in each worker, if any.
+        """
+        with self.lock:
+            workers = list(self.workers)
+
+        stats: Counter = Counter()
+        for worker in workers:
+            try:
+                stats.update(worker.call(-1, "result_cache_stats"))
+            except R2EWorkerDied:
+                pass
+        return dict(stats)
+
+    def close(self):
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+            self.workers = []
+
+
+class R2ERemoteSession:
+    """Session proxy that runs an `R2ESession` in a worker of an `R2EWorkerPool`.
+
+    The setup calls are recorded and replayed if the session has to move to
+    a new worker, but the loaded program is lost with the worker that died.
+    """
+
+    def __init__(self, pool: R2EWorkerPool, session_id: int):
+        self.pool = pool
+        self.session_id = session_id
+        self.worker: Optional[R2EWorker] = None
+        self.setup_calls: List[Tuple[str, Tuple]] = []
+
+    def setup_repo(self, data: str):
+        self._setup("setup_repo", data)
+
+    def setup_function(self, data: str):
+        self._setup("setup_function", data)
+
+    def setup_test(self, data: str):
+        self._setup("setup_test", data)
+
+    def setup_codegen_mode(self):
+        self._setup("setup_codegen_mode")
+
+    def setup_result_encoding(self, data: str):
+        self._setup("setup_result_encoding", data)
+
+    def init(self):
+        return self._run("init")
+
+    def submit(
+        self,
+        data: Optional[str] = None,
+        on_event: Optional[Callable[[Dict], None]] = None,
+    ):
+        return self._run("submit", data, on_event=on_event)
+
+    def submit_batch(self, data: str):
+        return self._run("submit_batch", data)
+
+    def execute(self, command: str):
+        return self._run("execute", command)
+
+    def reset(self):
+        return self._run("reset")
+
+    def close(self):
+        if self.worker is None:
+            return
+        try:
+            self.worker.call(self.session_id, "close")
+        except R2EWorkerDied:
+            pass
+        self.pool.release(self.worker)
+        self.worker = None
+
+    # helpers
+
+    def _setup(self, method: str, *args):
+        self._attach().call(self.session_id, method, args)
+        self.setup_calls.append((method, args))
+
+    def _run(
+        self,
+        method: str,
+        *args,
+        on_event: Optional[Callable[[Dict], None]] = None,
+    ) -> Dict[str, str]:
+        try:
+            if self.worker is not None and not self.worker.is_alive():
+                pid = self.worker.process.pid
+                self._attach()
+                raise R2EWorkerDied(
+                    f"Worker process {pid} of the session died, call `init` again."
+                )
+            return self._attach().call(self.session_id, method, args, on_event)
+        except R2EWorkerDied as e:
+            metrics.add("r2e_failures_total", method=method)
+            return {"error": f"Error: {e}\n\nSmall Error: {repr(e)}", "output": ""}
+
+    def _attach(self) -> R2EWorker:
+        """Get the session's worker, moving the session to a new one if it died."""
+        if self.worker is not None and self.worker.is_alive():
+            return self.worker
+
+        if self.worker is not None:
+            self.pool.release(self.worker)
+
+        self.worker = self.pool.acquire()
+        self.worker.call(self.session_id, "open")
+        for method, args in self.setup_calls:
+            self.worker.call(self.session_id, method, args)
+        return self.worker
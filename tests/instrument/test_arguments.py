@@ -0,0 +1,137 @@
+import sys
+import datetime
+import unittest
+
+from r2e_test_server.encoding import R2EResultEncoder
+from r2e_test_server.instrument.arguments import CaptureArgsInstrumenter, Serializers
+
+
+def double(x):
+    return x * 2
+
+
+def factorial(n):
+    return 1 if n <= 1 else n * factorial(n - 1)
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+class TestCaptureArgsInstrumenter(unittest.TestCase):
+
+    def call_square(self, instrumenter, num_calls):
+        wrapped = instrumenter.instrument(double)
+        for x in range(num_calls):
+            wrapped(x)
+        return [log["inputs"]["x"] for log in instrumenter.get_logs()]
+
+    def test_capture_all(self):
+        captured = self.call_square(CaptureArgsInstrumenter(), 20)
+        self.assertEqual(captured, [str(x) for x in range(20)])
+
+    def test_capture_first(self):
+        instrumenter = CaptureArgsInstrumenter("first", limit=3)
+        self.assertEqual(self.call_square(instrumenter, 20), ["0", "1", "2"])
+
+    def test_capture_sample(self):
+        instrumenter = CaptureArgsInstrumenter("sample", limit=5)
+        captured = self.call_square(instrumenter, 1000)
+
+        self.assertEqual(len(captured), 5)
+        # in the order of the calls, not only from the first calls
+        captured = [int(x) for x in captured]
+        self.assertEqual(captured, sorted(captured))
+        self.assertGreater(captured[-1], 5)
+
+        # reproducible
+        instrumenter = CaptureArgsInstrumenter("sample", limit=5)
+        self.assertEqual([int(x) for x in self.call_square(instrumenter, 1000)], captured)
+
+    def test_capture_off(self):
+        instrumenter = CaptureArgsInstrumenter("off")
+        self.assertEqual(self.call_square(instrumenter, 20), [])
+
+    def test_nested_and_failing_calls(self):
+        instrumenter = CaptureArgsInstrumenter()
+        wrapped = instrumenter.instrument(factorial)
+        globals()["factorial"], original = wrapped, factorial
+        try:
+            wrapped(3)
+        finally:
+            globals()["factorial"] = original
+
+        failing = instrumenter.instrument(fail)
+        with self.assertRaises(ValueError):
+            failing(1)
+        self.assertEqual(instrumenter.call_stack, [])
+
+        logs = instrumenter.get_logs()
+        self.assertEqual(
+            [(log["inputs"]["n"], log["output"]) for log in logs],
+            [("1", "1"), ("2", "2"), ("3", "6")],
+        )
+        self.assertEqual(
+            [log["caller_info"]["func_name"] for log in logs],
+            ["factorial", "factorial", "test_nested_and_failing_calls"],
+        )
+
+    def test_capture_limits(self):
+        # a small memory budget, the calls are spilled to a file
+        instrumenter = CaptureArgsInstrumenter(max_bytes=1000, max_entries=50)
+        wrapped = instrumenter.instrument(double)
+        for x in range(100):
+            wrapped(str(x) * 50)
+
+        self.assertIsNotNone(instrumenter.store.spill_file)
+        self.assertLessEqual(instrumenter.store.num_bytes, 1000)
+        self.assertEqual(instrumenter.store.num_dropped, 50)
+
+        logs = instrumenter.get_logs()
+        self.assertEqual(len(logs), 50)
+        self.assertEqual(logs[0]["inputs"]["x"], repr("0" * 50))
+        self.assertEqual(logs[-1]["inputs"]["x"], repr("49" * 50))
+
+        # encoded straight from the file, as if loaded
+        for format in ("json", "compact"):
+            encoder = R2EResultEncoder(format)
+            self.assertEqual(
+                encoder.encode({"logs": instrumenter.get_log_lines()}),
+                encoder.encode({"logs": logs}),
+            )
+
+        instrumenter.close()
+        self.assertIsNone(instrumenter.store.spill_file)
+
+
+class TestSerializerDispatch(unittest.TestCase):
+
+    def test_handlers_by_type(self):
+        handlers = Serializers.get_handlers(datetime.datetime)
+        self.assertIn(Serializers.serialize_datetime, handlers)
+        self.assertNotIn(Serializers.serialize_decimal, handlers)
+
+        handlers = Serializers.get_handlers(list)
+        self.assertEqual(handlers, (Serializers.serialize_function,))
+
+    def test_frameworks_are_not_imported(self):
+        # a type that claims to come from a framework that is not imported
+        FakeTensor = type("Tensor", (), {"__module__": "torch.fake"})
+
+        self.assertNotIn("torch", sys.modules)
+        self.assertEqual(Serializers.get_handlers(FakeTensor), ())
+
+        serialized = CaptureArgsInstrumenter().serialize(FakeTensor())
+        self.assertIn("Tensor object", serialized)
+        self.assertNotIn("torch", sys.modules)
+
+    def test_signature_cached(self):
+        instrumenter = CaptureArgsInstrumenter()
+        wrapped = instrumenter.instrument(double)
+        wrapped(1)
+        wrapped(2)
+        self.assertEqual(list(instrumenter.signatures), [double])
+
+
+if __name__ == "__main__":
+    unittest.main()
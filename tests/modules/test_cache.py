@@ -0,0 +1,165 @@
+import os
+import sys
+import tempfile
+import unittest
+import importlib.util
+
+from r2e_test_server.modules.cache import ModuleCache, ModuleCloner
+
+
+module_source = """
+import abc
+
+COUNTER = []
+
+def helper(x):
+    return x + 1
+
+def fut(x):
+    COUNTER.append(x)
+    return helper(x)
+
+class Base(abc.ABC):
+    def value(self):
+        return 1
+
+class Child(Base):
+    def value(self):
+        return super().value() + helper(1)
+
+    @staticmethod
+    def static(x):
+        return helper(x)
+"""
+
+
+def exec_module(source: str, name: str = "cached_module"):
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location(name, f.name)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    os.remove(f.name)
+    return module
+
+
+class TestModuleCloner(unittest.TestCase):
+
+    def test_clone_is_isolated(self):
+        module = exec_module(module_source)
+        clone = ModuleCloner(module).clone()
+        assert clone is not None
+
+        self.assertEqual(clone.fut(1), 2)
+        self.assertEqual(clone.COUNTER, [1])
+        self.assertEqual(module.COUNTER, [])
+
+        # functions of the clone see the clone's globals
+        setattr(clone, "helper", lambda x: x + 100)
+        self.assertEqual(clone.fut(1), 101)
+        self.assertEqual(module.fut(1), 2)
+
+        # classes are re-created, super() still works
+        self.assertIsNot(clone.Child, module.Child)
+        self.assertTrue(issubclass(clone.Child, clone.Base))
+        self.assertEqual(clone.Child().value(), 102)
+        self.assertEqual(clone.Child.static(1), 101)
+        self.assertEqual(module.Child().value(), 3)
+
+        clone.Child.value = lambda self: 0
+        self.assertEqual(module.Child().value(), 3)
+
+    def test_mutable_state_is_copied(self):
+        source = (
+            "from collections import defaultdict\n"
+            "COUNTS = defaultdict(int)\n"
+            "HISTORY = {'calls': COUNTS}\n"
+            "class Registry:\n"
+            "    items = []\n"
+            "    def add(self, x):\n"
+            "        self.items.append(x)\n"
+            "        COUNTS[x] += 1\n"
+            "        return len(self.items), COUNTS[x]\n"
+        )
+        module = exec_module(source)
+        template = ModuleCloner(module).clone()
+        assert template is not None
+
+        for _ in range(2):
+            clone = ModuleCloner(template).clone()
+            assert clone is not None
+            self.assertEqual(clone.Registry().add("a"), (1, 1))
+            self.assertEqual(clone.Registry().add("a"), (2, 2))
+            # shared references stay shared within a clone
+            self.assertIs(clone.HISTORY["calls"], clone.COUNTS)
+
+        self.assertEqual(template.Registry.items, [])
+        self.assertEqual(dict(template.COUNTS), {})
+
+    def test_not_clonable(self):
+        sources = [
+            "import enum\nclass Color(enum.Enum):\n    RED = 1\n",
+            "class A:\n    pass\nDEFAULT = A()\n",
+            "import functools\n@functools.lru_cache()\ndef f(x):\n    return x\n",
+            "class A:\n    __slots__ = ('x',)\n",
+            "import threading\nLOCK = threading.Lock()\n",
+            "HANDLERS = {'a': lambda x: x}\n",
+            "class Field:\n"
+            "    def __set_name__(self, owner, name):\n"
+            "        self.name = name\n"
+            "class A:\n    x = Field()\n",
+        ]
+        for source in sources:
+            module = exec_module(source)
+            self.assertIsNone(ModuleCloner(module).clone(), source)
+
+    def test_init_subclass_not_rerun(self):
+        base = exec_module(
+            "REGISTRY = {}\n"
+            "class Base:\n"
+            "    def __init_subclass__(cls, **kwargs):\n"
+            "        super().__init_subclass__(**kwargs)\n"
+            "        if cls.__name__ in REGISTRY:\n"
+            "            raise ValueError(f'duplicate {cls.__name__}')\n"
+            "        REGISTRY[cls.__name__] = cls\n",
+            name="plugin_base",
+        )
+        sys.modules["plugin_base"] = base
+        try:
+            module = exec_module(
+                "from plugin_base import Base\nclass Plugin(Base):\n    pass\n"
+            )
+            self.assertIsNone(ModuleCloner(module).clone())
+            self.assertIs(base.REGISTRY["Plugin"], module.Plugin)
+        finally:
+            del sys.modules["plugin_base"]
+
+
+class TestModuleCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ModuleCache(max_entries=1)
+        module = exec_module(module_source)
+
+        self.assertIsNone(cache.get("a.py", module_source))
+        cache.put("a.py", module_source, module)
+
+        clone1 = cache.get("a.py", module_source)
+        clone2 = cache.get("a.py", module_source)
+        assert clone1 is not None and clone2 is not None
+        self.assertIsNot(clone1.fut, clone2.fut)
+
+        # a changed source is a different entry, evicting the old one
+        cache.put("a.py", module_source + "\n", module)
+        self.assertIsNone(cache.get("a.py", module_source))
+        self.assertIsNotNone(cache.get("a.py", module_source + "\n"))
+
+    def test_disabled(self):
+        cache = ModuleCache(max_entries=0)
+        cache.put("a.py", module_source, exec_module(module_source))
+        self.assertIsNone(cache.get("a.py", module_source))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from r2e_test_server.modules.explorer import ModuleExplorer
+
+
+module_source = """
+import json
+import os.path as osp
+from collections import OrderedDict as OD
+
+def f():
+    import r2e_missing_module
+    from json import missing_name
+"""
+
+
+class TestModuleExplorer(unittest.TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+            f.write(module_source)
+        self.module_path = f.name
+
+    def tearDown(self):
+        os.remove(self.module_path)
+
+    def test_lazy_dependencies(self):
+        import json
+        import collections
+
+        deps = ModuleExplorer.get_dependencies(self.module_path)
+
+        # nothing is imported until accessed
+        self.assertEqual(deps.resolved, {})
+
+        self.assertIs(deps["json"], json)
+        self.assertIs(deps["OD"], collections.OrderedDict)
+        self.assertEqual(list(deps.resolved), ["json", "OD"])
+
+        self.assertNotIn("r2e_missing_module", deps)
+        self.assertNotIn("missing_name", deps)
+        self.assertEqual(sorted(deps), ["OD", "json", "osp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from r2e_test_server.modules.index import SourceIndex
+
+
+source = '''import functools
+
+def f(x):
+    return x
+
+
+@functools.lru_cache()
+def g(x):
+    return (
+        x + 1
+    )
+
+
+class A:
+    @staticmethod
+    def m(x):
+        return x
+
+    async def n(self):
+        pass
+'''
+
+
+class TestSourceIndex(unittest.TestCase):
+
+    def test_spans(self):
+        index = SourceIndex(source)
+        self.assertEqual(index.get_span("f"), (3, 4))
+        self.assertEqual(index.get_span("g"), (7, 11))
+        self.assertEqual(index.get_span("A"), (14, 20))
+        self.assertEqual(index.get_span("A.m"), (15, 17))
+        self.assertEqual(index.get_span("A.n"), (19, 20))
+        self.assertIsNone(index.get_span("h"))
+
+    def test_source(self):
+        index = SourceIndex(source)
+        self.assertEqual(index.get_source("f"), "def f(x):\n    return x\n")
+        self.assertTrue(index.get_source("g").startswith("@functools.lru_cache()"))
+        self.assertRaises(ValueError, index.get_node, "h")
+
+
+if __name__ == "__main__":
+    unittest.main()
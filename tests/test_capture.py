@@ -0,0 +1,53 @@
+import unittest
+from io import StringIO
+from threading import Barrier, Thread
+
+from r2e_test_server.capture import CaptureOutput
+
+
+class TestCaptureOutput(unittest.TestCase):
+
+    def test_capture_per_thread(self):
+        num_threads = 4
+        barrier = Barrier(num_threads)
+        buffers = [StringIO() for _ in range(num_threads)]
+
+        def target(idx):
+            with CaptureOutput(stdout=buffers[idx], stderr=StringIO()):
+                barrier.wait()
+                for _ in range(100):
+                    print(idx)
+
+        threads = [Thread(target=target, args=(idx,)) for idx in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for idx, buffer in enumerate(buffers):
+            self.assertEqual(buffer.getvalue(), f"{idx}\n" * 100)
+
+    def test_nested_capture(self):
+        outer, inner = StringIO(), StringIO()
+        with CaptureOutput(stdout=outer, stderr=StringIO()):
+            print("outer")
+            with CaptureOutput(stdout=inner):
+                print("inner")
+            print("outer again")
+
+        self.assertEqual(outer.getvalue(), "outer\nouter again\n")
+        self.assertEqual(inner.getvalue(), "inner\n")
+
+    def test_capture_of_new_threads(self):
+        stdout, stderr = StringIO(), StringIO()
+        with CaptureOutput(stdout=stdout, stderr=stderr):
+            thread = Thread(target=lambda: print("from a thread"))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(stdout.getvalue(), "from a thread\n")
+        self.assertEqual(stderr.getvalue(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import urllib.request
+
+from r2e_test_server.metrics import R2EMetrics, metrics, start_metrics_server
+
+
+class TestR2EMetrics(unittest.TestCase):
+
+    def test_render(self):
+        registry = R2EMetrics()
+        registry.add("r2e_active_sessions", 2)
+        registry.add("r2e_active_sessions", -1)
+        registry.add("r2e_failures_total", method="submit")
+        registry.observe("r2e_phase_duration_seconds", 0.002, phase="import")
+        registry.observe("r2e_phase_duration_seconds", 100, phase="import")
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE r2e_phase_duration_seconds histogram", lines)
+        self.assertIn("r2e_active_sessions 1", lines)
+        self.assertIn('r2e_failures_total{method="submit"} 1', lines)
+
+        bucket = 'r2e_phase_duration_seconds_bucket{phase="import",le="%s"} %d'
+        self.assertIn(bucket % ("0.001", 0), lines)
+        self.assertIn(bucket % ("0.005", 1), lines)
+        self.assertIn(bucket % ("60", 1), lines)
+        self.assertIn(bucket % ("+Inf", 2), lines)
+        self.assertIn('r2e_phase_duration_seconds_count{phase="import"} 2', lines)
+        self.assertIn('r2e_phase_duration_seconds_sum{phase="import"} 100.002', lines)
+
+    def test_drain_and_merge(self):
+        worker = R2EMetrics()
+        worker.add("r2e_failures_total", method="init")
+        worker.start_journal()
+        with worker.phase("run_tests"):
+            pass
+        worker.add("r2e_failures_total", method="submit")
+
+        server = R2EMetrics()
+        server.merge(worker.drain())
+        self.assertEqual(worker.drain(), [])
+
+        rendered = server.render()
+        self.assertIn('r2e_phase_duration_seconds_count{phase="run_tests"} 1', rendered)
+        self.assertIn('r2e_failures_total{method="submit"} 1', rendered)
+        # observed before the journal started
+        self.assertNotIn('method="init"', rendered)
+
+    def test_metrics_server(self):
+        server = start_metrics_server(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.read().decode(), metrics.render())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from r2e_test_server.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ResultCache(max_entries=2)
+        for key in "abc":
+            cache.put(key, {"output": "", "error": "", "logs": key})
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), {"output": "", "error": "", "logs": "b"})
+
+        # b is now the most recently used
+        cache.put("d", {"logs": "d"})
+        self.assertIsNone(cache.get("c"))
+        self.assertEqual(cache.get("b")["logs"], "b")  # type: ignore
+        self.assertEqual(
+            cache.stats(),
+            {
+                "hits": 2,
+                "misses": 2,
+                "memory_hits": 2,
+                "disk_hits": 0,
+                "memory_entries": 2,
+            },
+        )
+
+    def test_disabled(self):
+        cache = ResultCache()
+        cache.put("a", {"logs": "a"})
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["misses"], 0)
+
+    def test_sqlite_tier(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "results.db")
+            cache = ResultCache(max_entries=0, db_path=db_path)
+            cache.put("text", {"output": "out", "error": "", "logs": "{}"})
+            cache.put("binary", {"logs": b"\x00\x01"})
+            cache.configure(0, None)
+
+            # a new server sees the results, text and bytes alike
+            cache = ResultCache(max_entries=10, db_path=db_path)
+            self.assertEqual(
+                cache.get("text"), {"output": "out", "error": "", "logs": "{}"}
+            )
+            self.assertEqual(cache.get("binary")["logs"], b"\x00\x01")  # type: ignore
+            self.assertEqual(cache.get("text")["logs"], "{}")  # type: ignore
+            self.assertIsNone(cache.get("missing"))
+
+            stats = cache.stats()
+            self.assertEqual((stats["disk_hits"], stats["memory_hits"]), (2, 1))
+            self.assertEqual(stats["misses"], 1)
+            cache.configure(0, None)
+
+    def test_get_key(self):
+        key = ResultCache.get_key(tests={"a": 1, "b": 2}, candidate="x")
+        self.assertEqual(
+            key, ResultCache.get_key(candidate="x", tests={"b": 2, "a": 1})
+        )
+        self.assertNotEqual(key, ResultCache.get_key(tests={"a": 1}, candidate="x"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
 import json
 import unittest
+from unittest import mock
 
 from r2e_test_server.server import R2EService
+from r2e_test_server.session import R2ESession
+from r2e_test_server.encoding import R2EResultEncoder
 
 
 test_serialize_default = """
@@ -230,3 +233,741 @@ class TestR2EService(unittest.TestCase):
         self.assertEqual(out["output"], "")
         logs = json.loads(out["logs"])
         self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+
+    def test_submit_batch(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        data = {"generated_tests": {"test_1": test_serialize_default}}
+        data = json.dumps(data)
+        service.setup_test(data)
+
+        service.setup_codegen_mode()
+
+        out = service.init()
+        self.is_empty_output(out)
+
+        data = {"candidates": [gpt4_codegen1, gpt4_codegen2, "def broken(:"]}
+        out = service.submit_batch(json.dumps(data))
+        self.assertEqual(out["output"], "")
+
+        logs = [json.loads(log) for log in out["logs"]]
+        self.assertEqual(len(logs), 3)
+        self.assertFalse(logs[0]["run_tests_logs"]["test_1"]["valid"])
+        self.assertTrue(logs[1]["run_tests_logs"]["test_1"]["valid"])
+        self.assertIn("SyntaxError", logs[2]["error"])
+
+        # the batch leaves the session as it found it (no Serializers in codegen mode)
+        out = service.execute("print('Serializers' in globals())")
+        self.assertEqual(out["output"], "False")
+
+    def test_result_cache(self):
+        from r2e_test_server.result_cache import result_cache
+        from r2e_test_server.testing.r2e_testprogram import R2ETestProgram
+
+        def open_service(test=test_serialize_default):
+            service = R2EService()
+            service.setup_repo(json.dumps({"repo_id": None, "repo_path": ""}))
+            data = {
+                "funclass_names": ["Serializers.serialize_default"],
+                "file_path": "r2e_test_server/instrument/arguments.py",
+            }
+            service.setup_function(json.dumps(data))
+            data = {"generated_tests": {"test_1": test}}
+            service.setup_test(json.dumps(data))
+            self.is_empty_output(service.init())
+            return service
+
+        def is_valid(out):
+            return json.loads(out["logs"])["run_tests_logs"]["test_1"]["valid"]
+
+        result_cache.configure(16)
+        try:
+            with mock.patch(
+                "r2e_test_server.session.R2ETestProgram", wraps=R2ETestProgram
+            ) as program_class:
+                # init does not load the program, the first submit does
+                service = open_service()
+                self.assertEqual(program_class.call_count, 0)
+                out = service.submit()
+                self.assertTrue(is_valid(out))
+                self.assertEqual(program_class.call_count, 1)
+
+                # the same submit in another session: nothing is loaded or run
+                service = open_service()
+                self.assertEqual(service.submit(), out)
+                self.assertEqual(program_class.call_count, 1)
+
+                # execute loads the program, and reports its output and errors
+                out = service.execute(f"{gpt4_codegen2}\nprint('defined')")
+                self.assertEqual((out["output"], out["error"]), ("defined", ""))
+                self.assertEqual(program_class.call_count, 2)
+                self.assertIn("NameError", service.execute("undefined_name")["error"])
+                self.assertTrue(is_valid(service.submit()))
+                self.assertEqual(program_class.call_count, 2)
+
+                # the candidates of a batch have their own entries
+                service = open_service()
+                data = {"candidates": [gpt4_codegen1, gpt4_codegen2]}
+                logs = service.submit_batch(json.dumps(data))["logs"]
+                self.assertFalse(is_valid({"logs": logs[0]}))
+                self.assertTrue(is_valid({"logs": logs[1]}))
+                num_calls = program_class.call_count
+                service = open_service()
+                self.assertEqual(service.submit_batch(json.dumps(data))["logs"], logs)
+                self.assertEqual(program_class.call_count, num_calls)
+
+                # a command that fails after changing the module is part of the key
+                service.reset()
+                out = service.execute(f"{gpt4_codegen1}\nraise RuntimeError()")
+                self.assertIn("RuntimeError", out["error"])
+                self.assertFalse(is_valid(service.submit()))
+
+                # other options are other results
+                out = service.submit(json.dumps({"fields": ["tests"]}))
+                self.assertNotIn("coverage_logs", json.loads(out["logs"]))
+
+                # timeouts are not cached
+                service = open_service(
+                    "import unittest\nclass TestLoop(unittest.TestCase):\n"
+                    "    def test_loop(self):\n        while True:\n            pass\n"
+                )
+                options = json.dumps({"test_timeout": 0.2, "fields": ["tests"]})
+                for _ in range(2):
+                    logs = json.loads(service.submit(options)["logs"])
+                    stats = logs["run_tests_logs"]["test_1"]
+                    self.assertEqual(stats["timeout_count"], 1)
+
+            stats = service.result_cache_stats()
+            self.assertEqual((stats["hits"], stats["misses"]), (3, 8))
+        finally:
+            result_cache.configure(0)
+
+    def test_result_encoding(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        data = {"generated_tests": {"test_1": test_serialize_default}}
+        data = json.dumps(data)
+        service.setup_test(data)
+
+        with self.assertRaises(ValueError):
+            service.setup_result_encoding(json.dumps({"format": "xml"}))
+
+        data = {"format": "compact", "compression": "zlib"}
+        service.setup_result_encoding(json.dumps(data))
+
+        out = service.init()
+        self.is_empty_output(out)
+
+        out = service.submit()
+        self.assertIsInstance(out["logs"], bytes)
+        logs = R2EResultEncoder("compact", "zlib").decode(out["logs"])
+        self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+
+        out = service.submit_batch(json.dumps({"candidates": ["def broken(:"]}))
+        logs = R2EResultEncoder("compact", "zlib").decode(out["logs"][0])
+        self.assertIn("SyntaxError", logs["error"])
+
+    def test_submit_fields(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        data = {"generated_tests": {"test_1": test_serialize_default}}
+        data = json.dumps(data)
+        service.setup_test(data)
+
+        out = service.init()
+        self.is_empty_output(out)
+
+        session = service.session
+        assert isinstance(session, R2ESession)
+        program = session.get_program()
+        for num_processes in (0, 2):
+            options = {"fields": ["tests"], "num_processes": num_processes}
+            with mock.patch.object(
+                program, "startCoverage", side_effect=AssertionError
+            ), mock.patch.object(
+                program, "instrumentCode", side_effect=AssertionError
+            ):
+                out = service.submit(json.dumps(options))
+
+            logs = json.loads(out["logs"])
+            self.assertEqual(list(logs), ["run_tests_logs"])
+            self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+
+        out = service.submit(json.dumps({"fields": ["tests", "coverage"]}))
+        logs = json.loads(out["logs"])
+        self.assertEqual(list(logs), ["run_tests_logs", "coverage_logs"])
+        self.check_coverage_exists(logs["coverage_logs"])
+
+        out = service.submit(json.dumps({"fields": ["stats"]}))
+        self.assertIn("Unknown result fields", out["error"])
+
+    def test_submit_streaming(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        generated_tests = {
+            "test_1": test_serialize_default,
+            "test_2": (
+                "import unittest\nclass TestFail(unittest.TestCase):\n"
+                "    def test_fail(self):\n        self.fail('no')\n"
+            ),
+        }
+        service.setup_test(json.dumps({"generated_tests": generated_tests}))
+        out = service.init()
+        self.is_empty_output(out)
+
+        for num_processes in (0, 2):
+            events = []
+            options = {"num_processes": num_processes, "fields": ["tests"]}
+            out = service.submit(json.dumps(options), events.append)
+            logs = json.loads(out["logs"])
+
+            events.sort(key=lambda event: (event["test_id"], event["name"]))
+            self.assertEqual(
+                [(event["test_id"], event["outcome"]) for event in events],
+                [("test_1", "passed")] * 4 + [("test_2", "failed")],
+            )
+            self.assertEqual(
+                [event["name"] for event in events[:4]],
+                logs["run_tests_logs"]["test_1"]["passed_names"],
+            )
+            self.assertIsNone(events[0]["error"])
+            self.assertEqual(events[4]["error"]["type"], "FAIL")
+            self.assertIn("no", events[4]["error"]["message"])
+            self.assertGreaterEqual(events[4]["duration"], 0)
+
+    def test_incremental_submit(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        data = {"generated_tests": {"test_1": test_serialize_default}}
+        service.setup_test(json.dumps(data))
+        out = service.init()
+        self.is_empty_output(out)
+
+        options = json.dumps({"incremental": True, "fields": ["tests"]})
+        events = []
+        logs1 = json.loads(service.submit(options, events.append)["logs"])
+        self.assertEqual(len(events), 4)
+
+        # no change, no test is rerun
+        events = []
+        logs2 = json.loads(service.submit(options, events.append)["logs"])
+        self.assertEqual(events, [])
+        self.assertEqual(logs1, logs2)
+
+        service.execute(gpt4_codegen1)
+        logs3 = json.loads(service.submit(options, events.append)["logs"])
+        self.assertEqual(len(events), 4)
+        self.assertFalse(logs3["run_tests_logs"]["test_1"]["valid"])
+
+        options = json.dumps({"incremental": True, "num_processes": 2})
+        self.assertIn("processes", service.submit(options)["error"])
+
+    def test_repeated_submit_and_reset(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        data = {"generated_tests": {"test_1": test_serialize_default}}
+        data = json.dumps(data)
+        service.setup_test(data)
+
+        out = service.init()
+        self.is_empty_output(out)
+
+        logs1 = json.loads(service.submit()["logs"])
+        logs2 = json.loads(service.submit()["logs"])
+        self.assertEqual(logs1["run_tests_logs"], logs2["run_tests_logs"])
+        self.assertEqual(logs1["coverage_logs"], logs2["coverage_logs"])
+
+        # the instrumentation does not outlive the submit
+        out = service.execute("print(hasattr(Serializers.serialize_default, '__wrapped__'))")
+        self.assertEqual(out["output"], "False")
+
+        out = service.execute("Serializers = None")
+        self.is_empty_output(out)
+        out = service.reset()
+        self.is_empty_output(out)
+        out = service.execute("print(Serializers.__name__)")
+        self.assertEqual(out["output"], "Serializers")
+
+        # a FUT that mutates a global sees it as it was on every submit
+        out = service.execute(
+            "SEEN = []\n"
+            "serialize = Serializers.serialize_default\n"
+            "class Serializers:\n"
+            "    @staticmethod\n"
+            "    def serialize_default(obj):\n"
+            "        SEEN.append(obj)\n"
+            "        return serialize(obj) if len(SEEN) == 1 else None\n"
+        )
+        self.is_empty_output(out)
+        logs1 = json.loads(service.submit()["logs"])["run_tests_logs"]
+        logs2 = json.loads(service.submit()["logs"])["run_tests_logs"]
+        self.assertEqual(logs1, logs2)
+        self.assertFalse(logs1["test_1"]["valid"])
+        out = service.execute("print(SEEN)")
+        self.assertEqual(out["output"], "[]")
+
+    def test_submit_in_processes(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        generated_tests = {
+            "test_1": test_serialize_default,
+            "test_2": test_serialize_default.replace("2023", "2024"),
+        }
+        data = {"generated_tests": generated_tests}
+        service.setup_test(json.dumps(data))
+        out = service.init()
+        self.is_empty_output(out)
+
+        serial_logs = json.loads(service.submit()["logs"])
+
+        # a test that kills its process
+        generated_tests["test_3"] = (
+            "import os\nclass TestExit(unittest.TestCase):\n"
+            "    def test_exit(self):\n        os._exit(3)\n"
+        )
+        data = {"generated_tests": generated_tests}
+        service.setup_test(json.dumps(data))
+        out = service.init()
+        self.is_empty_output(out)
+
+        out = service.submit(json.dumps({"num_processes": 2}))
+        self.assertEqual(out["output"], "")
+        logs = json.loads(out["logs"])
+
+        self.assertEqual(list(logs["run_tests_logs"]), ["test_1", "test_2", "test_3"])
+        self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+        self.assertTrue(logs["run_tests_logs"]["test_2"]["valid"])
+        self.assertFalse(logs["run_tests_logs"]["test_3"]["valid"])
+        self.assertIn("exited with code 3", logs["run_tests_errors"]["test_3"][0]["message"])
+
+        # coverage and captured arguments come back from the processes
+        self.assertEqual(logs["coverage_logs"], serial_logs["coverage_logs"])
+        self.assertEqual(
+            len(logs["captured_arg_logs"]), len(serial_logs["captured_arg_logs"])
+        )
+
+    def test_submit_with_timeouts(self):
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        generated_tests = {
+            "test_1": test_serialize_default,
+            # interrupted by the test timeout
+            "test_2": (
+                "class TestLoop(unittest.TestCase):\n"
+                "    def test_fast(self):\n        pass\n"
+                "    def test_loop(self):\n        while True:\n            pass\n"
+            ),
+            # ignores the timeout, its process is killed
+            "test_3": (
+                "import time\nclass TestStuck(unittest.TestCase):\n"
+                "    def test_a_fast(self):\n        pass\n"
+                "    def test_stuck(self):\n        while True:\n"
+                "            try:\n                time.sleep(10)\n"
+                "            except BaseException:\n                pass\n"
+                "    def test_z_never_run(self):\n        pass\n"
+            ),
+        }
+        data = {"generated_tests": generated_tests}
+        service.setup_test(json.dumps(data))
+        out = service.init()
+        self.is_empty_output(out)
+
+        out = service.submit(json.dumps({"test_timeout": 0.5}))
+        logs = json.loads(out["logs"])
+        run_tests_logs = logs["run_tests_logs"]
+
+        self.assertTrue(run_tests_logs["test_1"]["valid"])
+
+        self.assertFalse(run_tests_logs["test_2"]["valid"])
+        self.assertEqual(run_tests_logs["test_2"]["passed_names"], ["test_fast"])
+        self.assertEqual(run_tests_logs["test_2"]["timeout_names"], ["test_loop"])
+        self.assertEqual(logs["run_tests_errors"]["test_2"][0]["type"], "TIMEOUT")
+
+        self.assertEqual(run_tests_logs["test_3"]["passed_names"], ["test_a_fast"])
+        self.assertEqual(
+            run_tests_logs["test_3"]["timeout_names"], ["test_stuck", "test_z_never_run"]
+        )
+        self.assertEqual(run_tests_logs["test_3"]["errored_count"], 0)
+
+        self.check_coverage_exists(logs["coverage_logs"])
+
+    def test_submit_fail_fast(self):
+        import time
+
+        service = R2EService()
+        data = {"repo_id": None, "repo_path": ""}
+        data = json.dumps(data)
+        service.setup_repo(data)
+
+        data = {
+            "funclass_names": ["Serializers.serialize_default"],
+            "file_path": "r2e_test_server/instrument/arguments.py",
+        }
+        data = json.dumps(data)
+        service.setup_function(data)
+
+        generated_tests = {
+            "test_1": (
+                "import time, unittest\nclass TestFail(unittest.TestCase):\n"
+                "    def test_a_fail(self):\n        time.sleep(0.5)\n"
+                "        self.fail()\n"
+                "    def test_b_pass(self):\n        pass\n"
+            ),
+            # stopped while running its slow test
+            "test_2": (
+                "import time, unittest\nclass TestSlow(unittest.TestCase):\n"
+                "    def test_a_fast(self):\n        pass\n"
+                "    def test_b_slow(self):\n        time.sleep(10)\n"
+                "    def test_c_pass(self):\n        pass\n"
+            ),
+            # never started
+            "test_3": test_serialize_default,
+        }
+        data = {"generated_tests": generated_tests}
+        service.setup_test(json.dumps(data))
+        out = service.init()
+        self.is_empty_output(out)
+
+        start = time.monotonic()
+        options = {"fail_fast": True, "num_processes": 2}
+        logs = json.loads(service.submit(json.dumps(options))["logs"])
+        self.assertLess(time.monotonic() - start, 5)
+        run_tests_logs = logs["run_tests_logs"]
+
+        self.assertFalse(run_tests_logs["test_1"]["valid"])
+        self.assertEqual(run_tests_logs["test_1"]["failed_names"], ["test_a_fail"])
+        self.assertEqual(run_tests_logs["test_1"]["not_run_names"], ["test_b_pass"])
+
+        self.assertEqual(run_tests_logs["test_2"]["passed_names"], ["test_a_fast"])
+        self.assertEqual(
+            run_tests_logs["test_2"]["not_run_names"], ["test_b_slow", "test_c_pass"]
+        )
+        self.assertEqual(logs["run_tests_errors"]["test_2"], [])
+
+        self.assertFalse(run_tests_logs["test_3"]["valid"])
+        self.assertEqual(run_tests_logs["test_3"]["not_run_count"], 4)
+
+        # serial run
+        del generated_tests["test_2"]
+        service.setup_test(json.dumps({"generated_tests": generated_tests}))
+        out = service.init()
+        self.is_empty_output(out)
+
+        logs = json.loads(service.submit(json.dumps({"fail_fast": True}))["logs"])
+        run_tests_logs = logs["run_tests_logs"]
+        self.assertEqual(run_tests_logs["test_1"]["failed_names"], ["test_a_fail"])
+        self.assertEqual(run_tests_logs["test_1"]["not_run_names"], ["test_b_pass"])
+        self.assertEqual(run_tests_logs["test_3"]["not_run_count"], 4)
+
+
+class TestR2ESessions(unittest.TestCase):
+
+    def test_concurrent_sessions(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run_session(candidate):
+            service = R2EService()
+            service.setup_repo(json.dumps({"repo_id": None, "repo_path": ""}))
+            data = {
+                "funclass_names": ["Serializers.serialize_default"],
+                "file_path": "r2e_test_server/instrument/arguments.py",
+            }
+            service.setup_function(json.dumps(data))
+            data = {"generated_tests": {"test_1": test_serialize_default}}
+            service.setup_test(json.dumps(data))
+            service.setup_codegen_mode()
+            init_out = service.init()
+            service.execute(candidate)
+            out = service.submit()
+            service.session.close()
+            return init_out, out
+
+        # the session is opened on first use
+        self.assertIsNone(R2EService()._session)
+
+        candidates = [gpt4_codegen1, gpt4_codegen2] * 4
+        with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+            outs = list(executor.map(run_session, candidates))
+
+        for candidate, (init_out, out) in zip(candidates, outs):
+            self.assertEqual(init_out["error"], "")
+            logs = json.loads(out["logs"])
+            self.assertEqual(
+                logs["run_tests_logs"]["test_1"]["valid"], candidate is gpt4_codegen2
+            )
+            self.assertTrue(logs["coverage_logs"])
+
+    def test_session_per_connection(self):
+        import time
+        from threading import Thread
+
+        import rpyc
+        from rpyc.utils.server import ThreadPoolServer
+
+        server = ThreadPoolServer(R2EService, port=0)
+        server_thread = Thread(target=server.start)
+        server_thread.start()
+        while not server.active:
+            time.sleep(0.01)
+
+        try:
+            conn1 = rpyc.connect("localhost", server.port)
+            conn2 = rpyc.connect("localhost", server.port)
+
+            data = {"repo_id": None, "repo_path": ""}
+            conn1.root.setup_repo(json.dumps(data))
+
+            # the second client has not set up a repo
+            out = conn2.root.submit()
+            self.assertIn("not initialized", out["error"])
+
+            conn1.close()
+            conn2.close()
+        finally:
+            server.close()
+            server_thread.join()
+
+    def test_submit_async(self):
+        import time
+        from queue import Queue
+        from threading import Thread
+
+        import rpyc
+        from rpyc.utils.server import ThreadPoolServer
+
+        server = ThreadPoolServer(R2EService, port=0)
+        server_thread = Thread(target=server.start)
+        server_thread.start()
+        while not server.active:
+            time.sleep(0.01)
+
+        try:
+            conn = rpyc.connect("localhost", server.port)
+            # serve the callbacks of the server
+            bg_thread = rpyc.BgServingThread(conn)
+
+            conn.root.setup_repo(json.dumps({"repo_id": None, "repo_path": ""}))
+            data = {
+                "funclass_names": ["Serializers.serialize_default"],
+                "file_path": "r2e_test_server/instrument/arguments.py",
+            }
+            conn.root.setup_function(json.dumps(data))
+            data = {"generated_tests": {"test_1": test_serialize_default}}
+            conn.root.setup_test(json.dumps(data))
+            out = conn.root.init()
+            self.assertEqual(out["error"], "")
+
+            job_id = conn.root.submit_async()
+            out = conn.root.wait(job_id, 60)
+            self.assertEqual(out["status"], "done")
+            logs = json.loads(out["result"]["logs"])
+            self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+
+            # handed out once
+            self.assertEqual(conn.root.poll(job_id)["status"], "unknown")
+
+            callback_results = Queue()
+            job_ids = [
+                conn.root.submit_async(
+                    None, lambda *args: callback_results.put(args)
+                )
+                for _ in range(2)
+            ]
+            for _ in job_ids:
+                job_id, result = callback_results.get(timeout=60)
+                self.assertIn(job_id, job_ids)
+                logs = json.loads(result["logs"])
+                self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+
+            # streamed before the result
+            events = []
+            out = conn.root.submit(None, events.append)
+            self.assertIn("logs", out)
+            self.assertEqual([event["outcome"] for event in events], ["passed"] * 4)
+
+            bg_thread.stop()
+            conn.close()
+        finally:
+            server.close()
+            server_thread.join()
+
+
+class TestR2EWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        from r2e_test_server.workers import R2EWorkerPool
+
+        self.pool = R2EWorkerPool(num_workers=2)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def setup_session(self, session):
+        session.setup_repo(json.dumps({"repo_id": None, "repo_path": ""}))
+        session.setup_function(
+            json.dumps(
+                {
+                    "funclass_names": ["Serializers.serialize_default"],
+                    "file_path": "r2e_test_server/instrument/arguments.py",
+                }
+            )
+        )
+        session.setup_test(
+            json.dumps({"generated_tests": {"test_1": test_serialize_default}})
+        )
+
+    def test_submit_in_worker(self):
+        session = self.pool.open_session()
+        self.setup_session(session)
+
+        out = session.init()
+        self.assertEqual(out["error"], "")
+
+        events = []
+        out = session.submit(None, events.append)
+        logs = json.loads(out["logs"])
+        self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+        self.assertEqual(len(events), 4)
+        self.assertEqual({event["outcome"] for event in events}, {"passed"})
+        session.close()
+
+        # the result cache is off, the stats of both workers are summed
+        self.assertEqual(self.pool.result_cache_stats()["memory_entries"], 0)
+
+    def test_metrics_of_workers(self):
+        from r2e_test_server.metrics import metrics
+
+        metrics.clear()
+        session = self.pool.open_session()
+        self.setup_session(session)
+        session.init()
+        session.submit()
+        session.execute("def broken(:")
+        session.close()
+
+        # observed in the worker, merged in the server
+        rendered = metrics.render()
+        phases = ("import", "refs", "load_tests", "run_tests", "coverage", "serialize")
+        for phase in phases:
+            self.assertIn(
+                f'r2e_phase_duration_seconds_count{{phase="{phase}"}} 1', rendered
+            )
+        self.assertIn('r2e_failures_total{method="execute"} 1', rendered)
+
+    def test_worker_killed(self):
+        session = self.pool.open_session()
+        self.setup_session(session)
+        session.init()
+
+        assert session.worker is not None
+        session.worker.process.kill()
+        session.worker.process.join()
+
+        out = session.submit()
+        self.assertIn("died", out["error"])
+
+        # the session moves to a fresh worker, with its setup replayed
+        out = session.init()
+        self.assertEqual(out["error"], "")
+        out = session.submit()
+        logs = json.loads(out["logs"])
+        self.assertTrue(logs["run_tests_logs"]["test_1"]["valid"])
+        session.close()
+
+    def test_server_fails_to_start(self):
+        import socket
+        import multiprocessing
+        from r2e_test_server import server
+
+        with socket.socket() as sock:
+            sock.bind(("localhost", 0))
+            sock.listen()
+            port = sock.getsockname()[1]
+
+            # the port is taken, the workers are stopped anyway
+            with self.assertRaises(OSError):
+                server.start_server(port, num_workers=1)
+
+        self.assertIsNone(server.worker_pool)
+        workers = {worker.process for worker in self.pool.workers}
+        self.assertEqual(set(multiprocessing.active_children()) - workers, set())
@@ -1,3 +1,4 @@
+import ast
 import unittest
 
 from r2e_test_server.testing.cleaner import R2ETestCleaner
@@ -89,6 +90,51 @@ class TestTimestampConversion(unittest.TestCase):
         self.assertIn("fut_module.timestamp_conversion", cleaned_test_case)
         self.assertEqual(test_case.strip(), cleaned_test_case.strip())
 
+    def test_clean_multiple_names(self):
+        test_case = """
+import unittest
+from fut_module import foo as f, bar as b
+from fut_module import reference_foo, reference_bar as rb
+
+class TestFooBar(unittest.TestCase):
+    def test_foo_bar(self):
+        self.assertEqual(f(b()), reference_foo(rb()))
+        self.assertEqual(your_module.foo(), original_module.reference_foo())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
+"""
+        names = ["foo", "reference_foo", "bar", "reference_bar"]
+        cleaned_tree = R2ETestCleaner.clean_test_tree(test_case, names)
+        cleaned_test_case = ast.unparse(cleaned_tree)
+
+        self.assertNotIn("from fut_module import", cleaned_test_case)
+        self.assertIn("foo(bar()), reference_foo(reference_bar())", cleaned_test_case)
+        self.assertIn("fut_module.foo(), fut_module.reference_foo()", cleaned_test_case)
+        self.assertNotIn("unittest.main", cleaned_test_case)
+
+        # compiles straight from the tree
+        compile(cleaned_tree, "<string>", "exec")
+
+    def test_clean_module_in_strings(self):
+        test_case = """
+import unittest
+from unittest import mock
+from fut_module import foo
+
+class TestFoo(unittest.TestCase):
+    @mock.patch("your_module.helper")
+    def test_foo(self, helper):
+        with mock.patch("original_module.other", return_value=1):
+            self.assertEqual(foo(), "not_your_module.x")
+"""
+        cleaned_test_case = R2ETestCleaner.clean_test_case(
+            test_case, "foo", "reference_foo"
+        )
+        self.assertIn("mock.patch('fut_module.helper')", cleaned_test_case)
+        self.assertIn("mock.patch('fut_module.other'", cleaned_test_case)
+        self.assertIn("'not_your_module.x'", cleaned_test_case)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import importlib.util
+from typing import List, Tuple
+
+import coverage
+
+from r2e_test_server.modules.index import SourceIndex
+from r2e_test_server.testing.codecov import R2ECodeCoverage, R2EFileCoverage
+from r2e_test_server.testing.monitoring import R2EMonitoringCoverage
+
+
+source = """
+def foo(x):
+    if x > 0:
+        return 1
+    return 0
+
+
+def bar(x):
+    if x > 0:
+        return 1
+    return 0
+
+
+def loop(xs):
+    t = 0
+    for x in xs:
+        if x > 0:
+            t += x
+    while t > 10:
+        t -= 10
+        if t == 5:
+            break
+    return t
+"""
+
+
+def get_spans(index: SourceIndex, names: List[str]) -> List[Tuple[int, int]]:
+    spans = []
+    for name in names:
+        span = index.get_span(name)
+        assert span is not None, name
+        spans.append(span)
+    return spans
+
+
+class TestR2ECodeCoverage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "cov_module.py")
+        with open(self.file_path, "w") as f:
+            f.write(source)
+
+        spec = importlib.util.spec_from_file_location("cov_module", self.file_path)
+        self.module = importlib.util.module_from_spec(spec)  # type: ignore
+
+        self.cov = coverage.Coverage(data_file=None, include=[self.file_path], branch=True)
+        self.cov.start()
+        spec.loader.exec_module(self.module)  # type: ignore
+        self.module.foo(1)
+        self.cov.stop()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+        sys.modules.pop("cov_module", None)
+
+    def test_shared_file_coverage(self):
+        file_coverage = R2EFileCoverage(self.cov, self.file_path)
+        index = SourceIndex(source)
+
+        foo_cov, bar_cov = (
+            R2ECodeCoverage(
+                self.cov, self.module, self.file_path, name, index, file_coverage
+            ).report_coverage()
+            for name in ("foo", "bar")
+        )
+
+        self.assertEqual((foo_cov["start_line"], foo_cov["end_line"]), (2, 5))
+        self.assertEqual(foo_cov["num_executable_lines"], 4)
+        self.assertEqual(foo_cov["num_executed_branches"], 1)
+        self.assertEqual(foo_cov["unevaluated_branches"], {3: [5]})
+
+        self.assertEqual((bar_cov["start_line"], bar_cov["end_line"]), (8, 11))
+        self.assertEqual(bar_cov["num_executed_branches"], 0)
+        self.assertEqual(bar_cov["unevaluated_branches"], {9: [10, 11]})
+
+        # same results as analyzing the file for each function
+        self.assertEqual(
+            foo_cov,
+            R2ECodeCoverage(
+                self.cov, self.module, self.file_path, "foo", index
+            ).report_coverage(),
+        )
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "requires python 3.12+")
+    def test_monitoring_backend(self):
+        index = SourceIndex(source)
+        names = ["foo", "bar", "loop"]
+
+        def report(cov):
+            file_coverage = R2EFileCoverage(cov, self.file_path)
+            return [
+                R2ECodeCoverage(
+                    cov, self.module, self.file_path, name, index, file_coverage
+                ).report_coverage()
+                for name in names
+            ]
+
+        for args in ([], [1, 2], [30, -1], [15]):
+            cov = coverage.Coverage(
+                data_file=None, include=[self.file_path], branch=True
+            )
+            cov.start()
+            self.module.foo(-1)
+            self.module.loop(args)
+            cov.stop()
+
+            monitor = R2EMonitoringCoverage(
+                self.file_path, get_spans(index, names)
+            )
+            monitor.start()
+            self.module.foo(-1)
+            self.module.loop(args)
+            monitor.stop()
+
+            self.assertEqual(report(monitor.get_coverage()), report(cov))
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "requires python 3.12+")
+    def test_monitoring_backend_threads(self):
+        index = SourceIndex(source)
+
+        def report(cov):
+            return R2ECodeCoverage(
+                cov, self.module, self.file_path, "loop", index
+            ).report_coverage()
+
+        def run_in_thread():
+            thread = threading.Thread(target=self.module.loop, args=([30, -1],))
+            thread.start()
+            thread.join()
+
+        cov = coverage.Coverage(data_file=None, include=[self.file_path], branch=True)
+        cov.start()
+        run_in_thread()
+        cov.stop()
+
+        monitor = R2EMonitoringCoverage(self.file_path, get_spans(index, ["loop"]))
+        monitor.start()
+        run_in_thread()
+        monitor.stop()
+
+        # the code run by other threads is measured, as by coverage.py
+        self.assertEqual(report(monitor.get_coverage()), report(cov))
+        self.assertEqual(report(cov)["num_unexecuted_lines"], 1)  # the break
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import types
+import threading
+import unittest
+
+from r2e_test_server.testing.impact import R2ETestImpact
+from r2e_test_server.testing.runner import R2ETestRunner
+
+
+source = """
+def foo(x):
+    return x + 1
+
+
+def helper(x):
+    return x
+
+
+def bar(x):
+    return helper(x) * 2
+
+
+class Box:
+    def get(self):
+        return 1
+"""
+
+module = types.ModuleType("impact_module")
+
+
+def make_test_classes():
+    # not at module level, so that they are not collected themselves
+    class TestFoo(unittest.TestCase):
+        def test_foo(self):
+            self.assertEqual(module.foo(1), 2)
+
+    class TestBar(unittest.TestCase):
+        def test_bar(self):
+            self.assertEqual(module.bar(1), 2)
+
+        def test_box(self):
+            self.assertEqual(module.Box().get(), 1)
+
+    return {"test_1": TestFoo, "test_2": TestBar}
+
+
+class TestR2ETestImpact(unittest.TestCase):
+
+    def setUp(self):
+        module.__dict__.clear()
+        module.__dict__["__name__"] = "impact_module"
+        exec(source, module.__dict__)
+        self.impact = R2ETestImpact()
+
+    def run_tests(self):
+        """Run the suites, returns the names of the tests that ran and the stats."""
+        self.impact.update(module)
+
+        ran, stats = [], {}
+
+        def on_event(event):
+            if event["event"] == "outcome":
+                ran.append(event["name"])
+
+        for test_idx, test_class in make_test_classes().items():
+            suite = unittest.defaultTestLoader.loadTestsFromTestCase(test_class)
+            runner = R2ETestRunner(on_event=on_event)
+            _, _, stats[test_idx] = self.impact.run(test_idx, suite, runner)
+        return sorted(ran), stats
+
+    def test_rerun_affected_tests(self):
+        ran, stats = self.run_tests()
+        self.assertEqual(ran, ["test_bar", "test_box", "test_foo"])
+        self.assertTrue(stats["test_1"]["valid"] and stats["test_2"]["valid"])
+
+        # nothing changed, the outcomes are reused
+        ran, reused_stats = self.run_tests()
+        self.assertEqual(ran, [])
+        self.assertEqual(reused_stats, stats)
+
+        # the same definition is no change
+        exec("def foo(x):\n    return x + 1\n", module.__dict__)
+        self.assertEqual(self.run_tests()[0], [])
+
+        # functions called indirectly are in the footprint
+        exec("def helper(x):\n    return x + 0\n", module.__dict__)
+        self.assertEqual(self.run_tests()[0], ["test_bar"])
+
+        exec("class Box:\n    def get(self):\n        return 2\n", module.__dict__)
+        ran, stats = self.run_tests()
+        self.assertEqual(ran, ["test_box"])
+        self.assertEqual(stats["test_2"]["failed_names"], ["test_box"])
+        self.assertEqual(stats["test_2"]["passed_names"], ["test_bar"])
+
+        # failing tests are always rerun
+        self.assertEqual(self.run_tests()[0], ["test_box"])
+
+    def test_rerun_all_on_other_changes(self):
+        self.run_tests()
+
+        setattr(module, "LIMIT", 10)
+        self.assertEqual(self.run_tests()[0], ["test_bar", "test_box", "test_foo"])
+        self.assertEqual(self.run_tests()[0], [])
+
+        # containers are compared by content
+        setattr(module, "CONFIG", {"x": [1]})
+        self.run_tests()
+        module.CONFIG["x"].append(2)
+        self.assertEqual(self.run_tests()[0], ["test_bar", "test_box", "test_foo"])
+        self.assertEqual(self.run_tests()[0], [])
+
+        # values that cannot be fingerprinted always count as changed
+        setattr(module, "LOCK", threading.Lock())
+        self.run_tests()
+        self.assertEqual(self.run_tests()[0], ["test_bar", "test_box", "test_foo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from r2e_test_server.testing.loader import R2ETestLoader
+
+
+test_case = """
+import unittest
+from fut_module import foo, reference_foo
+
+class TestFoo(unittest.TestCase):
+    def test_foo(self):
+        self.assertEqual(foo(), reference_foo())
+"""
+
+
+class TestR2ETestLoader(unittest.TestCase):
+
+    def test_compiled_test_cache(self):
+        R2ETestLoader.compile_test.cache_clear()
+
+        code1 = R2ETestLoader.compile_test(test_case, ("foo",))
+        code2 = R2ETestLoader.compile_test(test_case, ("foo",))
+        self.assertIs(code1, code2)
+        self.assertEqual(R2ETestLoader.compile_test.cache_info().hits, 1)
+
+        # a different set of funclass names is a different entry
+        R2ETestLoader.compile_test(test_case, ("foo", "bar"))
+        self.assertEqual(R2ETestLoader.compile_test.cache_info().misses, 2)
+
+    def test_load_test(self):
+        nspace = {"foo": lambda: 1, "reference_foo": lambda: 1}
+        suites, _ = R2ETestLoader.load_tests({"test_1": test_case}, ["foo"], nspace)
+        self.assertEqual(suites["test_1"].countTestCases(), 1)
+
+        # the test classes are not left in the namespace
+        self.assertNotIn("TestFoo", nspace)
+
+
+if __name__ == "__main__":
+    unittest.main()